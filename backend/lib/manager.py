@@ -2,18 +2,24 @@
 The heart of the app - manages jobs and workers
 """
 import threading
+import psycopg2
+import select
 import signal
 import time
+import os
 
 from collections.abc import Generator
 
 from backend.lib.proxied_requests import DelegatedRequestHandler
+from backend.lib.scheduler import JobScheduler
 from backend.lib.worker import BasicWorker
+from common.lib.database import Database
 from common.lib.exceptions import JobClaimedException
+from common.lib.job import Job
 
-# for now, this is hardcoded - could be dynamic or depending on the queue ID in
-# the future
-MAX_JOBS_PER_QUEUE = 1
+# the queue is checked when notified of new jobs, but also at least this
+# often (in seconds), in case a notification was missed
+JOB_SCAN_INTERVAL = 10
 
 class WorkerManager:
 	"""
@@ -24,6 +30,7 @@ class WorkerManager:
 	log = None
 	modules = None
 	proxy_delegator = None
+	scheduler = None
 
 	worker_pool = {}
 	job_mapping = {}
@@ -31,6 +38,9 @@ class WorkerManager:
 	looping = True
 	unknown_jobs = set()
 
+	listener = None
+	wakeup_pipe = None
+
 	def __init__(self, queue, database, logger, modules, as_daemon=True):
 		"""
 		Initialize manager
@@ -46,6 +56,12 @@ class WorkerManager:
 		self.log = logger
 		self.modules = modules
 		self.proxy_delegator = DelegatedRequestHandler(self.log, self.modules.config)
+		self.scheduler = JobScheduler(self.db, self.modules)
+
+		# workers write to this pipe when they finish, to wake up the manager
+		self.wakeup_pipe = os.pipe()
+		os.set_blocking(self.wakeup_pipe[1], False)
+		self.listen_for_jobs()
 
 		if as_daemon:
 			signal.signal(signal.SIGTERM, self.abort)
@@ -55,8 +71,10 @@ class WorkerManager:
 		self.validate_datasources()
 
 		# queue jobs for workers that always need one
-		for worker_name, worker in self.modules.workers.items():
-			if hasattr(worker, "ensure_job"):
+		# checked via the module metadata, so only these workers are imported
+		for worker_name in self.modules.workers:
+			if self.modules.get_metadata(worker_name).get("has_ensure_job"):
+				worker = self.modules.workers[worker_name]
 				# ensure_job is a class method that returns a dict with job parameters if job should be added
 				# pass config for some workers (e.g., web studies extensions)
 				try:
@@ -87,7 +105,8 @@ class WorkerManager:
 		Delegate work
 
 		Checks for open jobs, and then passes those to dedicated workers, if
-		slots are available for those workers.
+		slots are available for those workers. The scheduler determines the
+		order in which jobs are considered and whether slots are available.
 		"""
 		jobs = self.queue.get_all_jobs()
 
@@ -108,7 +127,8 @@ class WorkerManager:
 			del all_workers
 
 		# check if workers are available for unclaimed jobs
-		for job in jobs:
+		active_workers = [worker for queue_id, worker in self.iterate_active_workers()]
+		for job in self.scheduler.order(jobs, active_workers):
 			queue_id = job.data["queue_id"]
 			jobtype = job.data["jobtype"]
 
@@ -119,7 +139,7 @@ class WorkerManager:
 
 				# if a job is of a known type, and that job type has open
 				# worker slots, start a new worker to run it
-				if len(self.worker_pool[queue_id]) < MAX_JOBS_PER_QUEUE:
+				if self.scheduler.can_start(job, worker_class, active_workers):
 					try:
 						job.claim()
 						worker = worker_class(logger=self.log, manager=self, job=job, modules=self.modules)
@@ -127,6 +147,7 @@ class WorkerManager:
 						log_level = self.log.levels["DEBUG"] if job.data["interval"] else self.log.levels["INFO"]
 						self.log.log(f"Starting new worker for job {job.data['jobtype']}/{job.data['remote_id']}", log_level)
 						self.worker_pool[queue_id].append(worker)
+						active_workers.append(worker)
 					except JobClaimedException:
 						# it's fine
 						pass
@@ -135,7 +156,70 @@ class WorkerManager:
 					self.log.error(f"Unknown job type: {jobtype}")
 					self.unknown_jobs.add(jobtype)
 
-		time.sleep(1)
+		self.wait_for_jobs()
+
+	def listen_for_jobs(self):
+		"""
+		Start listening for job notifications
+
+		Uses a separate database connection, since the manager's own
+		connection is also used from other threads (e.g. the API). If no
+		connection can be made, the manager falls back to checking the queue
+		every second.
+		"""
+		config = self.modules.config
+		try:
+			self.listener = Database(logger=self.log, appname="job-listener", dbname=config.DB_NAME,
+									 user=config.DB_USER, password=config.DB_PASSWORD, host=config.DB_HOST,
+									 port=config.DB_PORT)
+			self.listener.listen(Job.NOTIFY_CHANNEL)
+		except psycopg2.Error as e:
+			self.log.warning(f"Could not listen for job notifications, polling job queue instead ({e})")
+			self.listener = None
+
+	def wait_for_jobs(self):
+		"""
+		Wait until there may be jobs to start
+
+		Returns when a job is added to or released into the queue, when a
+		worker finishes (freeing up a slot in its queue), or when a job that
+		was queued to run later becomes claimable - whichever comes first.
+		The queue is also checked at least every `JOB_SCAN_INTERVAL` seconds.
+		"""
+		if not self.listener:
+			time.sleep(1)
+			return
+
+		timeout = JOB_SCAN_INTERVAL
+		next_claimable = self.queue.get_next_claimable_time()
+		if next_claimable is not None:
+			# claimable once the current time is *past* the claim time
+			timeout = max(0, min(timeout, next_claimable + 1 - time.time()))
+
+		readable, _, _ = select.select([self.listener.connection, self.wakeup_pipe[0]], [], [], timeout)
+
+		if self.wakeup_pipe[0] in readable:
+			os.read(self.wakeup_pipe[0], 1024)
+
+		if self.listener.connection in readable:
+			try:
+				self.listener.get_notifications()
+			except psycopg2.Error as e:
+				self.log.warning(f"Lost connection for job notifications, polling job queue instead ({e})")
+				self.listener = None
+
+	def wake(self):
+		"""
+		Wake up the manager if it is waiting for jobs
+
+		Can be called from any thread, e.g. by a worker that has finished, or
+		from a signal handler.
+		"""
+		try:
+			os.write(self.wakeup_pipe[1], b"\0")
+		except (BlockingIOError, TypeError):
+			# pipe full, so the manager will wake up anyway; or no pipe yet
+			pass
 
 	def loop(self):
 		"""
@@ -221,6 +305,7 @@ class WorkerManager:
 
 		# now stop looping (i.e. accepting new jobs)
 		self.looping = False
+		self.wake()
 
 	def request_interrupt(self, interrupt_level, job):
 		"""
@@ -1,9 +1,12 @@
 """
 Basic post-processor worker - should be inherited by workers to post-process results
 """
+import multiprocessing
 import traceback
 import inspect as py_inspect
+import threading
 import zipfile
+import pickle
 import typing
 import shutil
 import copy
@@ -21,7 +24,8 @@ from common.lib.compatibility import Compatibility
 from common.lib.fourcat_module import FourcatModule
 from common.lib.helpers import get_software_commit, remove_nuls, send_email, hash_to_md5
 from common.lib.exceptions import (WorkerInterruptedException, ProcessorInterruptedException, ProcessorException,
-                                   DataSetException, MapItemException, AnnotationException)
+                                   DataSetException, DataSetNotFoundException, MapItemException,
+                                   AnnotationException)
 from common.config_manager import ConfigWrapper
 from common.lib.user import User
 
@@ -114,6 +118,15 @@ class BasicProcessor(FourcatModule, BasicWorker, metaclass=abc.ABCMeta):
     #: evaluated from it.
     compatibility = None
 
+    #: Run `process()` in a forked child process rather than in the worker's
+    #: thread. This lets CPU-bound processors use their own core instead of
+    #: competing for the interpreter lock with every other running worker.
+    #: Status and progress updates are written to the database as usual, and
+    #: interrupts are forwarded to the child. Processors using proxied
+    #: requests should not set this, since those are handled by threads in
+    #: the parent process.
+    run_in_process = False
+
     def work(self):
         """
         Process a dataset
@@ -176,7 +189,7 @@ class BasicProcessor(FourcatModule, BasicWorker, metaclass=abc.ABCMeta):
                 return
 
             self.source_file = self.source_dataset.get_results_path()
-            if not self.source_file.exists():
+            if not self.source_file.exists() and not self.source_dataset.is_view():
                 self.dataset.update_status("Finished, no input data found.")
 
         self.log.info("Running processor %s on dataset %s" % (self.type, self.job.data["remote_id"]))
@@ -220,9 +233,12 @@ class BasicProcessor(FourcatModule, BasicWorker, metaclass=abc.ABCMeta):
 
         if not self.dataset.is_finished():
             try:
-                self.process()
-                self.after_process()
-                
+                if self.run_in_process:
+                    self.process_in_child()
+                else:
+                    self.process()
+                    self.after_process()
+
                 # processors should usually finish their jobs by themselves, but if
                 # the worker finished without errors, the job can be finished in
                 # any case
@@ -235,7 +251,9 @@ class BasicProcessor(FourcatModule, BasicWorker, metaclass=abc.ABCMeta):
             except Exception as e:
                 self.dataset.log("Processor crashed: %s" % str(e))
                 self.dataset.update_status("Processor error, trying again later", status_type=StatusType.QUEUED)
-                stack = traceback.extract_tb(e.__traceback__)
+                # if the processor ran in a child process, the traceback of
+                # interest is the one from that process
+                stack = getattr(e, "child_stack", None) or traceback.extract_tb(e.__traceback__)
                 frames = [frame.filename.split("/").pop() + ":" + str(frame.lineno) for frame in stack[1:]]
                 location = "->".join(frames)
 
@@ -252,18 +270,142 @@ class BasicProcessor(FourcatModule, BasicWorker, metaclass=abc.ABCMeta):
                     self.type, e.__class__.__name__, self.dataset.key, parent_key, location, str(e)), frame=stack)
 
             finally:
-                # clean up files that have been created and marked as disposable
-                for item in self.for_cleanup:
-                    if type(item) is DataSet:
-                        item.remove_disposable_files()
-                    elif item.exists():
-                        shutil.rmtree(item, ignore_errors=True)
+                self.remove_disposable_files()
         else:
             # dataset already finished, job shouldn't be open anymore
             self.log.warning("Job %s/%s was queued for a dataset already marked as finished, deleting..." % (
             self.job.data["jobtype"], self.job.data["remote_id"]))
             self.job.finish()
 
+    def remove_disposable_files(self):
+        """
+        Clean up files that have been created and marked as disposable
+
+        Paths in `self.for_cleanup` are deleted; for datasets in it, their
+        `remove_disposable_files()` method is called.
+        """
+        for item in self.for_cleanup:
+            if type(item) is DataSet:
+                item.remove_disposable_files()
+            elif item.exists():
+                shutil.rmtree(item, ignore_errors=True)
+
+    def process_in_child(self):
+        """
+        Run `process()` and `after_process()` in a child process
+
+        Used instead of calling these directly when `run_in_process` is set.
+        The child is forked from the worker thread, so it has the same state
+        as the processor; it opens its own database connection and otherwise
+        does exactly what the worker thread would do. Meanwhile, this thread
+        forwards interrupt requests to the child, and waits for it to report
+        back. Afterwards, the job's status is copied from the child, and any
+        exception raised in the child is raised again here, so the job is
+        claimed, released and finished as it would be without a child process,
+        and the dataset is reloaded, since it was updated in the child.
+        """
+        context = multiprocessing.get_context("fork")
+        interrupt_receiver, interrupt_sender = context.Pipe(duplex=False)
+        result_receiver, result_sender = context.Pipe(duplex=False)
+
+        child = context.Process(target=self.work_in_child, args=(interrupt_receiver, result_sender),
+                                name=f"{self.type}-{self.job.data['id']}")
+        child.start()
+        interrupt_receiver.close()
+        result_sender.close()
+
+        self.log.debug(f"Processor {self.type} running in child process {child.pid} for dataset {self.dataset.key}")
+        forwarded_interrupt = self.INTERRUPT_NONE
+        result = None
+        while True:
+            if self.interrupted != forwarded_interrupt:
+                interrupt_sender.send(self.interrupted)
+                forwarded_interrupt = self.interrupted
+
+            # poll() is also true when the child has exited without reporting
+            if result_receiver.poll(0.25):
+                try:
+                    result = result_receiver.recv()
+                except EOFError:
+                    pass
+                break
+
+        child.join()
+        interrupt_sender.close()
+        result_receiver.close()
+
+        # the child updated the dataset's status, number of rows, et cetera
+        # in the database, not in this process's copy of it
+        try:
+            self.dataset.refresh()
+        except DataSetNotFoundException:
+            # deleted by the processor
+            pass
+
+        if not result:
+            raise ProcessorException(f"Child process for processor {self.type} ended unexpectedly "
+                                     f"(exit code {child.exitcode})")
+
+        self.job.data = result["job"]
+        self.job.is_finished = result["job_status"]["is_finished"]
+        self.job.is_claimed = result["job_status"]["is_claimed"]
+        self.job.is_parked = result["job_status"]["is_parked"]
+
+        if result["exception"]:
+            exception = result["exception"]
+            exception.child_stack = result["stack"]
+            raise exception
+
+    def work_in_child(self, interrupt_receiver, result_sender):
+        """
+        Process the dataset in a child process
+
+        Counterpart to `process_in_child()`, which starts this in a forked
+        child process. Anything raised while processing is sent back to the
+        parent instead of handled here.
+
+        :param interrupt_receiver:  Connection through which interrupt
+          requests are received
+        :param result_sender:  Connection through which the result is sent
+        """
+        # the connections inherited from the parent are still in use there
+        self.db.reconnect_after_fork()
+        if self.modules.config.db and self.modules.config.db is not self.db:
+            self.modules.config.db.reconnect_after_fork()
+        self.modules.config.close_memcache()
+
+        def receive_interrupts():
+            try:
+                while True:
+                    self.interrupted = interrupt_receiver.recv()
+            except EOFError:
+                pass
+
+        threading.Thread(target=receive_interrupts, daemon=True).start()
+
+        result = {"exception": None, "stack": None}
+        try:
+            self.process()
+            self.after_process()
+        except Exception as e:
+            result["stack"] = traceback.extract_tb(e.__traceback__)
+            try:
+                result["exception"] = pickle.loads(pickle.dumps(e))
+            except Exception:
+                # not all exceptions can be sent to the parent process
+                result["exception"] = ProcessorException(f"{e.__class__.__name__}: {e}", frame=result["stack"])
+        finally:
+            # files marked for clean-up in the child are unknown to the parent
+            self.remove_disposable_files()
+
+        result["job"] = self.job.data
+        result["job_status"] = {
+            "is_finished": self.job.is_finished,
+            "is_claimed": self.job.is_claimed,
+            "is_parked": self.job.is_parked
+        }
+        result_sender.send(result)
+
     def after_process(self):
         """
         Run after processing the dataset
@@ -278,6 +420,11 @@ class BasicProcessor(FourcatModule, BasicWorker, metaclass=abc.ABCMeta):
         if not self.dataset.is_finished():
             self.dataset.finish()
 
+        # index downloaded media now, rather than when the parent dataset is
+        # first explored
+        if self.dataset.is_media_download():
+            self.dataset.get_media_index()
+
         # see if we have anything else lined up to run next
         for next in self.parameters.get("next", []):
             can_run_next = True
@@ -777,7 +924,11 @@ class BasicProcessor(FourcatModule, BasicWorker, metaclass=abc.ABCMeta):
         # we don't need this file anymore - it has been copied to the new
         # standalone dataset, and this one is not accessible via the interface
         # except as a link to the copied standalone dataset
-        os.unlink(self.dataset.get_results_path())
+        if self.dataset.is_view():
+            os.unlink(self.dataset.get_view_path())
+            self.dataset.delete_parameter("view_of")
+        else:
+            os.unlink(self.dataset.get_results_path())
 
         # Copy the log
         shutil.copy(self.dataset.get_log_path(), standalone.get_log_path())
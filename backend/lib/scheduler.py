@@ -0,0 +1,167 @@
+"""
+Decide which queued jobs to start, and in what order
+"""
+from collections import Counter
+
+from backend.lib.worker import BasicWorker
+from common.lib.helpers import convert_to_int
+
+
+class JobScheduler:
+	"""
+	Job scheduler
+
+	Used by the WorkerManager to determine in which order claimable jobs are
+	considered, and whether a job can be started given the workers that are
+	already running. Jobs are ordered by the priority class of their worker
+	(see `BasicWorker.priority`), then by fair share - so that each user gets
+	to run a job before anyone gets to run their second one - and then by age.
+
+	A job can be started if none of the following limits have been reached:
+
+	- the number of running jobs in the job's queue (`queue.max_jobs_per_queue`)
+	- the number of running jobs of the job's type, if a limit for the type is
+	  configured via `queue.jobtype_limits`; job types that should run in
+	  parallel use separate queue IDs, so otherwise only the queue limit applies
+	- the number of running jobs for the user that created the dataset the job
+	  is for (`queue.max_jobs_per_user`)
+	- the number of running jobs for workers of the job's resource class (see
+	  `BasicWorker.resource_class` and `queue.resource_limits`)
+
+	Jobs that are not for a dataset, e.g. those of scrapers or maintenance
+	workers, do not belong to any user and are not subject to fair share or
+	per-user limits.
+	"""
+	db = None
+	modules = None
+
+	# dataset key -> username of creator, or None for non-dataset jobs
+	owners = {}
+
+	def __init__(self, database, modules):
+		"""
+		Set up scheduler
+
+		:param Database database:  Database handler
+		:param modules:  Modules cache via ModuleLoader()
+		"""
+		self.db = database
+		self.modules = modules
+		self.owners = {}
+
+	def order(self, jobs, active_workers):
+		"""
+		Sort claimable jobs in the order in which they should be started
+
+		Also updates the owner cache for the given and running jobs, which is
+		used by `can_start()`, so call this before that.
+
+		:param list jobs:  Claimable jobs, ordered by age, as returned by
+		`JobQueue.get_all_jobs()`
+		:param list active_workers:  Running workers
+		:return list:  Jobs, in order
+		"""
+		self.update_owners([*jobs, *[worker.job for worker in active_workers]])
+
+		running_per_owner = Counter([self.get_owner(worker.job) for worker in active_workers])
+		queued_per_owner = Counter()
+		sort_keys = {}
+		for job in jobs:
+			owner = self.get_owner(job)
+			worker_class = self.modules.workers.get(job.data["jobtype"])
+			priority = getattr(worker_class, "priority", BasicWorker.PRIORITY_NORMAL)
+
+			if owner is None:
+				share = 0
+			else:
+				# each user's nth job is only started after every other
+				# user's (n - 1)th job, counting jobs that are already running
+				share = running_per_owner[owner] + queued_per_owner[owner]
+				queued_per_owner[owner] += 1
+
+			sort_keys[job.data["id"]] = (priority, share, job.data["timestamp"])
+
+		return sorted(jobs, key=lambda job: sort_keys[job.data["id"]])
+
+	def can_start(self, job, worker_class, active_workers):
+		"""
+		Check if a job can be started
+
+		:param Job job:  Job to check
+		:param worker_class:  Worker class that would run the job
+		:param list active_workers:  Running workers
+		:return bool:  Whether all limits allow starting the job
+		"""
+		owner = self.get_owner(job)
+		resource_class = worker_class.resource_class
+
+		max_per_queue = self.get_limit("queue.max_jobs_per_queue", default=1)
+		max_per_type = self.get_limit("queue.jobtype_limits", job.data["jobtype"])
+		max_per_resource = self.get_limit("queue.resource_limits", resource_class) if resource_class else 0
+		max_per_user = self.get_limit("queue.max_jobs_per_user") if owner is not None else 0
+
+		in_queue = in_type = in_resource = of_user = 0
+		for worker in active_workers:
+			in_queue += worker.job.data["queue_id"] == job.data["queue_id"]
+			in_type += worker.job.data["jobtype"] == job.data["jobtype"]
+			in_resource += bool(resource_class) and worker.resource_class == resource_class
+			of_user += owner is not None and self.get_owner(worker.job) == owner
+
+		return (
+			in_queue < max_per_queue
+			and (not max_per_type or in_type < max_per_type)
+			and (not max_per_resource or in_resource < max_per_resource)
+			and (not max_per_user or of_user < max_per_user)
+		)
+
+	def get_limit(self, setting, key=None, default=0):
+		"""
+		Get a job limit from the configuration
+
+		Limits may have been entered as strings, e.g. in JSON settings edited
+		via the control panel, so values are converted to integers. Values
+		that cannot be converted are ignored, since a misconfigured limit
+		should not stop the scheduler altogether.
+
+		:param str setting:  Setting to read the limit from
+		:param str key:  For settings that map keys to limits, the key to get
+		the limit for
+		:param int default:  Limit to use if none is configured, or if the
+		configured value is not a number. 0 means 'no limit'.
+		:return int:  Limit
+		"""
+		value = self.modules.config.get(setting, default)
+		if key is not None:
+			value = value.get(key, default) if isinstance(value, dict) else default
+
+		return convert_to_int(value, default)
+
+	def get_owner(self, job):
+		"""
+		Get user a job is run for
+
+		:param Job job:  Job
+		:return str|None:  Username of the creator of the job's dataset, or
+		`None` if the job is not for a dataset
+		"""
+		return self.owners.get(job.data["remote_id"])
+
+	def update_owners(self, jobs):
+		"""
+		Look up the users the given jobs are run for
+
+		Owners of jobs not in the given list are forgotten, so the cache does
+		not keep growing.
+
+		:param list jobs:  Jobs to look up the owners of
+		"""
+		remote_ids = {job.data["remote_id"] for job in jobs}
+		owners = {remote_id: self.owners[remote_id] for remote_id in remote_ids if remote_id in self.owners}
+
+		unknown = remote_ids - set(owners)
+		if unknown:
+			owners.update({remote_id: None for remote_id in unknown})
+			for dataset in self.db.fetchall("SELECT key, creator FROM datasets WHERE key IN %s", (tuple(unknown),)):
+				owners[dataset["key"]] = dataset["creator"]
+
+		self.owners = owners
@@ -37,6 +37,12 @@ class Search(BasicProcessor, ABC):
 	#: are easily violated.
 	max_workers = 1
 
+	#: Data collection can take a while, so let other jobs go first
+	priority = BasicProcessor.PRIORITY_BULK
+
+	#: Most search workers spend their time waiting for an API
+	resource_class = BasicProcessor.RESOURCE_NETWORK
+
 	#: This attribute is only used by search workers that collect data from a
 	#: local database, to determine the name of the table to collect the data
 	#: from. If this is `4chan`, for example, items are read from
@@ -33,6 +33,34 @@ class BasicWorker(threading.Thread, metaclass=abc.ABCMeta):
     #: are easily violated.
     max_workers = 1
 
+    #: Priority class for jobs of interactive tasks, e.g. cancelling, that
+    #: someone is waiting for
+    PRIORITY_INTERACTIVE = 0
+
+    #: Priority class for most jobs
+    PRIORITY_NORMAL = 1
+
+    #: Priority class for long-running bulk jobs, e.g. data collection
+    PRIORITY_BULK = 2
+
+    #: Priority class, one of the `PRIORITY_` class constants. Claimable jobs
+    #: of workers with a lower value are started first.
+    priority = PRIORITY_NORMAL
+
+    #: Resource class for workers that mostly use the CPU
+    RESOURCE_CPU = "cpu"
+
+    #: Resource class for workers that mostly wait for the network
+    RESOURCE_NETWORK = "network"
+
+    #: Resource class for workers that run machine learning models
+    RESOURCE_ML = "ml"
+
+    #: Resource class, one of the `RESOURCE_` class constants, or `None` if
+    #: the worker is not limited by any. The amount of workers running per
+    #: resource class can be limited via the `queue.resource_limits` setting.
+    resource_class = None
+
     #: Flag value to indicate worker interruption type - not interrupted
     INTERRUPT_NONE = False
 
@@ -118,7 +146,7 @@ class BasicWorker(threading.Thread, metaclass=abc.ABCMeta):
         try:
             database_appname = "%s-%s" % (self.type, self.job.data["id"])
             self.config = ConfigWrapper(self.modules.config)
-            self.db = Database(logger=self.log, appname=database_appname, dbname=self.config.DB_NAME, user=self.config.DB_USER, password=self.config.DB_PASSWORD, host=self.config.DB_HOST, port=self.config.DB_PORT)
+            self.db = Database(logger=self.log, appname=database_appname, dbname=self.config.DB_NAME, user=self.config.DB_USER, password=self.config.DB_PASSWORD, host=self.config.DB_HOST, port=self.config.DB_PORT, pool_size=self.config.DB_POOL_SIZE, per_thread=False)
             self.queue = JobQueue(logger=self.log, database=self.db) if not self.queue else self.queue
             self.work()
 
@@ -156,6 +184,7 @@ class BasicWorker(threading.Thread, metaclass=abc.ABCMeta):
 
             try:
                 # explicitly close database connection as soon as it's possible
+                # (or return it to the pool, if pooled)
                 self.db.close()
             except Exception as e:
                 try:
@@ -171,6 +200,10 @@ class BasicWorker(threading.Thread, metaclass=abc.ABCMeta):
             except Exception:
                 pass
 
+            # let the manager know a slot has opened up for the next job
+            if hasattr(self.manager, "wake"):
+                self.manager.wake()
+
     def mark_job_after_crash(self):
         """
         Decide what happens to the job after an unhandled crash
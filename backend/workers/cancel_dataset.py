@@ -17,6 +17,7 @@ class DatasetCanceller(BasicWorker):
 	"""
 	type = "cancel-dataset"
 	max_workers = 1
+	priority = BasicWorker.PRIORITY_INTERACTIVE
 
 	def work(self):
 		"""
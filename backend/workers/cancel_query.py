@@ -18,6 +18,7 @@ class QueryCanceller(BasicWorker):
 	"""
 	type = "cancel-pg-query"
 	max_workers = 1
+	priority = BasicWorker.PRIORITY_INTERACTIVE
 
 	def work(self):
 		"""
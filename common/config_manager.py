@@ -158,6 +158,7 @@ class ConfigManager(BaseConfigReader):
             "DB_USER": config_reader["DATABASE"].get("db_user"),
             "DB_NAME": config_reader["DATABASE"].get("db_name"),
             "DB_PASSWORD": config_reader["DATABASE"].get("db_password"),
+            "DB_POOL_SIZE": config_reader["DATABASE"].getint("db_pool_size", fallback=0),
 
             "API_HOST": config_reader["API"].get("api_host"),
             "API_PORT": config_reader["API"].getint("api_port"),
@@ -92,41 +92,13 @@ class Annotation:
         if current:
             # Check if we have to overwrite old data with new data
             if data:
-                for key, value in data.items():
-                    # Save unknown fields in metadata
-                    if key not in current:
-                        current["metadata"][key] = value
-                        new_or_updated = True
-                    # If values differ, update the value
-                    elif current[key] != value:
-                        current[key] = value
-                        new_or_updated = True
+                new_or_updated = self.merge_data(current, data)
 
             self.data = current
 
         # If this is a new annotation, set all the properties.
         else:
-            # Keep track of when the annotation was made
-            created_timestamp = int(time.time())
-
-            new_data = {
-                "dataset": data["dataset"],
-                "item_id": data["item_id"],
-                "field_id": data["field_id"],
-                "timestamp": created_timestamp,
-                "timestamp_created": created_timestamp,
-                "label": data["label"],
-                "type": data.get("type", "text"),
-                "options": data.get("options", ""),
-                "value": data.get("value", ""),
-                "author": data.get("author", ""),
-                "author_original": data.get("author", ""),
-                "by_processor": data.get("by_processor", False),
-                "from_dataset": data.get("from_dataset", ""),
-                "metadata": data.get("metadata", {}),
-            }
-
-            self.data = new_data
+            self.data = self.get_new_data(data)
             new_or_updated = True
 
         if isinstance(self.data["metadata"], str):
@@ -198,20 +170,174 @@ class Annotation:
 
         return data
 
+    @staticmethod
+    def merge_data(current: dict, data: dict) -> bool:
+        """
+        Merge new annotation data into that of an existing annotation
+
+        Values that differ are overwritten; fields that are not annotation
+        properties are stored in the annotation's metadata.
+
+        :param dict current:  Data of the existing annotation, as retrieved
+        from the database. Updated in place.
+        :param dict data:  New annotation data
+        :return bool:  Whether anything changed
+        """
+        changed = False
+        for key, value in data.items():
+            # Save unknown fields in metadata
+            if key not in current:
+                current["metadata"][key] = value
+                changed = True
+            # If values differ, update the value
+            elif current[key] != value:
+                current[key] = value
+                changed = True
+
+        return changed
+
+    @staticmethod
+    def get_new_data(data: dict) -> dict:
+        """
+        Get the data for a new annotation
+
+        :param dict data:  Annotation data, with at least `dataset`,
+        `item_id`, `field_id` and `label`
+        :return dict:  Data for all annotation properties
+        """
+        # Keep track of when the annotation was made
+        created_timestamp = int(time.time())
+
+        return {
+            "dataset": data["dataset"],
+            "item_id": data["item_id"],
+            "field_id": data["field_id"],
+            "timestamp": created_timestamp,
+            "timestamp_created": created_timestamp,
+            "label": data["label"],
+            "type": data.get("type", "text"),
+            "options": data.get("options", ""),
+            "value": data.get("value", ""),
+            "author": data.get("author", ""),
+            "author_original": data.get("author", ""),
+            "by_processor": data.get("by_processor", False),
+            "from_dataset": data.get("from_dataset", ""),
+            "metadata": data.get("metadata", {}),
+        }
+
+    @staticmethod
+    def prepare_for_db(data: dict) -> dict:
+        """
+        Prepare annotation data for writing it to the database
+
+        Sets the timestamp to the current time and serialises the values that
+        are not stored as-is.
+
+        :param dict data:  Annotation data. Updated in place.
+        :return dict:  Annotation data
+        """
+        data["timestamp"] = int(time.time())
+        m = data["metadata"]  # To avoid circular reference error
+        data["metadata"] = json.dumps(m)
+        if data["type"] == "checkbox":
+            data["value"] = ",".join(data["value"])
+
+        return data
+
     def write_to_db(self):
         """
         Write an annotation to the database.
         """
-        db_data = self.data
-
-        db_data["timestamp"] = int(time.time())
-        m = db_data["metadata"]  # To avoid circular reference error
-        db_data["metadata"] = json.dumps(m)
-        if db_data["type"] == "checkbox":
-            db_data["value"] = ",".join(db_data["value"])
+        db_data = self.prepare_for_db(self.data)
 
         return self.db.upsert("annotations", data=db_data, constraints=["field_id", "dataset", "item_id"])
 
+    @staticmethod
+    def save_many(db: Database, annotations: list, batch_size=5000) -> int:
+        """
+        Save many annotations at once
+
+        Does the same as creating an `Annotation` object for each annotation,
+        i.e. new annotations are created, and existing annotations for the
+        same dataset, item and field are updated if anything changed, but
+        with a few queries per batch rather than two queries per annotation.
+        If the same annotation occurs multiple times, the data are merged in
+        order, like they would be when saving them one by one.
+
+        :param db:                  Database object.
+        :param list annotations:    Annotation data, as for `Annotation()`
+        :param int batch_size:      Amount of annotations to save per batch
+
+        :return int: The number of annotations processed.
+        """
+        required_fields = ["field_id", "item_id", "dataset"]
+
+        # values are cast explicitly, since postgres would otherwise infer
+        # column types from the values, which may differ per annotation
+        columns = {"dataset": "text", "item_id": "text", "field_id": "text", "timestamp": "integer",
+                   "timestamp_created": "integer", "label": "text", "type": "text", "options": "text", "value": "text",
+                   "author": "text", "author_original": "text", "by_processor": "boolean", "from_dataset": "text",
+                   "metadata": "text"}
+
+        count = 0
+        for offset in range(0, len(annotations), batch_size):
+            batch = []
+            for data in annotations[offset:offset + batch_size]:
+                if "id" in data:
+                    # annotations with a known ID are handled as before
+                    Annotation(data=data, db=db)
+                    count += 1
+                    continue
+
+                for required_field in required_fields:
+                    if required_field not in data or not data[required_field]:
+                        raise AnnotationException("Annotation() requires a %s field" % required_field)
+
+                # item IDs are stored as text, so compare them as such
+                batch.append({**data, "item_id": str(data["item_id"])})
+
+            # get existing annotations for all items in the batch at once
+            existing = {}
+            for dataset_key in {data["dataset"] for data in batch}:
+                item_ids = list({data["item_id"] for data in batch if data["dataset"] == dataset_key})
+                field_ids = list({data["field_id"] for data in batch if data["dataset"] == dataset_key})
+                for current in db.fetchall("SELECT * FROM annotations WHERE dataset = %s AND item_id = ANY(%s::text[]) "
+                                           "AND field_id = ANY(%s::text[])", (dataset_key, item_ids, field_ids)):
+                    if current["type"] == "checkbox":
+                        current["value"] = current["value"].split(",")
+                    current["metadata"] = json.loads(current["metadata"])
+                    existing[(current["dataset"], current["item_id"], current["field_id"])] = current
+
+            # merge new data into existing data, or create new annotations
+            changed = {}
+            for data in batch:
+                annotation_key = (data["dataset"], data["item_id"], data["field_id"])
+                current = changed.get(annotation_key, existing.get(annotation_key))
+                if current:
+                    if Annotation.merge_data(current, data):
+                        changed[annotation_key] = current
+                else:
+                    changed[annotation_key] = Annotation.get_new_data(data)
+
+                count += 1
+
+            if not changed:
+                continue
+
+            rows = []
+            for data in changed.values():
+                data = Annotation.prepare_for_db(data)
+                rows.append(tuple(data[column] for column in columns))
+
+            db.execute_many(
+                "INSERT INTO annotations (%s) VALUES %%s ON CONFLICT (dataset, item_id, field_id) DO UPDATE SET %s" % (
+                    ", ".join(columns),
+                    ", ".join(["%s = EXCLUDED.%s" % (column, column) for column in columns])
+                ), replacements=rows, template="(%s)" % ", ".join(["%%s::%s" % cast for cast in columns.values()]),
+                page_size=1000)
+
+        return count
+
     def delete(self):
         """
         Deletes this annotation
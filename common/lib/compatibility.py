@@ -32,9 +32,10 @@ no dataset exists yet.
 """
 from __future__ import annotations
 
+import itertools
 import shutil
 from dataclasses import dataclass
-from typing import Iterable, List, Optional
+from typing import Iterable, Iterator, List, Optional
 
 
 def _maybe_call(module, method, **kwargs):
@@ -237,71 +238,85 @@ class Compatibility:
         collect every unmet requirement -- used to explain why a module is not
         compatible.
         """
-        reasons: List[str] = []
         if module is None:
             return ["no dataset provided"]
 
-        # --- tier 1: structural shape (cheap; no result-file read) ---
+        reasons: List[str] = []
+        for reason in itertools.chain(self.unmet_shape_requirements(module),
+                                      self.unmet_dataset_requirements(module),
+                                      self.unmet_environment_requirements(config)):
+            reasons.append(reason)
+            if first_only:
+                break
+
+        return reasons
+
+    def unmet_shape_requirements(self, module) -> Iterator[str]:
+        """
+        Yield the structural requirements `module` does not meet (tier 1).
 
+        These only depend on the values in `get_shape()`, so the outcome is
+        the same for any two datasets with the same shape. This is used to
+        cache it; see DataSet.get_compatible_processors().
+        """
         # if the processor names the kinds of dataset it accepts, the module
         # must be one of them
         if self._identity_declared() and not self._identity_matches(module):
-            reasons.append("dataset type/media is not accepted")
-            if first_only:
-                return reasons
+            yield "dataset type/media is not accepted"
 
         if self.excluded_types and getattr(module, "type", None) in set(self.excluded_types):
-            reasons.append("does not run on dataset type: %s" % getattr(module, "type", None))
-            if first_only:
-                return reasons
+            yield "does not run on dataset type: %s" % getattr(module, "type", None)
 
         if self.top_dataset_only and not _maybe_call(module, "is_top_dataset"):
-            reasons.append("requires a top-level dataset")
-            if first_only:
-                return reasons
+            yield "requires a top-level dataset"
 
         if self.child_only and _maybe_call(module, "is_top_dataset"):
-            reasons.append("requires a child (non-top-level) dataset")
-            if first_only:
-                return reasons
+            yield "requires a child (non-top-level) dataset"
 
         if self.extensions is not None:
             extension = _maybe_call(module, "get_extension")
             if extension not in set(self.extensions):
-                reasons.append("requires extension: %s" % ", ".join(self.extensions))
-                if first_only:
-                    return reasons
+                yield "requires extension: %s" % ", ".join(self.extensions)
 
-        # --- tier 2: dataset-required (read from the result file; cannot be
-        # resolved from a processor class -- see requires_dataset_result_file) ---
+    def unmet_dataset_requirements(self, module) -> Iterator[str]:
+        """
+        Yield the requirements on the produced data `module` does not meet
+        (tier 2).
 
+        These are read from the result file and cannot be resolved from a
+        processor class -- see requires_dataset_result_file.
+        """
         if self.rankable is not None:
             if bool(_maybe_call(module, "is_rankable", multiple_items=self.rankable_multiple_items)) != self.rankable:
-                reasons.append(
-                    "requires a rankable dataset" if self.rankable
-                    else "requires a non-rankable dataset"
-                )
-                if first_only:
-                    return reasons
+                yield "requires a rankable dataset" if self.rankable else "requires a non-rankable dataset"
 
         if self.requires_all_columns or self.requires_any_columns:
             columns = _maybe_call(module, "get_columns") or []
             missing = [column for column in self.requires_all_columns if column not in columns]
             if missing:
-                reasons.append("requires all column(s): %s" % ", ".join(missing))
-                if first_only:
-                    return reasons
+                yield "requires all column(s): %s" % ", ".join(missing)
             if self.requires_any_columns and not any(column in columns for column in self.requires_any_columns):
-                reasons.append("requires any of column(s): %s" % ", ".join(self.requires_any_columns))
-                if first_only:
-                    return reasons
+                yield "requires any of column(s): %s" % ", ".join(self.requires_any_columns)
+
+    def unmet_environment_requirements(self, config=None, settings=None) -> Iterator[str]:
+        """
+        Yield the configuration and system requirements that are not met
+        (tier 3).
+
+        These do not depend on the dataset at all. The executable matchers
+        here can be expensive, so this tier runs last.
+
+        :param config:  Configuration reader, or None
+        :param dict settings:  Values of the required settings, if these have
+        already been read via `get_required_settings()`
+        """
+        # TODO: cheap setting reads could be split out ahead of those matchers
+        if settings is None:
+            settings = self.get_required_settings(config)
 
-        # --- tier 3: environment (needs config/system, not a DataSet; the
-        # executable matchers here can be expensive, so this tier runs last.
-        # TODO: cheap setting reads could be split out ahead of those matchers) ---
         for requirement in self.required_settings:
             key, expected = (requirement, None) if isinstance(requirement, str) else requirement
-            value = config.get(key) if config is not None else None
+            value = settings.get(key)
             # no expected value; just check that the setting is truthy
             if expected is None:
                 met = bool(value)
@@ -315,17 +330,44 @@ class Compatibility:
             else:
                 met = value == expected
             if not met:
-                reasons.append("requires setting: %s" % key)
-                if first_only:
-                    return reasons
+                yield "requires setting: %s" % key
 
         for package in self.required_packages:
             if not shutil.which(package):
-                reasons.append("requires package: %s" % package)
-                if first_only:
-                    return reasons
+                yield "requires package: %s" % package
 
-        return reasons
+    def get_required_settings(self, config=None) -> dict:
+        """
+        Read the values of the settings named in `required_settings`.
+
+        :param config:  Configuration reader, or None, in which case every
+        setting is considered unset
+        :return dict:  Setting key => value
+        """
+        keys = [requirement if isinstance(requirement, str) else requirement[0]
+                for requirement in self.required_settings]
+        return {key: config.get(key) if config is not None else None for key in keys}
+
+    @staticmethod
+    def get_shape(module) -> tuple:
+        """
+        Get the values of `module` that the structural requirements read.
+
+        Two modules with the same shape meet the same structural requirements
+        (see `unmet_shape_requirements()`) for any specification.
+
+        :param module:  Dataset (or processor)
+        :return tuple:  Type, media type, datasource, whether it is a
+        top-level dataset, and extension
+        """
+        parameters = getattr(module, "parameters", None) or {}
+        return (
+            getattr(module, "type", None),
+            _maybe_call(module, "get_media_type") or getattr(module, "media_type", None),
+            parameters.get("datasource") if isinstance(parameters, dict) else None,
+            bool(_maybe_call(module, "is_top_dataset")),
+            _maybe_call(module, "get_extension"),
+        )
 
     def _identity_declared(self) -> bool:
         """Whether the processor names any kind of dataset it accepts."""
@@ -261,6 +261,43 @@ config_definition = {
                    "'10/hour', '5/minute'. You can also combine these, e.g. '100/day;10/hour'.",
         "global": True
     },
+    "4cat.map_item_processes": {
+        "type": UserInput.OPTION_TEXT,
+        "default": 1,
+        "help": "Item mapping processes",
+        "coerce_type": int,
+        "tooltip": "Number of processes used to map items of large NDJSON datasets (e.g. Zeeschuimer imports) when "
+                   "processing them. Set to 1 to map items in the processor's own thread.",
+        "global": True
+    },
+    "4cat.cache_mapped_items": {
+        "type": UserInput.OPTION_TOGGLE,
+        "default": False,
+        "help": "Cache mapped items",
+        "tooltip": "Store the mapped version of a dataset's items next to the dataset the first time they are mapped, "
+                   "so processors run on the dataset afterwards do not need to map them again. Uses additional disk "
+                   "space.",
+        "global": True
+    },
+    "4cat.cache_columns": {
+        "type": UserInput.OPTION_TOGGLE,
+        "default": False,
+        "help": "Cache columns",
+        "tooltip": "Store a copy of a dataset's mapped items per column next to the dataset when a processor that "
+                   "only needs a few columns (e.g. counting items, merging datasets) is run on it, so that reading "
+                   "those columns again is faster. Uses additional disk space.",
+        "global": True
+    },
+    "4cat.filter_views": {
+        "type": UserInput.OPTION_TOGGLE,
+        "default": False,
+        "help": "Store filtered datasets as views",
+        "tooltip": "Rather than copying the items that match a filter to a new file, store which items of the "
+                   "original dataset match. Saves disk space and time for CSV and NDJSON datasets; the items are "
+                   "written to a file of their own when the filtered dataset is downloaded or the original dataset is "
+                   "deleted.",
+        "global": True
+    },
     "4cat.sphinx_host": {
         "type": UserInput.OPTION_TEXT,
         "default": "localhost",
@@ -268,6 +305,44 @@ config_definition = {
         "tooltip": "Sphinx is used for full-text search for collected datasources (e.g., 4chan, 8kun, 8chan) and requires additional setup (see 4CAT wiki on GitHub).",
         "global": True
     },
+    # job scheduling
+    "queue.max_jobs_per_queue": {
+        "type": UserInput.OPTION_TEXT,
+        "default": 1,
+        "help": "Jobs per queue",
+        "coerce_type": int,
+        "tooltip": "Maximum number of jobs that run at the same time per queue. Most job types have their own queue; "
+                   "some share one, e.g. processors using locally hosted models.",
+        "global": True
+    },
+    "queue.max_jobs_per_user": {
+        "type": UserInput.OPTION_TEXT,
+        "default": 0,
+        "help": "Jobs per user",
+        "coerce_type": int,
+        "tooltip": "Maximum number of jobs that run at the same time for datasets created by the same user. Set to 0 "
+                   "for no limit. Regardless of this setting, queued jobs are started in turns per user, so one user "
+                   "queueing many jobs does not hold up everyone else.",
+        "global": True
+    },
+    "queue.jobtype_limits": {
+        "type": UserInput.OPTION_TEXT_JSON,
+        "default": {},
+        "help": "Jobs per job type",
+        "tooltip": "A JSON object with job types as keys and the maximum number of jobs of that type that run at the "
+                   "same time as values, e.g. {\"image-downloader\": 2}. Job types not listed are only limited by "
+                   "the number of jobs per queue.",
+        "global": True
+    },
+    "queue.resource_limits": {
+        "type": UserInput.OPTION_TEXT_JSON,
+        "default": {},
+        "help": "Jobs per resource class",
+        "tooltip": "A JSON object with resource classes ('cpu', 'network' or 'ml') as keys and the maximum number of "
+                   "jobs of workers of that class that run at the same time as values, e.g. {\"cpu\": 4}. Classes "
+                   "not listed are not limited.",
+        "global": True
+    },
     # proxy stuff
     "proxies.urls": {
         "type": UserInput.OPTION_TEXT_JSON,
@@ -661,6 +736,27 @@ config_definition = {
         "tooltip": "If disabled, can only use LLMs from the 'Third-party models' provider. Can be configured per user "
                    "or tag.",
     },
+    "llm.concurrent_requests": {
+        "type": UserInput.OPTION_TEXT,
+        "default": 1,
+        "help": "Concurrent LLM requests",
+        "coerce_type": int,
+        "min": 1,
+        "tooltip": "Number of prompts the LLM prompter sends at the same time. Results are still written in the order "
+                   "of the dataset. Higher values speed up processing if the LLM server or API can handle several "
+                   "requests at once, but may run into rate limits. Can be configured per user or tag.",
+    },
+    "llm.response_cache_size": {
+        "type": UserInput.OPTION_TEXT,
+        "default": 500,
+        "help": "LLM response cache size (MB)",
+        "coerce_type": int,
+        "min": 0,
+        "tooltip": "Responses of LLMs are stored, so that sending the same prompt with the same model and settings "
+                   "again (e.g. when re-running a processor) re-uses the earlier response instead. Least recently "
+                   "used responses are removed when the cache grows beyond this size. Set to 0 to disable.",
+        "global": True
+    },
     # TODO: add setting to restrict models per user/group?
     
     # UI settings
@@ -767,6 +863,7 @@ categories = {
     "dmi-service-manager": "DMI Service Manager",
     "ui": "User interface",
     "proxies": "Proxied HTTP requests",
+    "queue": "Job queue",
     "image-visuals": "Image visualization",
     "extensions": "Extensions",
     "llm": "LLM servers"
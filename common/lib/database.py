@@ -2,16 +2,159 @@
 Database wrapper
 """
 import itertools
+import threading
+import types
 import psycopg2.extras
+import psycopg2.pool
 import psycopg2
 import logging
+import weakref
 import time
+import os
 
 from psycopg2 import sql
 from psycopg2.extras import execute_values
 
 from common.lib.exceptions import DatabaseQueryInterruptedException
 
+
+class ConnectionPool:
+	"""
+	A bounded pool of database connections
+
+	Shared by all pooled Database objects in a process that connect with the
+	same parameters; get one with `ConnectionPool.get()`. Connections are only
+	opened when needed, and kept open when returned to the pool so they can be
+	re-used. Unlike psycopg2's own pools, checking out a connection while all
+	are in use waits for one to be returned instead of raising an exception,
+	so the pool size caps the number of connections without making callers
+	fail under load. Only if no connection is returned within `timeout`
+	seconds, e.g. because connections are not released, an exception is
+	raised.
+	"""
+	pools = {}
+	pools_lock = threading.Lock()
+
+	# seconds to wait for a connection to become available
+	timeout = 300
+
+	def __init__(self, size, **connection_parameters):
+		"""
+		Set up pool
+
+		:param int size:  Maximum number of connections
+		:param connection_parameters:  Parameters for `psycopg2.connect()`
+		"""
+		self.size = size
+		self.connection_parameters = connection_parameters
+		self.idle = []
+		self.lock = threading.Lock()
+		self.slots = threading.BoundedSemaphore(size)
+		self.pid = os.getpid()
+
+	@classmethod
+	def get(cls, size, **connection_parameters):
+		"""
+		Get the pool for the given connection parameters
+
+		:param int size:  Maximum number of connections, if the pool does not
+		exist yet
+		:param connection_parameters:  Parameters for `psycopg2.connect()`
+		:return ConnectionPool:
+		"""
+		key = tuple(sorted(connection_parameters.items()))
+		with cls.pools_lock:
+			if key not in cls.pools:
+				cls.pools[key] = cls(size, **connection_parameters)
+
+			return cls.pools[key]
+
+	def checkout(self, application_name, log=None):
+		"""
+		Take a connection from the pool
+
+		Waits until a connection is available if all are in use, for at most
+		`timeout` seconds.
+
+		:param str application_name:  Application name to use for the
+		connection, as visible in `pg_stat_activity`
+		:param log:  Logger to log a warning with if no connection becomes
+		available
+		:return:  psycopg2 connection
+		"""
+		if not self.slots.acquire(timeout=self.timeout):
+			message = f"No database connection available for {application_name} after waiting {self.timeout} " \
+					  f"seconds; all {self.size} connections in the pool are in use"
+			(log or logging).warning(message)
+			raise psycopg2.pool.PoolError(message)
+
+		try:
+			with self.lock:
+				connection, current_name = self.idle.pop() if self.idle else (None, None)
+
+			if not connection or connection.closed:
+				connection = psycopg2.connect(**self.connection_parameters, application_name=application_name)
+			elif current_name != application_name:
+				with connection.cursor() as cursor:
+					cursor.execute("SET application_name TO %s", (application_name,))
+				connection.commit()
+
+			return connection
+		except Exception:
+			self.slots.release()
+			raise
+
+	def checkin(self, connection, application_name):
+		"""
+		Return a connection to the pool
+
+		:param connection:  psycopg2 connection, from `checkout()`
+		:param str application_name:  Application name the connection uses
+		"""
+		if os.getpid() != self.pid:
+			# the connection is in use by the process this one was forked
+			# from; leave it alone
+			return
+
+		try:
+			if not connection.closed:
+				status = connection.info.transaction_status
+				if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+					# connection lost
+					connection.close()
+				elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+					connection.rollback()
+		except psycopg2.Error:
+			connection.close()
+
+		if not connection.closed:
+			with self.lock:
+				self.idle.append((connection, application_name))
+
+		self.slots.release()
+
+
+class PooledConnection:
+	"""
+	A connection checked out from a ConnectionPool by a Database object
+
+	The connection is returned to the pool by calling `release()`, or when
+	this object is garbage collected, e.g. because the thread it was checked
+	out for has ended.
+	"""
+	def __init__(self, pool, application_name, log=None):
+		"""
+		Check out a connection
+
+		:param ConnectionPool pool:  Pool to check out a connection from
+		:param str application_name:  Application name for the connection
+		:param log:  Logger to log problems with
+		"""
+		self.connection = pool.checkout(application_name, log)
+		self.cursor = self.connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+		self.release = weakref.finalize(self, pool.checkin, self.connection, application_name)
+
+
 class Database:
 	"""
 	Simple database handler
@@ -19,16 +162,26 @@ class Database:
 	Offers a number of abstraction methods that limit how much SQL one is
 	required to write. Also makes the database connection mostly multithreading
 	proof by instantiating a new cursor for each query (and closing it afterwards)
+
+	By default, a Database object opens a connection when it is created and
+	uses it until it is closed. If a `pool_size` is given, it instead uses
+	connections from a pool shared with other Database objects in the same
+	process (see `ConnectionPool`). A connection is then checked out for each
+	thread when that thread first uses the database, and returned to the pool
+	with `release()` or `close()`, or when the thread ends. Alternatively, with
+	`per_thread` disabled, one connection is checked out and shared by all
+	threads using the object, like a connection of its own would be.
 	"""
-	cursor = None
 	log = None
 	appname=""
+	pool = None
 
 	interrupted = False
 	interruptable_timeout = 86400  # if a query takes this long, it should be cancelled. see also fetchall_interruptable()
 	interruptable_job = None
 
-	def __init__(self, logger, dbname=None, user=None, password=None, host=None, port=None, appname=None):
+	def __init__(self, logger, dbname=None, user=None, password=None, host=None, port=None, appname=None, pool_size=0,
+				 per_thread=True):
 		"""
 		Set up database connection
 
@@ -39,11 +192,25 @@ class Database:
 		:param host:  Database server address
 		:param port:  Database port
 		:param appname:  App name, mostly useful to trace connections in pg_stat_activity
+		:param int pool_size:  Use connections from a pool with at most this
+		many connections, instead of a connection of its own. 0 to not use a
+		pool.
+		:param bool per_thread:  When using a pool, check out a connection for
+		each thread that uses the object. If `False`, all threads share the
+		same connection, so that threads started by e.g. a worker do not take
+		connections from the pool on top of the worker's own.
 		"""
 		self.appname = "4CAT" if not appname else "4CAT-%s" % appname
+		self.connection_parameters = {"dbname": dbname, "user": user, "password": password, "host": host, "port": port}
+
+		if pool_size and int(pool_size) > 0:
+			self.pool = ConnectionPool.get(int(pool_size), **self.connection_parameters)
+			self.checked_out = threading.local() if per_thread else types.SimpleNamespace()
+			self.checkout_lock = threading.Lock()
+		else:
+			self._connection = psycopg2.connect(**self.connection_parameters, application_name=self.appname)
+			self._cursor = self._connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
-		self.connection = psycopg2.connect(dbname=dbname, user=user, password=password, host=host, port=port, application_name=self.appname)
-		self.cursor = self.connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 		self.log = logger
 
 		if self.log is None:
@@ -62,19 +229,108 @@ class Database:
 		"""
 		for i in range(tries):
 			try:
-				self.connection = psycopg2.connect(dbname=self.connection.info.dbname,
-												   user=self.connection.info.user,
-												   password=self.connection.info.password,
-												   host=self.connection.info.host,
-												   port=self.connection.info.port,
-												   application_name=self.appname)
-				self.cursor = self.connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+				if self.pool:
+					# make sure the broken connection is discarded by the pool
+					broken_connection = getattr(self.checked_out, "connection", None)
+					if broken_connection:
+						broken_connection.connection.close()
+					self.release()
+					self.checkout()
+				else:
+					self._connection = psycopg2.connect(**self.connection_parameters, application_name=self.appname)
+					self._cursor = self._connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 				return
 			except (psycopg2.InterfaceError, psycopg2.OperationalError) as e:
 				self.log.warning(f"Database connection closed. Reconnecting...\n{e}")
 				time.sleep(wait)
 		self.log.error("Failed to reconnect to database after %d tries" % tries)
 
+	def reconnect_after_fork(self):
+		"""
+		Open a new connection in a forked child process
+
+		A child process inherits the connection of its parent, but using it
+		from both processes garbles the communication with the database. This
+		replaces it with a new connection with the same parameters. The
+		inherited connection is kept around unused, since closing it - which
+		also happens when it is garbage collected - would close it for the
+		parent process as well.
+		"""
+		if self.pool:
+			# the pool's connections are the parent's too, so stop using it
+			self.inherited_connection = getattr(self.checked_out, "connection", None)
+			self.pool = None
+		else:
+			self.inherited_connection = self._connection
+
+		self._connection = psycopg2.connect(**self.connection_parameters, application_name=self.appname)
+		self._cursor = self._connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+	@property
+	def connection(self):
+		"""
+		The psycopg2 connection to use
+
+		For pooled Database objects, this is the connection checked out for
+		the current thread, which is checked out first if needed.
+
+		:return:  psycopg2 connection
+		"""
+		if self.pool:
+			return self.checkout().connection
+
+		return self._connection
+
+	@property
+	def cursor(self):
+		"""
+		A cursor for the connection that is kept open
+
+		Most methods use a new cursor for each query instead (see
+		`get_cursor()`).
+
+		:return:  psycopg2 cursor
+		"""
+		if self.pool:
+			return self.checkout().cursor
+
+		return self._cursor
+
+	def checkout(self):
+		"""
+		Check out a connection from the pool for the current thread
+
+		Does nothing if the current thread already has one, or if the
+		connection is shared between threads and has already been checked out.
+
+		:return PooledConnection:
+		"""
+		pooled_connection = getattr(self.checked_out, "connection", None)
+		if not pooled_connection:
+			with self.checkout_lock:
+				pooled_connection = getattr(self.checked_out, "connection", None)
+				if not pooled_connection:
+					pooled_connection = PooledConnection(self.pool, self.appname, self.log)
+					self.checked_out.connection = pooled_connection
+
+		return pooled_connection
+
+	def release(self):
+		"""
+		Return the current thread's connection to the pool
+
+		Does nothing for Database objects that do not use a pool. The thread
+		checks out a new connection if it uses the database again afterwards.
+		If the connection is shared between threads, it is returned for all
+		of them.
+		"""
+		if not self.pool:
+			return
+
+		pooled_connection = vars(self.checked_out).pop("connection", None)
+		if pooled_connection:
+			pooled_connection.release()
+
 	def _execute_query(self, query, replacements=None, cursor=None):
 		"""
 		Execute a query
@@ -125,7 +381,7 @@ class Database:
 
 		return rowcount
 
-	def execute_many(self, query, commit=True, replacements=None):
+	def execute_many(self, query, commit=True, replacements=None, template=None, page_size=100, fetch=False):
 		"""
 		Execute a query multiple times, each time with different values
 
@@ -135,20 +391,28 @@ class Database:
 		:param string query:  Query
 		:param replacements: A list of replacement values
 		:param commit:  Commit transaction after query?
+		:param str template:  Template for each set of replacement values,
+		e.g. `(%s, %s::integer)`. By default, all values are simply listed.
+		:param int page_size:  Amount of replacement values to send per query
+		:param bool fetch:  Return the rows produced by the query, e.g. via
+		`RETURNING`?
+		:return list|None:  Rows, if `fetch` is `True`
 		"""
 		cursor = self.get_cursor()
 		try:
-			execute_values(cursor, query, replacements)
+			result = execute_values(cursor, query, replacements, template=template, page_size=page_size, fetch=fetch)
 		except (psycopg2.InterfaceError, psycopg2.OperationalError) as e:
 			self.log.warning(f"Database Exception: {e}\nReconnecting and retrying query...")
 			self.reconnect()
 			cursor = self.get_cursor()
-			execute_values(cursor, query, replacements)
+			result = execute_values(cursor, query, replacements, template=template, page_size=page_size, fetch=fetch)
 
 		cursor.close()
 		if commit:
 			self.commit()
 
+		return result if fetch else None
+
 	def update(self, table, data, where=None, commit=True):
 		"""
 		Update a database record
@@ -409,6 +673,46 @@ class Database:
 		return result
 
 
+	def listen(self, channel):
+		"""
+		Listen for notifications on a channel
+
+		Notifications can subsequently be retrieved with
+		`get_notifications()`. The connection's socket (`connection.fileno()`)
+		becomes readable when a notification arrives, so one can wait for
+		notifications with e.g. `select.select()`.
+
+		:param str channel:  Channel to listen on
+		"""
+		self.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+
+	def notify(self, channel, payload=""):
+		"""
+		Send a notification on a channel
+
+		Notifications are only delivered once the transaction they are sent in
+		is committed; this commits immediately.
+
+		:param str channel:  Channel to notify
+		:param str payload:  Payload of the notification
+		"""
+		self.execute("SELECT pg_notify(%s, %s)", (channel, payload))
+
+	def get_notifications(self):
+		"""
+		Get notifications received since the last call
+
+		Only returns something if `listen()` was called for at least one
+		channel.
+
+		:return list:  Notification payloads
+		"""
+		self.connection.poll()
+		payloads = [notification.payload for notification in self.connection.notifies]
+		self.connection.notifies.clear()
+
+		return payloads
+
 	def commit(self):
 		"""
 		Commit the current transaction
@@ -427,9 +731,14 @@ class Database:
 		"""
 		Close connection
 
-		Running queries after this is probably a bad idea!
+		Running queries after this is probably a bad idea! For pooled Database
+		objects, this returns the current thread's connection to the pool,
+		after which it can be used again.
 		"""
-		self.connection.close()
+		if self.pool:
+			self.release()
+		else:
+			self.connection.close()
 
 	def get_cursor(self):
 		"""
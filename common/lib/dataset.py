@@ -1,6 +1,9 @@
+import concurrent.futures
 import collections
 import itertools
 import datetime
+import hashlib
+import inspect
 import zipfile
 import fnmatch
 import random
@@ -16,10 +19,13 @@ from pathlib import Path
 from natsort import natsorted
 
 from common.lib.annotation import Annotation
+from common.lib.dataset_index import (RowIndex, SortIndex, ColumnStore, MappedItemCache, RowSelection, MediaIndex,
+                                      get_temporary_path)
 from common.lib.job import Job, JobNotFoundException
 
-from common.lib.helpers import get_software_commit, NullAwareTextIOWrapper, convert_to_int, get_software_version, call_api, hash_to_md5, convert_to_float
+from common.lib.helpers import get_software_commit, NullAwareTextIOWrapper, convert_to_int, get_software_version, call_api, hash_to_md5, convert_to_float, get_process_context
 from common.lib.item_mapping import MappedItem, DatasetItem
+from common.lib.compatibility import Compatibility
 from common.lib.fourcat_module import FourcatModule
 from common.lib.exceptions import (ProcessorInterruptedException, DataSetException, DataSetNotFoundException,
                                    MapItemException, MappedItemIncompleteException, AnnotationException)
@@ -55,6 +61,7 @@ class DataSet(FourcatModule):
     _children = None
     available_processors = None
     _genealogy = None
+    identity_map = None
     preset_parent = None
     parameters = None
     modules = None
@@ -70,6 +77,7 @@ class DataSet(FourcatModule):
     no_status_updates = False
     disposable_files = None
     _queue_position = None
+    _mapper_version = None
 
     def __init__(
             self,
@@ -331,6 +339,11 @@ class DataSet(FourcatModule):
         :param offset int:  How many items to skip.
         :return generator:  A generator that yields each item as a dictionary
         """
+        view_source = self.get_view_source()
+        if view_source:
+            yield from self._iterate_view_items(view_source, processor=processor, offset=offset)
+            return
+
         path = self.get_results_path()
 
         # Yield through items one by one
@@ -350,7 +363,17 @@ class DataSet(FourcatModule):
                         )
                     yield first_item
 
-                for i, item in enumerate(reader):
+                # skip straight to the requested row if possible
+                start_row, start_byte = self._get_start_position(offset, processor)
+                if start_byte is not None:
+                    # make sure the header is read before moving away from it
+                    _ = reader.fieldnames
+                    wrapped_infile.seek(start_byte)
+                elif start_row is None:
+                    # offset is beyond the last row
+                    return
+
+                for i, item in enumerate(reader, start=start_row):
                     if hasattr(processor, "interrupted") and processor.interrupted:
                         raise ProcessorInterruptedException(
                             "Processor interrupted while iterating through CSV file"
@@ -364,7 +387,13 @@ class DataSet(FourcatModule):
         elif path.suffix.lower() == ".ndjson":
             # In NDJSON format each line in the file is a self-contained JSON
             with path.open(encoding="utf-8") as infile:
-                for i, line in enumerate(infile):
+                start_row, start_byte = self._get_start_position(offset, processor)
+                if start_byte is not None:
+                    infile.seek(start_byte)
+                elif start_row is None:
+                    return
+
+                for i, line in enumerate(infile, start=start_row):
                     if hasattr(processor, "interrupted") and processor.interrupted:
                         raise ProcessorInterruptedException(
                             "Processor interrupted while iterating through NDJSON file"
@@ -378,6 +407,132 @@ class DataSet(FourcatModule):
         else:
             raise NotImplementedError(f"Cannot iterate through {path.suffix} file")
 
+    def _iterate_view_items(self, source, processor=None, offset=0):
+        """
+        A generator that iterates through the rows selected by a view
+
+        The result file of the dataset the view is of is read sequentially,
+        starting at the first selected row, and unselected rows are skipped.
+
+        This is an internal method and should not be called directly. Rather,
+        call iterate_items() and use the generated dictionary and its properties.
+
+        :param DataSet source:  Dataset this dataset is a view of
+        :param BasicProcessor processor:  A reference to the processor
+        iterating the dataset.
+        :param offset int:  How many selected items to skip.
+        :return generator:  A generator that yields each item as a dictionary
+        """
+        selection = self.get_row_selection(source, processor=processor)
+        first_row = selection.get_rows(offset, 1)
+        if not len(first_row):
+            return
+
+        first_row = int(first_row[0])
+        remaining = selection.num_selected - offset
+        for row, item in enumerate(source._iterate_items(processor=processor, offset=first_row), start=first_row):
+            if not selection.bitmap[row]:
+                continue
+
+            yield item
+
+            remaining -= 1
+            if remaining <= 0:
+                break
+
+    def _get_start_position(self, offset, processor=None):
+        """
+        Determine where to start reading the result file for a given offset
+
+        Uses the row index (see `get_row_index()`) to look up the byte offset
+        of the requested row, so the rows before it do not need to be parsed.
+        If no index is available, iteration needs to start from the first row
+        and skip rows until the offset is reached.
+
+        :param int offset:  Number of rows to skip
+        :param BasicProcessor processor:  Processor iterating the dataset
+        :return tuple:  Row number and byte offset at which to start reading.
+        The byte offset is `None` if reading should start at the beginning of
+        the file; both are `None` if the offset is beyond the last row.
+        """
+        if offset <= 0:
+            return 0, None
+
+        row_index = self.get_row_index(processor=processor)
+        if not row_index:
+            return 0, None
+
+        if offset >= row_index.num_rows:
+            return None, None
+
+        return offset, row_index.get_offset(offset)
+
+    def _iterate_rows(self, processor=None, offset=0, rows=None, *args, **kwargs):
+        """
+        A generator that yields specific rows from a CSV or NDJSON file
+
+        Rows are yielded in the order in which they are requested. Each row is
+        read by seeking to its position in the result file as recorded in the
+        row index (see `get_row_index()`), so this is efficient even if the
+        rows are scattered throughout a large file.
+
+        This is an internal method and should not be called directly. Rather,
+        call iterate_items() with the `rows` parameter.
+
+        :param BasicProcessor processor:  A reference to the processor
+        iterating the dataset.
+        :param offset int:  Ignored; specific rows are requested instead
+        :param list rows:  Zero-based row numbers to yield
+        :return generator:  A generator that yields each item as a dictionary
+        """
+        view_source = self.get_view_source()
+        if view_source:
+            # read the corresponding rows of the dataset this is a view of
+            selected = self.get_row_selection(view_source, processor=processor).get_rows()
+            if any(row < 0 or row >= len(selected) for row in rows):
+                raise DataSetException(f"Requested rows that do not exist in dataset {self.key}")
+
+            yield from view_source._iterate_rows(processor=processor, rows=[int(selected[row]) for row in rows])
+            return
+
+        path = self.get_results_path()
+        row_index = self.get_row_index(processor=processor)
+        if not row_index:
+            raise DataSetException(f"Cannot read specific rows from dataset {self.key} without a row index")
+
+        offsets = row_index.get_offsets(rows)
+        if None in offsets:
+            raise DataSetException(f"Requested rows that do not exist in dataset {self.key}")
+
+        if path.suffix.lower() == ".csv":
+            with path.open("rb") as infile:
+                wrapped_infile = NullAwareTextIOWrapper(infile, encoding="utf-8")
+                reader = csv.DictReader(wrapped_infile)
+                _ = reader.fieldnames
+
+                for byte_offset in offsets:
+                    if hasattr(processor, "interrupted") and processor.interrupted:
+                        raise ProcessorInterruptedException(
+                            "Processor interrupted while iterating through CSV file"
+                        )
+
+                    wrapped_infile.seek(byte_offset)
+                    yield next(reader)
+
+        elif path.suffix.lower() == ".ndjson":
+            with path.open(encoding="utf-8") as infile:
+                for byte_offset in offsets:
+                    if hasattr(processor, "interrupted") and processor.interrupted:
+                        raise ProcessorInterruptedException(
+                            "Processor interrupted while iterating through NDJSON file"
+                        )
+
+                    infile.seek(byte_offset)
+                    yield json.loads(infile.readline())
+
+        else:
+            raise NotImplementedError(f"Cannot iterate through {path.suffix} file")
+
     def _iterate_archive_contents(
             self,
             staging_area=None,
@@ -485,7 +640,7 @@ class DataSet(FourcatModule):
 
     def iterate_items(
             self, processor=None, warn_unmappable=True, map_missing="default", get_annotations=True, max_unmappable=None,
-            offset=0, *args, **kwargs
+            offset=0, rows=None, *args, **kwargs
     ):
         """
         Generate mapped dataset items
@@ -536,6 +691,9 @@ class DataSet(FourcatModule):
         :param get_annotations: Whether to also fetch annotations from the database.
           This can be disabled to help speed up iteration.
         :param offset: After how many rows we should yield items.
+        :param list rows:  Only yield these rows (by their zero-based position
+          in the result file), in the given order. Only available for CSV and
+          NDJSON files; uses the row index (see `get_row_index()`).
         :param bool immediately_delete:  Only used when iterating a file
           archive. Defaults to `True`, if set to `False`, files are not deleted
           from the staging area after the iteration, so they can be re-used.
@@ -548,6 +706,115 @@ class DataSet(FourcatModule):
           not filter.
         :return generator:  A generator that yields DatasetItems
         """
+        if get_annotations:
+            add_annotations = self._get_annotation_adder()
+            item_batch_size = 500
+            dataset_item_cache = []
+        else:
+            add_annotations = None
+
+        for row_number, original_item, mapped_item in self._iterate_mapped_items(
+                processor=processor, warn_unmappable=warn_unmappable, map_missing=map_missing,
+                max_unmappable=max_unmappable, offset=offset, rows=rows, *args, **kwargs
+        ):
+            # yield a DatasetItem, which is a dict with some special properties
+            dataset_item = DatasetItem(
+                mapper=type(mapped_item) is MappedItem,
+                original=original_item,
+                mapped_object=mapped_item,
+                data_file=original_item["path"] if "path" in original_item and issubclass(type(original_item["path"]), os.PathLike) else None,
+                **(
+                    mapped_item.get_item_data()
+                    if type(mapped_item) is MappedItem
+                    else mapped_item
+                ),
+            )
+
+            dataset_item.row_number = row_number
+
+            # If we're getting annotations, yield in items batches so we don't need to get annotations per item.
+            if add_annotations:
+                dataset_item_cache.append(dataset_item)
+
+                # When we reach the batch limit, get the annotations for
+                # cached items and yield the entire thing.
+                if len(dataset_item_cache) >= item_batch_size:
+                    add_annotations(dataset_item_cache)
+                    yield from dataset_item_cache
+                    dataset_item_cache = []
+
+            else:
+                yield dataset_item
+
+        # Yield whatever is left in the last batch
+        if add_annotations and dataset_item_cache:
+            add_annotations(dataset_item_cache)
+            yield from dataset_item_cache
+
+    def iterate_batches(
+            self, batch_size=1000, processor=None, warn_unmappable=True, map_missing="default", get_annotations=True,
+            max_unmappable=None, offset=0, *args, **kwargs
+    ):
+        """
+        Generate batches of mapped dataset items
+
+        A faster alternative to `iterate_items()` for processors that handle
+        many items but do not need the `original` or `mapped_object` views of
+        each item. Items are yielded as plain dictionaries with the mapped
+        item data, in lists of at most `batch_size` items. Original items are
+        not copied and no `DatasetItem` is created for each item; annotations
+        are retrieved once per batch.
+
+        Parameters are the same as for `iterate_items()`.
+
+        :param int batch_size:  Maximum number of items per batch
+        :return generator:  A generator that yields lists of dictionaries
+        """
+        add_annotations = self._get_annotation_adder() if get_annotations else None
+
+        batch = []
+        for row_number, original_item, mapped_item in self._iterate_mapped_items(
+                processor=processor, warn_unmappable=warn_unmappable, map_missing=map_missing,
+                max_unmappable=max_unmappable, offset=offset, copy_original=False, *args, **kwargs
+        ):
+            if type(mapped_item) is MappedItem:
+                # same as what DatasetItem does
+                item = mapped_item.get_item_data()
+                item["missing_fields"] = ", ".join(mapped_item.get_missing_fields())
+                batch.append(item)
+            else:
+                batch.append(mapped_item)
+
+            if len(batch) >= batch_size:
+                if add_annotations:
+                    add_annotations(batch)
+
+                yield batch
+                batch = []
+
+        if batch:
+            if add_annotations:
+                add_annotations(batch)
+
+            yield batch
+
+    def _iterate_mapped_items(
+            self, processor=None, warn_unmappable=True, map_missing="default", max_unmappable=None, offset=0, rows=None,
+            copy_original=True, *args, **kwargs
+    ):
+        """
+        Generate mapped items
+
+        Internal method that maps items and handles unmappable items and
+        missing fields for `iterate_items()` and `iterate_batches()`. See
+        `iterate_items()` for a description of the parameters.
+
+        :param bool copy_original:  Keep a copy of the unmapped item. Needed if
+        the original is to be used after mapping, since mapping may change it.
+        :return generator:  Yields tuples of the item's row number, the
+        original item (or `None` if not copied), and either a `MappedItem` or
+        (if the dataset has no mapper) the original item again
+        """
         unmapped_items = 0
 
         # Collect item_mapper for use with filter
@@ -556,25 +823,6 @@ class DataSet(FourcatModule):
         if own_processor and own_processor.map_item_method_available(dataset=self):
             item_mapper = True
 
-        # Annotations are dynamically added, and we're handling them as 'extra' map_item fields.
-        # If we're getting annotations, we're caching items so we don't need to retrieve annotations one-by-one.
-        get_annotations = True if self.annotation_fields and get_annotations else False
-        if get_annotations:
-            annotation_fields = self.annotation_fields.copy()
-            item_batch_size = 500
-            dataset_item_cache = []
-            annotations_before = int(time.time())
-
-            # Append a number to annotation labels if there's duplicate ones
-            annotation_labels = {}
-            for (annotation_field_id, annotation_field_items,) in annotation_fields.items():
-                unique_label = annotation_field_items["label"]
-                counter = 1
-                while unique_label in annotation_labels.values():
-                    counter += 1
-                    unique_label = f"{annotation_field_items['label']}_{counter}"
-                annotation_labels[annotation_field_id] = unique_label
-
         # missing field strategy can be for all fields at once, or per field
         # if it is per field, it is a dictionary with field names and their strategy
         # if it is for all fields, it may be a callback, 'abort', or 'default'
@@ -583,21 +831,61 @@ class DataSet(FourcatModule):
             default_strategy = map_missing
             map_missing = {}
 
-        iterator = self._iterate_items if self.get_extension() != "zip" else self._iterate_archive_contents
+        if rows is not None:
+            if self.get_extension() not in ("csv", "ndjson"):
+                raise NotImplementedError("Specific rows can only be iterated for CSV and NDJSON files")
+            iterator = self._iterate_rows
+        elif self.get_extension() != "zip":
+            iterator = self._iterate_items
+        else:
+            iterator = self._iterate_archive_contents
+
+        items = iterator(processor=processor, offset=offset, rows=rows, *args, **kwargs)
+        if not item_mapper:
+            for i, item in enumerate(items):
+                # Position of the item in the result file
+                row_number = rows[i] if rows is not None else offset + i
+
+                # the item is not mapped, but callers may still modify it, and
+                # expect the original to stay as it was
+                yield row_number, item.copy() if copy_original else None, item
+
+            return
+
+        # Use cached mapped items if available; the cache has one line per
+        # row so can only be used when iterating the full file
+        use_cache = rows is None and offset == 0 and not self.is_view() \
+                    and self.modules.config.get("4cat.cache_mapped_items", False) is True
+        mapped_item_cache = self.get_mapped_item_cache() if use_cache else None
+        if mapped_item_cache:
+            if not copy_original:
+                items.close()
+                items = None
 
-        # Loop through items
-        for i, item in enumerate(iterator(processor=processor, offset=offset, *args, **kwargs)):
-            # Save original to yield
-            original_item = item.copy()
+            mapped_items = mapped_item_cache.iterate(originals=items, processor=processor)
 
-            # Map item
-            if item_mapper:
-                try:
-                    mapped_item = own_processor.get_mapped_item(item)
-                except MapItemException as e:
+        else:
+            # Map items - in parallel if possible
+            map_item_processes = self.get_map_item_processes(rows=rows, offset=offset, processor=processor)
+            if map_item_processes > 1:
+                items.close()
+                mapped_items = self._map_items_in_parallel(own_processor, map_item_processes, offset=offset,
+                                                           copy_original=copy_original, processor=processor)
+            else:
+                mapped_items = self._map_items(own_processor, items, rows=rows, offset=offset,
+                                               copy_original=copy_original)
+
+            mapper_version = self.get_mapper_version() if use_cache and self.is_finished() else None
+            if mapper_version:
+                mapped_items = MappedItemCache.write_through(self.get_index_path("mapped"), self.get_results_path(),
+                                                             mapper_version, mapped_items)
+
+        try:
+            for row_number, original_item, mapped_item in mapped_items:
+                if isinstance(mapped_item, MapItemException):
                     if warn_unmappable:
                         # Update dataset log for unmappable items.
-                        self.warn_unmappable_item(i, processor, e)
+                        self.warn_unmappable_item(row_number, processor, mapped_item)
 
                     unmapped_items += 1
                     if max_unmappable and unmapped_items > max_unmappable:
@@ -605,98 +893,304 @@ class DataSet(FourcatModule):
                     else:
                         continue
 
-                # check if fields have been marked as 'missing' in the
-                # underlying data, and treat according to the chosen strategy
-                if mapped_item.get_missing_fields():
-                    for missing_field in mapped_item.get_missing_fields():
-                        strategy = map_missing.get(missing_field, default_strategy)
+                yield row_number, original_item, self._handle_missing_fields(mapped_item, map_missing,
+                                                                             default_strategy)
+        finally:
+            # make sure worker processes are stopped if we stop early
+            mapped_items.close()
 
-                        if callable(strategy):
-                            # delegate handling to a callback
-                            mapped_item.data[missing_field] = strategy(
-                                mapped_item.data, missing_field
-                            )
-                        elif strategy == "keep":
-                            # leave the MissingMappedField in place so the
-                            # caller can distinguish missing from present
-                            continue
-                        elif strategy == "abort":
-                            # raise an exception to be handled at the processor level
-                            raise MappedItemIncompleteException(
-                                f"Cannot process item, field {missing_field} missing in source data."
-                            )
-                        elif strategy == "default":
-                            # use whatever was passed to the object constructor
-                            mapped_item.data[missing_field] = mapped_item.data[
-                                missing_field
-                            ].value
-                        else:
-                            raise ValueError(
-                                "map_missing must be 'abort', 'default', 'keep', or a callback."
-                            )
-            else:
-                mapped_item = original_item
+    @staticmethod
+    def _map_items(mapper, items, rows=None, offset=0, copy_original=True):
+        """
+        Map items one by one
 
-            # yield a DatasetItem, which is a dict with some special properties
-            dataset_item = DatasetItem(
-                mapper=item_mapper,
-                original=original_item,
-                mapped_object=mapped_item,
-                data_file=original_item["path"] if "path" in original_item and issubclass(type(original_item["path"]), os.PathLike) else None,
-                **(
-                    mapped_item.get_item_data()
-                    if type(mapped_item) is MappedItem
-                    else mapped_item
-                ),
-            )
+        :param mapper:  Processor class whose `map_item()` to use
+        :param items:  Iterable of unmapped items
+        :param list rows:  Row numbers of the items, if specific rows are
+        iterated; else, items are numbered from `offset`
+        :param int offset:  Row number of the first item
+        :param bool copy_original:  Keep a copy of the unmapped item
+        :return generator:  Yields tuples of row number, original item (or
+        `None`) and `MappedItem`, or the `MapItemException` raised if the item
+        could not be mapped
+        """
+        for i, item in enumerate(items):
+            # Position of the item in the result file
+            row_number = rows[i] if rows is not None else offset + i
 
-            # If we're getting annotations, yield in items batches so we don't need to get annotations per item.
-            if get_annotations:
-                dataset_item_cache.append(dataset_item)
+            # Save original to yield, since mapping may modify the item
+            original_item = item.copy() if copy_original else None
 
-                # When we reach the batch limit or the end of the dataset,
-                # get the annotations for cached items and yield the entire thing.
-                if len(dataset_item_cache) >= item_batch_size or i == (self.num_rows - 1):
-
-                    item_ids = [dataset_item.get("id") for dataset_item in dataset_item_cache]
-
-                    # Dict with item ids for fast lookup
-                    annotations_dict = collections.defaultdict(dict)
-                    annotations = self.get_annotations_for_item(item_ids, before=annotations_before)
-                    for item_annotation in annotations:
-                        item_id = item_annotation.item_id
-                        if item_annotation:
-                            annotations_dict[item_id][item_annotation.field_id] = item_annotation.value
-
-                    # Process each dataset item
-                    for dataset_item in dataset_item_cache:
-                        item_id = dataset_item.get("id")
-                        item_annotations = annotations_dict.get(item_id, {})
-
-                        for annotation_field_id, annotation_field_items in annotation_fields.items():
-                            # Get annotation value
-                            value = item_annotations.get(annotation_field_id, "")
-
-                            # Convert list to string if needed
-                            if isinstance(value, list):
-                                value = ",".join(value)
-                            elif value != "":
-                                value = str(value)  # Ensure string type
-                            else:
-                                value = ""
+            try:
+                yield row_number, original_item, mapper.get_mapped_item(item)
+            except MapItemException as e:
+                yield row_number, original_item, e
 
-                            dataset_item[annotation_labels[annotation_field_id]] = value
+    def _map_items_in_parallel(self, mapper, num_processes, offset=0, copy_original=True, processor=None,
+                               rows_per_chunk=2500):
+        """
+        Map items of an NDJSON file in multiple processes
 
-                        yield dataset_item
+        The file is split into chunks of consecutive rows, using the row index
+        to find the byte range of each chunk. Chunks are mapped by a pool of
+        worker processes, and results are yielded in the original order. Only a
+        limited number of chunks is queued at any time, so memory use stays
+        bounded even if the consumer is slower than the workers.
 
-                    dataset_item_cache = []
+        Worker processes are started via `get_process_context()`; the mapper
+        is passed to them by reference, and imported there if needed.
+
+        :param mapper:  Processor class whose `map_item()` to use
+        :param int num_processes:  Number of worker processes
+        :param int offset:  Row to start at
+        :param bool copy_original:  Keep a copy of the unmapped item
+        :param BasicProcessor processor:  Processor iterating the dataset; its
+        `interrupted` flag is checked after every chunk
+        :param int rows_per_chunk:  Number of items per chunk
+        :return generator:  Yields the same tuples as `_map_items()`
+        """
+        path = self.get_results_path()
+        row_index = self.get_row_index(processor=processor)
+        chunk_starts = list(range(offset, row_index.num_rows, rows_per_chunk))
+        chunk_offsets = row_index.get_offsets(chunk_starts) + [path.stat().st_size]
+        chunks = [(chunk_starts[i], chunk_offsets[i], chunk_offsets[i + 1]) for i in range(len(chunk_starts))]
+
+        # the mapper is set once per worker process, via the initializer,
+        # rather than sent along with every chunk
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=num_processes, mp_context=get_process_context(),
+                                                      initializer=_set_chunk_mapper, initargs=(mapper,))
+        pending = collections.deque()
+        try:
+            for chunk in chunks:
+                pending.append(pool.submit(_map_ndjson_chunk, path, *chunk, copy_original))
+                if len(pending) < num_processes * 2:
+                    continue
+
+                if hasattr(processor, "interrupted") and processor.interrupted:
+                    raise ProcessorInterruptedException("Processor interrupted while mapping items")
+
+                yield from pending.popleft().result()
+
+            while pending:
+                if hasattr(processor, "interrupted") and processor.interrupted:
+                    raise ProcessorInterruptedException("Processor interrupted while mapping items")
+
+                yield from pending.popleft().result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
 
+    def get_mapper_version(self):
+        """
+        Get version of the code used to map this dataset's items
+
+        Combines the commit of the code the mapper is part of with a hash of
+        the file the mapper is defined in, so that local changes to the
+        mapper also result in a different version.
+
+        The version is determined once per DataSet object, since doing so
+        involves hashing the mapper's file and calling git.
+
+        :return str|None:  Version identifier, or `None` if the mapper's code
+        cannot be determined
+        """
+        if self._mapper_version:
+            return self._mapper_version
+
+        mapper = self.get_own_processor()
+        try:
+            source = Path(inspect.getfile(mapper)).read_bytes()
+        except (TypeError, OSError):
+            return None
+
+        self._mapper_version = get_software_commit(mapper)[0] + "-" + hashlib.md5(source).hexdigest()
+        return self._mapper_version
+
+    def get_mapped_item_cache(self):
+        """
+        Get cache of this dataset's mapped items
+
+        The cache is not built here; rather, it is written when the dataset's
+        items are mapped while iterating through it (see `iterate_items()`),
+        if the `4cat.cache_mapped_items` setting is enabled.
+
+        :return MappedItemCache|None:  Cache, or `None` if no valid cache
+        exists for the current version of the mapper
+        """
+        results_path = self.get_results_path()
+        if not self.is_finished() or not results_path.exists():
+            return None
+
+        mapper_version = self.get_mapper_version()
+        if not mapper_version:
+            return None
+
+        return MappedItemCache.load(self.get_index_path("mapped"), results_path, mapper_version)
+
+    def get_map_item_processes(self, rows=None, offset=0, processor=None, min_rows=10000):
+        """
+        Determine how many processes to use to map this dataset's items
+
+        Items are mapped in parallel only for NDJSON files of sufficient size
+        (starting a pool of processes is not free) when iterating through the
+        file sequentially, and if the `4cat.map_item_processes` setting allows
+        more than one process.
+
+        :param list rows:  Specific rows to be iterated, if any
+        :param int offset:  Row iteration starts at
+        :param BasicProcessor processor:  Processor iterating the dataset
+        :param int min_rows:  Minimum number of items to map
+        :return int:  Number of processes; 1 to map items in the current
+        thread
+        """
+        num_processes = convert_to_int(self.modules.config.get("4cat.map_item_processes", 1), 1)
+        if num_processes <= 1 or rows is not None or self.get_extension() != "ndjson" \
+                or self.num_rows - offset < min_rows:
+            return 1
+
+        row_index = self.get_row_index(processor=processor)
+        if not row_index or row_index.num_rows - offset < min_rows:
+            return 1
+
+        return num_processes
+
+    @staticmethod
+    def _handle_missing_fields(mapped_item, map_missing, default_strategy):
+        """
+        Handle missing fields in a mapped item
+
+        :param MappedItem mapped_item:  Item to handle missing fields for
+        :param dict map_missing:  Strategy per field
+        :param default_strategy:  Strategy for fields not in `map_missing`
+        :return MappedItem:  The mapped item, with missing fields handled
+        """
+        # check if fields have been marked as 'missing' in the
+        # underlying data, and treat according to the chosen strategy
+        for missing_field in mapped_item.get_missing_fields():
+            strategy = map_missing.get(missing_field, default_strategy)
+
+            if callable(strategy):
+                # delegate handling to a callback
+                mapped_item.data[missing_field] = strategy(
+                    mapped_item.data, missing_field
+                )
+            elif strategy == "keep":
+                # leave the MissingMappedField in place so the
+                # caller can distinguish missing from present
+                continue
+            elif strategy == "abort":
+                # raise an exception to be handled at the processor level
+                raise MappedItemIncompleteException(
+                    f"Cannot process item, field {missing_field} missing in source data."
+                )
+            elif strategy == "default":
+                # use whatever was passed to the object constructor
+                mapped_item.data[missing_field] = mapped_item.data[
+                    missing_field
+                ].value
             else:
-                yield dataset_item
+                raise ValueError(
+                    "map_missing must be 'abort', 'default', 'keep', or a callback."
+                )
+
+        return mapped_item
+
+    def _get_annotation_adder(self):
+        """
+        Get a function that adds annotations to items
+
+        Annotations are dynamically added, and we're handling them as 'extra'
+        map_item fields. Annotations are retrieved for batches of items at a
+        time, so we don't need to retrieve them one by one.
+
+        :return callable|None:  Function that takes a list of items (as
+        dictionaries) and adds annotation values to each of them, or `None` if
+        the dataset has no annotation fields
+        """
+        if not self.annotation_fields:
+            return None
+
+        annotation_fields = self.annotation_fields.copy()
+        annotations_before = int(time.time())
+
+        # Append a number to annotation labels if there's duplicate ones
+        annotation_labels = {}
+        for (annotation_field_id, annotation_field_items,) in annotation_fields.items():
+            unique_label = annotation_field_items["label"]
+            counter = 1
+            while unique_label in annotation_labels.values():
+                counter += 1
+                unique_label = f"{annotation_field_items['label']}_{counter}"
+            annotation_labels[annotation_field_id] = unique_label
+
+        def add_annotations(items):
+            """
+            Add annotation values to a batch of items
+
+            :param list items:  Items to add annotations to
+            """
+            item_ids = [item.get("id") for item in items]
+
+            # Dict with item ids for fast lookup
+            annotations_dict = collections.defaultdict(dict)
+            annotations = self.get_annotations_for_item(item_ids, before=annotations_before)
+            for item_annotation in annotations:
+                item_id = item_annotation.item_id
+                if item_annotation:
+                    annotations_dict[item_id][item_annotation.field_id] = item_annotation.value
+
+            # Process each dataset item
+            for item in items:
+                item_id = item.get("id")
+                item_annotations = annotations_dict.get(item_id, {})
+
+                for annotation_field_id in annotation_fields:
+                    # Get annotation value
+                    value = item_annotations.get(annotation_field_id, "")
+
+                    # Convert list to string if needed
+                    if isinstance(value, list):
+                        value = ",".join(value)
+                    elif value != "":
+                        value = str(value)  # Ensure string type
+                    else:
+                        value = ""
+
+                    item[annotation_labels[annotation_field_id]] = value
+
+        return add_annotations
+
+    def iterate_columns(self, columns, batch_size=10000, processor=None, **kwargs):
+        """
+        Iterate through the values of specific columns, in batches
+
+        A faster alternative to `iterate_items()` for processors that only
+        need the values of a few columns. Values are read from the dataset's
+        column store (see `get_column_store()`), so only the requested columns
+        need to be read and items do not need to be mapped again. If no
+        column store is available, or not all columns are in it (e.g. because
+        they are annotations), the items are iterated in batches instead.
 
+        Values are those of the mapped items, i.e. what `iterate_items()`
+        would yield. Items that do not have a value for a column get `None`.
+
+        :param list columns:  Names of columns to get values for
+        :param int batch_size:  Maximum number of values per batch
+        :param BasicProcessor processor:  Processor iterating the dataset
+        :param kwargs:  Passed to `iterate_batches()` if the column store
+        cannot be used
+        :return generator:  Yields dictionaries with column names as keys and
+        a list of values for each column, one per item, as values
+        """
+        column_store = self.get_column_store(processor=processor)
+        if column_store and column_store.has_columns(columns):
+            yield from column_store.iterate_batches(columns, batch_size=batch_size, processor=processor)
+            return
+
+        for items in self.iterate_batches(batch_size=batch_size, processor=processor, **kwargs):
+            yield {column: [item.get(column) for item in items] for column in columns}
 
     def sort_and_iterate_items(
-            self, sort="", reverse=False, chunk_size=50000, **kwargs
+            self, sort="", reverse=False, chunk_size=50000, offset=0, **kwargs
     ) -> dict:
         """
         Loop through items in a dataset, sorted by a given key.
@@ -704,6 +1198,56 @@ class DataSet(FourcatModule):
         This is a wrapper function for `iterate_items()` with the
         added functionality of sorting a dataset.
 
+        For CSV and NDJSON files, the sort order is stored in a sort index
+        next to the result file (see `get_sort_index()`). The dataset then
+        only needs to be sorted once; afterwards, any slice of the sorted
+        dataset (e.g. a page in the Explorer) can be read by seeking to the
+        relevant rows directly. For other files, or if no index can be made,
+        the dataset is sorted on the fly.
+
+        :param sort:				The item key that determines the sort order.
+        :param reverse:				Whether to sort by largest values first.
+        :param chunk_size:          How many items to write
+        :param int offset:          How many items of the sorted dataset to skip
+
+        :returns dict:				Yields iterated post
+        """
+        processor = kwargs.get("processor")
+        if not sort or (sort == "dataset-order" and not reverse):
+            # no sorting needed
+            yield from self.iterate_items(offset=offset, **kwargs)
+            return
+
+        row_index = self.get_row_index(processor=processor)
+        if row_index:
+            if sort == "dataset-order":
+                def get_rows(start, count):
+                    last_row = row_index.num_rows - 1 - start
+                    return list(range(last_row, max(last_row - count, -1), -1))
+            else:
+                get_annotations = bool(kwargs.get("get_annotations", True) and self.annotation_fields)
+                sort_index = self.get_sort_index(sort, reverse, get_annotations=get_annotations, processor=processor)
+                get_rows = sort_index.get_entries if sort_index else None
+
+            if get_rows:
+                # read the sorted rows in batches, so we seek through the
+                # result file only as far as the consumer actually iterates
+                start = offset
+                while rows := get_rows(start, 1000):
+                    yield from self.iterate_items(rows=rows, **kwargs)
+                    start += len(rows)
+
+                return
+
+        yield from itertools.islice(self._sort_items_on_the_fly(sort, reverse, chunk_size, **kwargs), offset, None)
+
+    def _sort_items_on_the_fly(self, sort="", reverse=False, chunk_size=50000, **kwargs):
+        """
+        Sort and iterate items without a sort index
+
+        Small datasets are sorted in memory. For large datasets, sorted chunks
+        are written to the staging area and merged.
+
         :param sort:				The item key that determines the sort order.
         :param reverse:				Whether to sort by largest values first.
         :param chunk_size:          How many items to write
@@ -884,6 +1428,316 @@ class DataSet(FourcatModule):
             if staging_area.is_dir():
                 shutil.rmtree(staging_area)
 
+    def get_index_path(self, index_type):
+        """
+        Get path to an index file for this dataset's result file
+
+        Index files are stored next to the result file and named after it,
+        with the index type as an extra extension. They contain derived data
+        and can be deleted at any time (see `delete_indexes()`).
+
+        :param str index_type:  Index type, e.g. `rowindex`
+        :return Path:  Path to the index file. It may not exist yet.
+        """
+        results_path = self.get_results_path()
+        return results_path.with_name(f"{results_path.name}.{index_type}")
+
+    def get_row_index(self, processor=None):
+        """
+        Get row offset index for this dataset's result file
+
+        The index is built the first time it is requested, and rebuilt if the
+        result file has changed since. Only finished CSV and NDJSON datasets
+        are indexed, since the result file of unfinished datasets may still
+        change.
+
+        :param BasicProcessor processor:  Processor requesting the index, if
+        any; building the index respects its interrupt flag
+        :return RowIndex|None:  Index, or `None` if none is available
+        """
+        results_path = self.get_results_path()
+        if not self.is_finished() or results_path.suffix.lower() not in (".csv", ".ndjson") \
+                or not results_path.exists():
+            return None
+
+        index_path = self.get_index_path("rowindex")
+        row_index = RowIndex.load(index_path, results_path)
+        if row_index:
+            return row_index
+
+        try:
+            return RowIndex.build(index_path, results_path, processor=processor)
+        except (OSError, csv.Error) as e:
+            # not a problem per se, iterating just becomes slower
+            self.db.log.warning(f"Could not create row index for dataset {self.key}: {e}")
+            return None
+
+    def get_sort_index(self, sort, reverse=False, get_annotations=False, processor=None):
+        """
+        Get sort index for this dataset's result file
+
+        The index stores the order of the dataset's items when sorted by the
+        given key, and is built the first time it is requested. Like the row
+        index, it is rebuilt when the result file changes. Indexes that
+        include annotations are additionally deleted when annotations are
+        saved, since those are not part of the result file.
+
+        :param str sort:  Item key to sort by
+        :param bool reverse:  Sort descending rather than ascending
+        :param bool get_annotations:  Whether annotations need to be included
+        when reading the values to sort by
+        :param BasicProcessor processor:  Processor requesting the index, if
+        any; building the index respects its interrupt flag
+        :return SortIndex|None:  Index, or `None` if none is available
+        """
+        results_path = self.get_results_path()
+        if not self.is_finished() or results_path.suffix.lower() not in (".csv", ".ndjson") \
+                or not results_path.exists():
+            return None
+
+        index_type = "sortindex-" + ("annotated-" if get_annotations else "") + hash_to_md5(sort) + \
+                     ("-desc" if reverse else "-asc")
+        index_path = self.get_index_path(index_type)
+        sort_index = SortIndex.load(index_path, results_path)
+        if sort_index:
+            return sort_index
+
+        values = (
+            (item.row_number, item.get(sort, ""))
+            for item in self.iterate_items(processor=processor, warn_unmappable=False, get_annotations=get_annotations)
+        )
+
+        try:
+            return SortIndex.build(index_path, results_path, values, reverse=reverse, processor=processor)
+        except (OSError, csv.Error) as e:
+            self.db.log.warning(f"Could not create sort index for dataset {self.key}: {e}")
+            return None
+
+    def get_column_store(self, processor=None):
+        """
+        Get columnar copy of this dataset's mapped items
+
+        Only available if the `4cat.cache_columns` setting is enabled. The
+        store is built the first time it is requested, and rebuilt if the
+        result file or the mapper has changed since. Like the indexes, it is
+        only available for finished CSV and NDJSON datasets. Annotations are not included,
+        since they can change independently of the result file.
+
+        :param BasicProcessor processor:  Processor requesting the store, if
+        any; building the store respects its interrupt flag
+        :return ColumnStore|None:  Store, or `None` if none is available
+        """
+        # the store is a copy of the whole dataset, so only use it if disk
+        # space may be used for that
+        if self.modules.config.get("4cat.cache_columns", False) is not True:
+            return None
+
+        results_path = self.get_results_path()
+        if not self.is_finished() or results_path.suffix.lower() not in (".csv", ".ndjson") \
+                or not results_path.exists():
+            return None
+
+        # the store contains mapped values, so must be rebuilt if the mapper
+        # changes
+        mapper_version = self.get_mapper_version()
+        if not mapper_version:
+            return None
+
+        store_path = self.get_index_path("columns")
+        column_store = ColumnStore.load(store_path, results_path, mapper_version)
+        if column_store:
+            return column_store
+
+        try:
+            return ColumnStore.build(store_path, results_path, mapper_version,
+                                     self.iterate_items(processor=processor, get_annotations=False), processor=processor)
+        except (OSError, csv.Error) as e:
+            self.db.log.warning(f"Could not create column store for dataset {self.key}: {e}")
+            return None
+
+    def delete_indexes(self, index_type="*"):
+        """
+        Delete index files for this dataset's result file
+
+        :param str index_type:  Type of index to delete; `*` to delete all
+        """
+        results_path = self.get_results_path()
+        if not results_path.parent.exists():
+            return
+
+        for index_file in results_path.parent.glob(f"{results_path.name}.{index_type}"):
+            try:
+                if index_file.is_dir():
+                    shutil.rmtree(index_file)
+                else:
+                    index_file.unlink()
+            except FileNotFoundError:
+                # deleted concurrently
+                pass
+
+    def get_view_path(self):
+        """
+        Get path to the row selection of a view
+
+        Datasets that are a view of another dataset (see `is_view()`) do not
+        have a result file; instead, the rows they consist of are stored in
+        this file. Unlike indexes, this file is not removed by
+        `delete_indexes()`.
+
+        :return Path:  Path to the row selection file. It may not exist.
+        """
+        return self.get_results_path().with_suffix(".view")
+
+    def is_view(self):
+        """
+        Check if this dataset is a view of another dataset
+
+        A view has no result file of its own; its items are a selection of
+        the rows of another dataset's result file. Views can be iterated
+        like any other dataset, but code that needs the result file itself
+        should call `materialise()` first.
+
+        :return bool:  Whether the dataset is a view
+        """
+        return bool(self.parameters.get("view_of")) and not self.get_results_path().exists()
+
+    def get_view_source(self):
+        """
+        Get the dataset this dataset is a view of
+
+        :return DataSet|None:  Dataset, or `None` if this dataset is not a
+        view
+        """
+        if not self.is_view():
+            return None
+
+        return DataSet(key=self.parameters["view_of"], db=self.db, modules=self.modules)
+
+    def get_row_selection(self, source=None, processor=None):
+        """
+        Get the rows of the source dataset that a view consists of
+
+        :param DataSet source:  Dataset this dataset is a view of; looked up
+        if not given
+        :param BasicProcessor processor:  Processor requesting the selection,
+        if any
+        :return RowSelection:  Selection
+        """
+        if source is None:
+            source = self.get_view_source()
+
+        row_index = source.get_row_index(processor=processor)
+        selection = RowSelection.load(self.get_view_path(), row_index.num_rows) if row_index else None
+        if not selection:
+            raise DataSetException(f"Row selection of dataset {self.key} is missing or does not match the result "
+                                   f"file of dataset {source.key}")
+
+        return selection
+
+    def save_as_view(self, source, rows, processor=None):
+        """
+        Store this dataset as a view of another dataset
+
+        Rather than writing the given rows of the source dataset to this
+        dataset's result file, only the row numbers are stored. If the
+        source dataset is itself a view, this dataset becomes a view of the
+        dataset that one is a view of, so views never need to be resolved
+        more than one level deep.
+
+        :param DataSet source:  Dataset the rows are from
+        :param rows:  Zero-based row numbers of the items of the source
+        dataset to include, e.g. `DatasetItem.row_number`
+        :param BasicProcessor processor:  Processor creating the view, if any
+        :return int:  Number of rows in the view
+        """
+        if source.is_view():
+            selected = source.get_row_selection(processor=processor).get_rows()
+            rows = [int(selected[row]) for row in rows]
+            source = source.get_view_source()
+
+        row_index = source.get_row_index(processor=processor)
+        if not row_index:
+            raise DataSetException(f"Cannot create a view of dataset {source.key} without a row index")
+
+        selection = RowSelection.from_rows(rows, row_index.num_rows)
+        selection.write(self.get_view_path())
+        self.view_of = source.key
+
+        return selection.num_selected
+
+    def materialise(self, processor=None):
+        """
+        Write the items of a view to a result file of its own
+
+        Needed before the result file can be downloaded or read directly.
+        Afterwards, the dataset is no longer a view. Nothing happens if the
+        dataset is not a view.
+
+        :param BasicProcessor processor:  Processor requesting this, if any;
+        its interrupt flag is respected
+        """
+        if not self.is_view():
+            return
+
+        results_path = self.get_results_path()
+        temp_path = get_temporary_path(results_path)
+        try:
+            with temp_path.open("w", encoding="utf-8", newline="") as outfile:
+                writer = None
+                for item in self._iterate_items(processor=processor):
+                    if results_path.suffix.lower() == ".csv":
+                        if not writer:
+                            writer = csv.DictWriter(outfile, fieldnames=item.keys())
+                            writer.writeheader()
+                        writer.writerow(item)
+                    else:
+                        outfile.write(json.dumps(item) + "\n")
+
+            os.replace(temp_path, results_path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+        self.get_view_path().unlink(missing_ok=True)
+        self.delete_parameter("view_of")
+
+    def materialise_views(self, sources=None):
+        """
+        Give views of datasets a result file of their own
+
+        Needed before deleting the datasets the views are of. This is done
+        regardless of the `4cat.filter_views` setting, which only determines
+        whether new views are created.
+
+        :param list sources:  Datasets to materialise the views of; defaults
+        to this dataset. Views that are among these datasets themselves are
+        skipped.
+        """
+        keys = {source.key for source in (sources or [self])}
+
+        # only parse the parameters of datasets that may be views of one of
+        # these datasets, rather than those of every dataset
+        candidates = self.db.fetchall("SELECT key, parameters FROM datasets WHERE parameters LIKE %s "
+                                      "AND parameters LIKE ANY(%s)",
+                                      ('%"view_of"%', [f"%{key}%" for key in keys]))
+        for candidate in candidates:
+            if candidate["key"] in keys:
+                continue
+
+            try:
+                view_of = json.loads(candidate["parameters"]).get("view_of")
+            except (json.JSONDecodeError, TypeError, AttributeError):
+                continue
+
+            if view_of not in keys:
+                continue
+
+            try:
+                DataSet(key=candidate["key"], db=self.db, modules=self.modules).materialise()
+            except DataSetException:
+                # deleted in the meantime
+                pass
+
     def get_staging_area(self):
         """
         Get path to a temporary folder in which files can be stored before
@@ -1044,6 +1898,9 @@ class DataSet(FourcatModule):
         if shallow:
             # use the same result file
             copy.result_file = self.result_file
+        elif self.is_view():
+            # the copy is a view of the same dataset
+            shutil.copy(self.get_view_path(), copy.get_view_path())
         else:
             # copy to new file with new key
             shutil.copy(self.get_results_path(), copy.get_results_path())
@@ -1068,17 +1925,35 @@ class DataSet(FourcatModule):
         because logs can be useful for debugging even after a dataset is deleted. Hanging logs
         are automatically deleted by TempFileCleaner after a certain amount of time.
         """
-        # first, recursively delete children
-        children = self.db.fetchall(
-            "SELECT * FROM datasets WHERE key_parent = %s", (self.key,)
-        )
-        for child in children:
-            try:
-                child = DataSet(key=child["key"], db=self.db, modules=self.modules)
-                child.delete(commit=commit, delete_log=delete_log)
-            except DataSetException:
-                # dataset already deleted - race condition?
-                pass
+        # first, delete children, and their children, et cetera
+        # all of these are loaded at once, and a dataset's descendants are
+        # deleted before the dataset itself
+        self.load_tree()
+        children = self.get_all_children(update=False)
+
+        # views in the tree are deleted anyway, so only look for views
+        # elsewhere once, for the whole tree
+        self.materialise_views([self, *children])
+        for child in reversed(children):
+            child.delete_own_data(commit=commit, delete_log=delete_log, materialise_views=False)
+
+        self.delete_own_data(commit=commit, delete_log=delete_log, materialise_views=False)
+
+    def delete_own_data(self, commit=True, delete_log=False, materialise_views=True):
+        """
+        Delete the dataset, but not its children
+
+        Use `delete()` instead, unless the children are deleted separately;
+        a dataset's children cannot exist without it.
+
+        :param bool commit:  Commit SQL DELETE query?
+        :param bool delete_log:  Whether to also delete the log file
+        :param bool materialise_views:  Give views of this dataset a result
+        file of their own first? Only skip this if that has been done already.
+        """
+        # views of this dataset cannot exist without its result file
+        if materialise_views:
+            self.materialise_views()
 
         # delete any queued jobs for this dataset
         try:
@@ -1106,7 +1981,7 @@ class DataSet(FourcatModule):
         # delete annotations that have been generated as part of this dataset
         self.db.delete("annotations", where={"from_dataset": self.key}, commit=commit)
         # delete annotation fields on parent dataset(s) stemming from this dataset
-        for related_dataset in self.get_genealogy(update_cache=True):
+        for related_dataset in self.get_genealogy():
             field_deleted = False
             annotation_fields = related_dataset.annotation_fields
             if annotation_fields:
@@ -1123,7 +1998,8 @@ class DataSet(FourcatModule):
         self.db.delete("users_favourites", where={"key": self.key}, commit=commit)
 
         # delete from drive
-        files_to_delete = [self.get_results_path()] + ([self.get_results_path().with_suffix(".log")] if delete_log else [])
+        self.delete_indexes()
+        files_to_delete = [self.get_results_path(), self.get_view_path()] + ([self.get_results_path().with_suffix(".log")] if delete_log else [])
         for path in files_to_delete:
             try:
                 if path.exists():
@@ -1182,9 +2058,11 @@ class DataSet(FourcatModule):
 
         :return bool:  Whether the dataset is rankable or not
         """
+        # a view has the same columns as the dataset it is a view of
+        results_path = self.get_view_source().get_results_path() if self.is_view() else self.get_results_path()
         if (
-                self.get_results_path().suffix != ".csv"
-                or not self.get_results_path().exists()
+                results_path.suffix != ".csv"
+                or not results_path.exists()
         ):
             return False
 
@@ -1192,7 +2070,7 @@ class DataSet(FourcatModule):
         if multiple_items:
             column_options.add("word_1")
 
-        with self.get_results_path().open(encoding="utf-8") as infile:
+        with results_path.open(encoding="utf-8") as infile:
             reader = csv.DictReader(infile)
             try:
                 return len(set(reader.fieldnames) & column_options) >= 3
@@ -1353,19 +2231,42 @@ class DataSet(FourcatModule):
             # not recursive, since we're calling it from recursive code!
             child.copy_ownership_from(self, recursive=False)
 
-    def refresh_owners(self):
+    def refresh(self, current=None):
+        """
+        Reload the dataset's record from the database
+
+        Needed if the dataset may have been updated elsewhere, e.g. by a
+        processor running in a child process, since this object otherwise
+        keeps the values it was loaded with.
+
+        :param dict current:  The dataset's row in the `datasets` table, if
+        it has already been retrieved
+        """
+        if current is None:
+            current = self.db.fetchone("SELECT * FROM datasets WHERE key = %s", (self.key,))
+
+        if not current:
+            raise DataSetNotFoundException(f"Dataset {self.key} no longer exists")
+
+        self.data = current
+        self.parameters = json.loads(self.data["parameters"])
+        self.annotation_fields = json.loads(self.data["annotation_fields"]) \
+            if self.data.get("annotation_fields") else {}
+
+    def refresh_owners(self, owners=None):
         """
         Update internal owner cache
 
         This makes sure that the list of *users* and *tags* which can access the
         dataset is up to date.
+
+        :param list owners:  This dataset's rows in the `datasets_owners`
+        table, if these have already been retrieved
         """
-        self.owners = {
-            owner["name"]: owner
-            for owner in self.db.fetchall(
-                "SELECT * FROM datasets_owners WHERE key = %s", (self.key,)
-            )
-        }
+        if owners is None:
+            owners = self.db.fetchall("SELECT * FROM datasets_owners WHERE key = %s", (self.key,))
+
+        self.owners = {owner["name"]: owner for owner in owners}
 
         # determine which users (if any) are owners of the dataset by having a
         # tag that is listed as an owner
@@ -1437,8 +2338,9 @@ class DataSet(FourcatModule):
 
         :return list:  List of dataset columns; empty list if unable to parse
         """
-        if not self.get_results_path().exists():
-            # no file to get columns from
+        if not self.get_results_path().exists() and not self.is_view():
+            # no file to get columns from; views have none, but their items
+            # can be iterated like those of any other dataset
             return []
 
         if (self.get_results_path().suffix.lower() == ".csv") or (
@@ -1916,27 +2818,10 @@ class DataSet(FourcatModule):
         :return list:  Dataset genealogy, oldest dataset first
         """
         if not self._genealogy or update_cache:
-            key_parent = self.key_parent
-            genealogy = []
-
-            while key_parent:
-                try:
-                    parent = DataSet(key=key_parent, db=self.db, modules=self.modules)
-                except DataSetException:
-                    break
-
-                genealogy.append(parent)
-                if parent.key_parent:
-                    key_parent = parent.key_parent
-                else:
-                    break
-
-            genealogy.reverse()
-
-            # add self to the end
-            genealogy.append(self)
-            # cache the result
-            self._genealogy = genealogy
+            if self.key_parent:
+                self.load_tree(descendants=False)
+            else:
+                self._genealogy = [self]
 
         # return a copy to prevent external modification
         return list(self._genealogy)
@@ -1971,6 +2856,12 @@ class DataSet(FourcatModule):
 
         :return list:  List of DataSets
         """
+        if recursive and update:
+            # load all descendants at once, rather than the children of each
+            # dataset separately
+            self.load_tree(ancestors=False, refresh=True)
+            update = False
+
         children = self.get_children(update=update)
         results = children.copy()
         if recursive:
@@ -1979,6 +2870,112 @@ class DataSet(FourcatModule):
 
         return results
 
+    def load_tree(self, ancestors=True, descendants=True, refresh=False):
+        """
+        Load the datasets above and/or below this one
+
+        Rather than querying the parent or children of each dataset in turn,
+        all of them are retrieved with a single recursive query. The cached
+        genealogy (see `get_genealogy()`) and children (see `get_children()`)
+        of all datasets in the tree are then set accordingly.
+
+        Datasets in the tree share an identity map, i.e. a dictionary of
+        dataset objects by key; a dataset that is already in it is re-used
+        rather than instantiated again. Datasets loaded at different times
+        (e.g. in the same request or job) thus are the same object.
+
+        :param bool ancestors:  Load the parent, its parent, et cetera
+        :param bool descendants:  Load the children, their children, et cetera
+        :param bool refresh:  Update datasets that were already in the
+        identity map with their current record, rather than keeping the
+        values they were loaded with
+        """
+        if self.identity_map is None:
+            self.identity_map = {}
+
+        self.identity_map[self.key] = self
+
+        # keys are determined separately from the rows, so that UNION can
+        # discard duplicates and a cycle in the hierarchy (which should not
+        # exist, but still) does not lead to infinite recursion
+        subqueries = {}
+        replacements = []
+        if ancestors:
+            subqueries["ancestors"] = """ancestors(key, key_parent) AS (
+                    SELECT key, key_parent FROM datasets WHERE key = %s
+                UNION
+                    SELECT datasets.key, datasets.key_parent FROM datasets, ancestors
+                    WHERE datasets.key = ancestors.key_parent
+            )"""
+            replacements.append(self.key_parent)
+
+        if descendants:
+            subqueries["descendants"] = """descendants(key) AS (
+                    SELECT %s::text
+                UNION
+                    SELECT datasets.key FROM datasets, descendants WHERE datasets.key_parent = descendants.key
+            )"""
+            replacements.append(self.key)
+
+        if not subqueries:
+            return
+
+        tree_keys = " UNION ".join([f"SELECT key FROM {name}" for name in subqueries])
+        rows = self.db.fetchall(
+            f"WITH RECURSIVE {', '.join(subqueries.values())} "
+            f"SELECT * FROM datasets WHERE key IN ({tree_keys}) AND key != %s ORDER BY timestamp ASC",
+            (*replacements, self.key)
+        )
+
+        datasets = {self.key: self}
+        new_datasets = []
+        for row in rows:
+            dataset = self.identity_map.get(row["key"])
+            if not dataset:
+                dataset = DataSet(data=row, db=self.db, modules=self.modules, check_owners=False)
+                dataset.identity_map = self.identity_map
+                self.identity_map[dataset.key] = dataset
+                new_datasets.append(dataset)
+            elif refresh:
+                dataset.refresh(row)
+
+            datasets[row["key"]] = dataset
+
+        # owners of all new datasets at once, too
+        if new_datasets:
+            owners = {dataset.key: [] for dataset in new_datasets}
+            for owner in self.db.fetchall("SELECT * FROM datasets_owners WHERE key IN %s", (tuple(owners),)):
+                owners[owner["key"]].append(owner)
+
+            for dataset in new_datasets:
+                dataset.refresh_owners(owners=owners[dataset.key])
+
+        if ancestors:
+            genealogy = [self]
+            while genealogy[-1].key_parent in datasets and datasets[genealogy[-1].key_parent] not in genealogy:
+                genealogy.append(datasets[genealogy[-1].key_parent])
+
+            genealogy.reverse()
+            for depth, dataset in enumerate(genealogy):
+                dataset._genealogy = genealogy[:depth + 1]
+
+        if descendants:
+            children = {}
+            for row in rows:
+                children.setdefault(row["key_parent"], []).append(datasets[row["key"]])
+
+            queue = [self]
+            seen = {self.key}
+            while queue:
+                dataset = queue.pop(0)
+                dataset._children = [child for child in children.get(dataset.key, []) if child.key not in seen]
+                for child in dataset._children:
+                    seen.add(child.key)
+                    if dataset._genealogy:
+                        child._genealogy = dataset._genealogy + [child]
+
+                queue.extend(dataset._children)
+
     def nearest(self, type_filter):
         """
         Return nearest dataset that matches the given type
@@ -2021,6 +3018,10 @@ class DataSet(FourcatModule):
         specify accepted types (via the `is_compatible_with` method), it is
         assumed it accepts any top-level datasets
 
+        The outcome of checks that only depend on the dataset's type,
+        extension, et cetera (see `Compatibility.get_shape()`) is cached in
+        the module collector, and shared by all datasets of the same shape.
+
         :param ConfigManager|None config:  Configuration reader to determine
         compatibility through. This may not be the same reader the dataset was
         instantiated with, e.g. when checking whether some other user should
@@ -2028,22 +3029,62 @@ class DataSet(FourcatModule):
         :return dict:  Compatible processors, `name => class` mapping
         """
         processors = self.modules.processors
+        own_processor = self.get_own_processor()
+        cache = self.modules.compatibility_cache
+
+        # whether a processor can run on a dataset of a given type, extension,
+        # et cetera does not depend on the dataset itself, so that part of the
+        # check is only done once per combination of these
+        shape = (own_processor.type if own_processor else None, *Compatibility.get_shape(self))
+        if shape not in cache["shapes"]:
+            candidates = []
+            for processor_type in processors:
+                # check what we can without importing the processor's module
+                metadata = self.modules.get_metadata(processor_type)
+                if metadata.get("is_from_collector"):
+                    continue
+
+                if own_processor and own_processor.exclude_followup_processors(
+                        processor_type
+                ):
+                    continue
+
+                if metadata.get("compatibility") is not None and \
+                        any(metadata["compatibility"].unmet_shape_requirements(self)):
+                    continue
+
+                candidates.append(processor_type)
+
+            cache["shapes"][shape] = candidates
 
         available = {}
-        for processor_type, processor in processors.items():
-            if processor.is_from_collector():
+        for processor_type in cache["shapes"][shape]:
+            processor = processors[processor_type]
+            compatibility = self.modules.get_metadata(processor_type).get("compatibility")
+            if compatibility is None:
+                # processor overrides `is_compatible_with`, or declares no
+                # `compatibility`; undeclared processors default to
+                # top-level-only
+                if processor.is_compatible_with(self, config=config):
+                    available[processor_type] = processor
                 continue
 
-            own_processor = self.get_own_processor()
-            if own_processor and own_processor.exclude_followup_processors(
-                    processor_type
-            ):
+            if any(compatibility.unmet_dataset_requirements(self)):
                 continue
 
-            # evaluates processor's declarative `compatibility`
-            # undeclared processors default to top-level-only
-            if processor.is_compatible_with(self, config=config):
-                available[processor_type] = processor
+            # settings can change at any time, so the environment check is
+            # cached per value of the settings it reads. Only positive
+            # outcomes are cached, since a missing executable may still be
+            # installed without restarting 4CAT
+            settings = compatibility.get_required_settings(config)
+            environment_key = (processor_type, repr(sorted(settings.items())))
+            if environment_key not in cache["environment"]:
+                if any(compatibility.unmet_environment_requirements(settings=settings)):
+                    continue
+
+                cache["environment"][environment_key] = True
+
+            available[processor_type] = processor
 
         return available
 
@@ -2225,11 +3266,16 @@ class DataSet(FourcatModule):
 
         :return DataSet:  Parent dataset, or `None` if not applicable
         """
-        return (
-            DataSet(key=self.key_parent, db=self.db, modules=self.modules)
-            if self.key_parent
-            else None
-        )
+        if not self.key_parent:
+            return None
+
+        # the parent is part of the genealogy, so use that instance
+        genealogy = self.get_genealogy()
+        if len(genealogy) > 1:
+            return genealogy[-2]
+
+        # raises an exception if the parent does not exist
+        return DataSet(key=self.key_parent, db=self.db, modules=self.modules)
 
     def detach(self):
         """
@@ -2342,7 +3388,7 @@ class DataSet(FourcatModule):
 
         :return str extension:  Extension, e.g. `csv`
         """
-        if self.get_results_path().exists():
+        if self.get_results_path().exists() or self.is_view():
             return self.get_results_path().suffix[1:]
 
         return False
@@ -2382,6 +3428,9 @@ class DataSet(FourcatModule):
         """ Returns a list of media filenames that have been downloaded
             via video or image download child processors
 
+        Uses the media index of each child (see `get_media_index()`), so
+        only the entries for the requested items need to be read.
+
         :param list item_ids:   A list of item IDs to limit the filename retrieval to.
         returns dict: item_id as key and a list of tuples (child dataset key -> filename) as items
         """
@@ -2390,15 +3439,15 @@ class DataSet(FourcatModule):
         if not children:
             return {}
 
-        if item_ids is None:
-            item_ids = []
+        # an empty list of IDs means all items
+        item_ids = [str(item_id) for item_id in item_ids] if item_ids else None
 
         media_map = {}
 
         # Get children that are image/video downloaders
         media_datasets = [
             p for p in children
-            if ("video-downloader" in p.type or "image-downloader" in p.type) and p.data.get("num_rows", 0) > 0 and p.is_finished()
+            if p.is_media_download() and p.data.get("num_rows", 0) > 0 and p.is_finished()
         ]
 
         # Loop through media datasets and create a map of dataset key -> filenames
@@ -2406,61 +3455,57 @@ class DataSet(FourcatModule):
         seen_files = set()
 
         for media_dataset in media_datasets:
-            for item in media_dataset.iterate_items():
-
-                if item.file.name == ".metadata.json":
-                    with item.file.open() as infile:
-                        metadata = json.load(infile)
-
-                        for url_key, item_metadata in metadata.items():
-                            media_items = set()
-                            post_ids = item_metadata.get("post_ids", [])  # Required
+            media_index = media_dataset.get_media_index()
+            if not media_index:
+                continue
 
-                            if not post_ids:
-                                continue
+            for post_id, filenames in media_index.get_media(item_ids).items():
+                for filename in filenames:
+                    # Don't add post_id -> filename couplings that we've already seen
+                    if (post_id, filename) in seen_files:
+                        continue
 
-                            # Make sure we're matching and passing strings
-                            post_ids = [str(p_id) for p_id in post_ids]
-                            item_ids = [str(i_id) for i_id in item_ids]
+                    seen_files.add((post_id, filename))
+                    if post_id not in media_map:
+                        media_map[post_id] = []
 
-                            # Skip items that are not in the requested item_ids
-                            if item_ids and not any(p_id in item_ids for p_id in post_ids):
-                                continue
+                    media_map[post_id].append((media_dataset.key, filename))
 
-                            # Single file (images usually format like this)
-                            is_success = item_metadata.get("success", True)
+        return media_map
 
-                            if is_success and "filename" in item_metadata:
-                                media_info = (media_dataset.key, item_metadata["filename"])
-                                media_items.add(media_info)
+    def is_media_download(self):
+        """
+        Check whether this dataset contains downloaded images or videos
 
-                            # Multiple files (videos with the 'files' array)
-                            if item_metadata.get("files"):
-                                for file in item_metadata["files"]:
-                                    if file.get("success") and "filename" in file:
-                                        media_info = (media_dataset.key, file["filename"])
-                                        media_items.add(media_info)
+        :return bool:
+        """
+        return "video-downloader" in self.type or "image-downloader" in self.type
 
-                            if not media_items:
-                                continue
+    def get_media_index(self):
+        """
+        Get index of the media files in this dataset per item
 
-                            # Append to post_id list
-                            for post_id in post_ids:
-                                if post_id not in media_map:
-                                    media_map[post_id] = []
+        The index is built the first time it is requested, and rebuilt if the
+        result file has changed since. Only finished datasets with downloaded
+        media are indexed.
 
-                                for media_item in media_items:
-                                    if media_item not in media_map[post_id]:
-                                        # Don't add post_id -> filename couplings that we've already seen
-                                        media_ref = (post_id, media_item[1])
-                                        if media_ref not in seen_files:
-                                            media_map[post_id].append(media_item)
-                                        seen_files.add(media_ref)
+        :return MediaIndex|None:  Index, or `None` if none is available
+        """
+        results_path = self.get_results_path()
+        if not self.is_finished() or not self.is_media_download() or results_path.suffix.lower() != ".zip" \
+                or not results_path.exists():
+            return None
 
-                    # break after .metadata.json
-                    break
+        index_path = self.get_index_path("mediaindex")
+        media_index = MediaIndex.load(index_path, results_path)
+        if media_index:
+            return media_index
 
-        return media_map
+        try:
+            return MediaIndex.build(index_path, results_path)
+        except OSError as e:
+            self.db.log.warning(f"Could not create media index for dataset {self.key}: {e}")
+            return None
 
     def get_metadata(self):
         """
@@ -2659,8 +3704,8 @@ class DataSet(FourcatModule):
         if not annotations:
             return 0
 
-        count = 0
         annotation_fields = self.annotation_fields
+        default_author = None
 
         # Add some dataset data to annotations, if not present
         for annotation_data in annotations:
@@ -2690,18 +3735,22 @@ class DataSet(FourcatModule):
             # Set default author to this dataset owner
             # If this annotation is made by a processor, it will have the processor name
             if not annotation_data.get("author"):
-                annotation_data["author"] = self.get_owners()[0]
+                if default_author is None:
+                    default_author = self.get_owners()[0]
+                annotation_data["author"] = default_author
 
-            # Create Annotation object, which also saves it to the database
-            # If this dataset/item_id/field_id combination already exists, this retrieves the
-            # existing data and updates it with new values.
-            Annotation(data=annotation_data, db=self.db)
-            count += 1
+        # Save to the database in bulk
+        # If a dataset/item_id/field_id combination already exists, the
+        # existing annotation is updated with the new values.
+        count = Annotation.save_many(self.db, annotations)
 
         # Save annotation fields if things changed
         if annotation_fields != self.annotation_fields:
             self.save_annotation_fields(annotation_fields)
 
+        # Sort orders based on annotations may have changed
+        self.delete_indexes("sortindex-annotated-*")
+
         return count
 
     def save_annotation_fields(self, new_fields: dict, add=False) -> int:
@@ -2791,6 +3840,8 @@ class DataSet(FourcatModule):
                 self.key, old_fields, new_fields, self.db
             )
 
+        self.delete_indexes("sortindex-annotated-*")
+
         return len(new_fields)
 
     def get_annotation_metadata(self) -> dict:
@@ -2874,3 +3925,45 @@ class DataSet(FourcatModule):
 
         if attr == "parameters":
             self.parameters = json.loads(value)
+
+
+#: Processor class used for mapping in worker processes
+_chunk_mapper = None
+
+
+def _set_chunk_mapper(mapper):
+    """
+    Set processor class to map items with in a worker process
+
+    :param mapper:  Processor class whose `map_item()` to use
+    """
+    global _chunk_mapper
+    _chunk_mapper = mapper
+
+
+def _map_ndjson_chunk(path, start_row, start_byte, end_byte, copy_original=True):
+    """
+    Map the items in a byte range of an NDJSON file
+
+    Used by `DataSet._map_items_in_parallel()`; this runs in a worker process,
+    and is a module-level function so it can be passed to one. Items are
+    mapped with the mapper set via `_set_chunk_mapper()`.
+
+    :param Path path:  Path to NDJSON file
+    :param int start_row:  Row number of the first item in the range
+    :param int start_byte:  Offset of the first item in the file
+    :param int end_byte:  Offset at which the range ends
+    :param bool copy_original:  Keep a copy of the unmapped item
+    :return list:  Tuples of row number, original item (or `None`) and
+    `MappedItem` (or `MapItemException`), as for `DataSet._map_items()`
+    """
+    with path.open("rb") as infile:
+        infile.seek(start_byte)
+        lines = infile.read(end_byte - start_byte).split(b"\n")
+
+    if not lines[-1]:
+        # after the final line break
+        lines.pop()
+
+    items = (json.loads(line) for line in lines)
+    return list(DataSet._map_items(_chunk_mapper, items, offset=start_row, copy_original=copy_original))
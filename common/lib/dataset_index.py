@@ -0,0 +1,1156 @@
+"""
+Persistent indexes stored alongside dataset result files
+
+These are 'sidecar' files that make it cheaper to read parts of a dataset
+without having to parse the full result file every time. They are derived
+data: they can always be deleted and will then be rebuilt when needed.
+"""
+import itertools
+import heapq
+import struct
+import zipfile
+import zlib
+import shutil
+import json
+import uuid
+import csv
+import os
+
+import numpy as np
+
+from common.lib.exceptions import ProcessorInterruptedException, MapItemException
+from common.lib.item_mapping import MappedItem, MissingMappedField
+
+
+def get_temporary_path(path):
+    """
+    Get path to write a file to before moving it into place
+
+    The path is unique for each call, since the same index may be built by
+    several threads or processes at the same time, e.g. by the web tool and
+    a processor.
+
+    :param Path path:  Path the file will be moved to
+    :return Path:  Temporary path
+    """
+    return path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+
+
+class SidecarIndex:
+    """
+    Base class for index files stored next to a result file
+
+    An index file consists of a fixed-size header followed by one unsigned
+    64-bit integer per entry. Looking up an entry thus only requires reading
+    eight bytes from the index file, regardless of dataset size. The header
+    records the size and modification time of the result file at the time
+    the index was built; if either no longer matches the index is considered
+    stale and must be rebuilt.
+    """
+    #: File signature, to recognise index files (and their format version)
+    MAGIC = None
+
+    #: Header: magic, result file size, result file mtime (ns), number of entries
+    HEADER = struct.Struct("<8sQQQ")
+
+    #: One value per entry
+    ENTRY = struct.Struct("<Q")
+
+    path = None
+    num_rows = 0
+
+    def __init__(self, path, num_rows):
+        """
+        Instantiate index reader
+
+        Use `load()` or `build()` rather than calling this directly.
+
+        :param Path path:  Path to index file
+        :param int num_rows:  Number of entries in the index
+        """
+        self.path = path
+        self.num_rows = num_rows
+
+    @classmethod
+    def get_fingerprint(cls, data_path):
+        """
+        Get fingerprint of a result file
+
+        Used to determine whether an index still matches the file it was
+        built for.
+
+        :param Path data_path:  Path to result file
+        :return tuple:  File size and modification time (in nanoseconds)
+        """
+        stat = data_path.stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    @classmethod
+    def load(cls, index_path, data_path):
+        """
+        Load an existing index
+
+        :param Path index_path:  Path to index file
+        :param Path data_path:  Path to the result file the index is for
+        :return SidecarIndex|None:  Index, or `None` if no valid (non-stale)
+        index exists at the given path
+        """
+        if not index_path.exists() or not data_path.exists():
+            return None
+
+        try:
+            with index_path.open("rb") as infile:
+                header = infile.read(cls.HEADER.size)
+        except OSError:
+            return None
+
+        if len(header) != cls.HEADER.size:
+            return None
+
+        magic, size, mtime, num_rows = cls.HEADER.unpack(header)
+        if magic != cls.MAGIC or (size, mtime) != cls.get_fingerprint(data_path):
+            return None
+
+        if index_path.stat().st_size != cls.HEADER.size + num_rows * cls.ENTRY.size:
+            # incomplete or corrupted
+            return None
+
+        return cls(index_path, num_rows)
+
+    @classmethod
+    def write(cls, index_path, fingerprint, entries, processor=None):
+        """
+        Write an index file
+
+        The index is written to a temporary file first and then moved into
+        place, so concurrent readers never see a partially written index.
+
+        :param Path index_path:  Where to write the index
+        :param tuple fingerprint:  Fingerprint of the result file, as
+        returned by `get_fingerprint()`
+        :param entries:  Iterable of integers to store
+        :param processor:  Processor that requested the index, if any. Its
+        `interrupted` flag is respected while writing.
+        :return SidecarIndex:  The freshly written index
+        """
+        temp_path = get_temporary_path(index_path)
+        num_rows = 0
+        try:
+            with temp_path.open("wb") as outfile:
+                # header is rewritten once the number of entries is known
+                outfile.write(cls.HEADER.pack(cls.MAGIC, *fingerprint, 0))
+                for entry in entries:
+                    if num_rows % 10000 == 0 and hasattr(processor, "interrupted") and processor.interrupted:
+                        raise ProcessorInterruptedException("Interrupted while building index")
+
+                    outfile.write(cls.ENTRY.pack(entry))
+                    num_rows += 1
+
+                outfile.seek(0)
+                outfile.write(cls.HEADER.pack(cls.MAGIC, *fingerprint, num_rows))
+
+            os.replace(temp_path, index_path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+        return cls(index_path, num_rows)
+
+    def get_entries(self, start=0, count=None):
+        """
+        Read a consecutive range of entries
+
+        :param int start:  Index of first entry to read
+        :param int count:  Number of entries to read; `None` to read until
+        the end of the index
+        :return list:  Entries. May be shorter than `count` (or empty) if the
+        end of the index is reached.
+        """
+        start = max(0, start)
+        end = self.num_rows if count is None else min(self.num_rows, start + count)
+        if start >= end:
+            return []
+
+        with self.path.open("rb") as infile:
+            infile.seek(self.HEADER.size + start * self.ENTRY.size)
+            data = infile.read((end - start) * self.ENTRY.size)
+
+        return [entry[0] for entry in self.ENTRY.iter_unpack(data)]
+
+
+class RowIndex(SidecarIndex):
+    """
+    Byte offset index for CSV and NDJSON result files
+
+    Stores the byte offset at which every item in a result file starts, so
+    that iteration can start at an arbitrary item by seeking to that offset
+    instead of parsing and discarding all items before it.
+    """
+    MAGIC = b"4CATRIX1"
+
+    @classmethod
+    def build(cls, index_path, data_path, processor=None):
+        """
+        Build index for a result file
+
+        :param Path index_path:  Where to write the index
+        :param Path data_path:  Path to the CSV or NDJSON file to index
+        :param processor:  Processor that requested the index, if any. Its
+        `interrupted` flag is respected while building.
+        :return RowIndex:  The freshly built index
+        """
+        fingerprint = cls.get_fingerprint(data_path)
+        suffix = data_path.suffix.lower()
+        if suffix == ".csv":
+            offsets = cls._iterate_csv_offsets(data_path)
+        elif suffix == ".ndjson":
+            offsets = cls._iterate_line_offsets(data_path)
+        else:
+            raise NotImplementedError(f"Cannot build row index for {suffix} file")
+
+        return cls.write(index_path, fingerprint, offsets, processor=processor)
+
+    @staticmethod
+    def _iterate_line_offsets(data_path):
+        """
+        Yield the start offset of every line in a file
+
+        :param Path data_path:  File to read
+        :return generator:
+        """
+        with data_path.open("rb") as infile:
+            offset = 0
+            for line in infile:
+                yield offset
+                offset += len(line)
+
+    @staticmethod
+    def _iterate_csv_offsets(data_path):
+        """
+        Yield the start offset of every data row in a CSV file
+
+        Rows can span multiple lines (if a quoted value contains line breaks),
+        so rather than looking at line breaks, the file is fed through the
+        csv module line by line, and the offset of the first line of each
+        record is kept. This guarantees records are delimited exactly as they
+        are when the file is read with `csv.DictReader`. The header row (the
+        first record) and empty rows (which `DictReader` also skips) are not
+        indexed.
+
+        :param Path data_path:  CSV file to read
+        :return generator:
+        """
+        with data_path.open("rb") as infile:
+            # offset of the next line the csv reader will consume
+            position = [0]
+
+            def lines():
+                for line in infile:
+                    position[0] += len(line)
+                    yield line.decode("utf-8", errors="replace")
+
+            reader = csv.reader(lines())
+            header_skipped = False
+            while True:
+                record_start = position[0]
+                try:
+                    row = next(reader)
+                except StopIteration:
+                    break
+
+                if not header_skipped:
+                    header_skipped = True
+                    continue
+
+                if not row:
+                    continue
+
+                yield record_start
+
+    def get_offset(self, row):
+        """
+        Get byte offset for a given row
+
+        :param int row:  Row number (zero-based, not counting a CSV header)
+        :return int|None:  Byte offset in result file, or `None` if the row
+        does not exist
+        """
+        if row < 0 or row >= self.num_rows:
+            return None
+
+        with self.path.open("rb") as infile:
+            infile.seek(self.HEADER.size + row * self.ENTRY.size)
+            return self.ENTRY.unpack(infile.read(self.ENTRY.size))[0]
+
+    def get_offsets(self, rows):
+        """
+        Get byte offsets for multiple rows
+
+        Like `get_offset()`, but only opens the index file once.
+
+        :param list rows:  Row numbers (zero-based, not counting a CSV header)
+        :return list:  Byte offsets, in the same order as the given rows;
+        `None` for rows that do not exist
+        """
+        offsets = []
+        with self.path.open("rb") as infile:
+            for row in rows:
+                if row < 0 or row >= self.num_rows:
+                    offsets.append(None)
+                    continue
+
+                infile.seek(self.HEADER.size + row * self.ENTRY.size)
+                offsets.append(self.ENTRY.unpack(infile.read(self.ENTRY.size))[0])
+
+        return offsets
+
+
+class SortIndex(SidecarIndex):
+    """
+    Sort permutation for a result file
+
+    Stores the row numbers of all items in a result file, in the order in
+    which they should be shown when sorted by a given value. Sorting a large
+    dataset is expensive, but once the permutation is known, any page of the
+    sorted dataset can be read by looking up its row numbers here and then
+    reading those rows via the `RowIndex`.
+    """
+    MAGIC = b"4CATSIX1"
+
+    #: Number of values that are sorted in memory at a time; the values of
+    #: larger datasets are sorted in chunks that are then merged
+    CHUNK_SIZE = 500000
+
+    @classmethod
+    def build(cls, index_path, data_path, values, reverse=False, processor=None):
+        """
+        Build sort index for a result file
+
+        Values are sorted numerically if all of them can be interpreted as
+        numbers (empty values counting as 0), and alphabetically otherwise.
+        The sort is stable, i.e. items with equal values stay in dataset
+        order.
+
+        If there are more than `CHUNK_SIZE` values, they are sorted per chunk
+        and the sorted chunks are written to temporary files, which are then
+        merged, so that memory use does not grow with the size of the
+        dataset.
+
+        :param Path index_path:  Where to write the index
+        :param Path data_path:  Path to the result file that is sorted
+        :param values:  Iterable of (row number, sort value) tuples
+        :param bool reverse:  Sort descending rather than ascending
+        :param processor:  Processor that requested the index, if any. Its
+        `interrupted` flag is respected while building.
+        :return SortIndex:  The freshly built index
+        """
+        # fingerprint first, so the index is considered stale if the file
+        # changes while reading the values
+        fingerprint = cls.get_fingerprint(data_path)
+
+        values = iter(values)
+        chunk = list(itertools.islice(values, cls.CHUNK_SIZE))
+        if len(chunk) < cls.CHUNK_SIZE:
+            # everything fits in one chunk, so no need to merge
+            chunk, numeric = cls._sort_chunk(chunk, reverse)
+            return cls.write(index_path, fingerprint, (row_number for row_number, value in chunk), processor=processor)
+
+        runs_path = get_temporary_path(index_path)
+        runs_path.mkdir()
+        runs = []
+        run_files = []
+        numeric = True
+        try:
+            while chunk:
+                if hasattr(processor, "interrupted") and processor.interrupted:
+                    raise ProcessorInterruptedException("Interrupted while building index")
+
+                chunk, chunk_numeric = cls._sort_chunk(chunk, reverse, numeric)
+                if numeric and not chunk_numeric:
+                    # not all values are numbers after all, so the chunks
+                    # sorted so far need to be sorted alphabetically instead
+                    numeric = False
+                    for run in runs:
+                        with run.open(encoding="utf-8") as infile:
+                            run_chunk = [json.loads(line) for line in infile]
+                        cls._write_run(run, cls._sort_chunk(run_chunk, reverse, numeric)[0])
+
+                runs.append(runs_path.joinpath(f"{len(runs)}.run"))
+                cls._write_run(runs[-1], chunk)
+                chunk = list(itertools.islice(values, cls.CHUNK_SIZE))
+
+            # chunks are merged in dataset order, so the merge is stable too
+            run_files = [run.open(encoding="utf-8") for run in runs]
+            merged = heapq.merge(*[map(json.loads, run_file) for run_file in run_files],
+                                 key=lambda entry: cls._get_sort_key(entry[1], numeric), reverse=reverse)
+            return cls.write(index_path, fingerprint, (row_number for row_number, value in merged), processor=processor)
+        finally:
+            for run_file in run_files:
+                run_file.close()
+
+            shutil.rmtree(runs_path, ignore_errors=True)
+
+    @staticmethod
+    def _get_sort_key(value, numeric):
+        """
+        Get value to sort a sort value by
+
+        :param value:  Sort value
+        :param bool numeric:  Sort numerically rather than alphabetically
+        :return float|str:  Sort key
+        """
+        if numeric:
+            return float(value) if value else 0
+
+        return str(value) if value is not None else ""
+
+    @classmethod
+    def _sort_chunk(cls, chunk, reverse, numeric=True):
+        """
+        Sort a chunk of values
+
+        :param list chunk:  List of (row number, sort value) tuples
+        :param bool reverse:  Sort descending rather than ascending
+        :param bool numeric:  Try to sort numerically. If not all values can
+        be interpreted as numbers, the chunk is sorted alphabetically.
+        :return tuple:  Sorted chunk, and whether it was sorted numerically
+        """
+        keys = None
+        if numeric:
+            try:
+                keys = [cls._get_sort_key(value, True) for row_number, value in chunk]
+            except (TypeError, ValueError):
+                numeric = False
+
+        if not numeric:
+            keys = [cls._get_sort_key(value, False) for row_number, value in chunk]
+
+        order = sorted(range(len(chunk)), key=keys.__getitem__, reverse=reverse)
+        return [chunk[i] for i in order], numeric
+
+    @staticmethod
+    def _write_run(path, chunk):
+        """
+        Write a sorted chunk of values to a file, to be merged later
+
+        :param Path path:  Where to write the chunk
+        :param list chunk:  List of (row number, sort value) tuples
+        """
+        with path.open("w", encoding="utf-8", newline="\n") as outfile:
+            for entry in chunk:
+                outfile.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+
+class RowSelection:
+    """
+    Selection of rows from another dataset's result file
+
+    Used for datasets that are a 'view' of another dataset, e.g. the result
+    of a filter: rather than a copy of the selected items, only which rows
+    are selected is stored. The selection is a bitmap with one bit per row of
+    the other dataset's result file, compressed with zlib; a selection of
+    a few rows from, or most rows of, a dataset with millions of items takes
+    up a few kilobytes at most.
+
+    Unlike the indexes, this is not derived data and cannot be rebuilt if
+    deleted. The number of rows in the file the selection is for is stored
+    with it, so a selection that no longer matches that file is recognised.
+    """
+    #: File signature, to recognise selection files (and their format version)
+    MAGIC = b"4CATSEL1"
+
+    #: Header: magic, rows in the selected-from file, number of rows selected
+    HEADER = struct.Struct("<8sQQ")
+
+    #: Rows per chunk when looking up selected rows
+    CHUNK_SIZE = 1024 * 1024
+
+    bitmap = None
+    num_rows = 0
+    num_selected = 0
+
+    def __init__(self, bitmap):
+        """
+        Instantiate selection
+
+        Use `load()` or `from_rows()` rather than calling this directly.
+
+        :param numpy.ndarray bitmap:  Boolean array, one value per row
+        """
+        self.bitmap = bitmap
+        self.num_rows = len(bitmap)
+        self.num_selected = int(np.count_nonzero(bitmap))
+
+    @classmethod
+    def from_rows(cls, rows, num_rows):
+        """
+        Create selection from a list of row numbers
+
+        :param rows:  Iterable of zero-based row numbers to select
+        :param int num_rows:  Number of rows in the file selected from
+        :return RowSelection:  Selection
+        """
+        bitmap = np.zeros(num_rows, dtype=bool)
+        rows = np.fromiter(rows, dtype=np.int64)
+        if len(rows) and (rows.min() < 0 or rows.max() >= num_rows):
+            raise ValueError(f"Cannot select rows outside of range 0-{num_rows - 1}")
+
+        bitmap[rows] = True
+        return cls(bitmap)
+
+    @classmethod
+    def load(cls, path, num_rows):
+        """
+        Load a selection from a file
+
+        :param Path path:  Path to selection file
+        :param int num_rows:  Number of rows the file that was selected from
+        currently has
+        :return RowSelection|None:  Selection, or `None` if no valid selection
+        for a file with that number of rows exists at the given path
+        """
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+
+        if len(data) < cls.HEADER.size:
+            return None
+
+        magic, selected_from, num_selected = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or selected_from != num_rows:
+            return None
+
+        try:
+            bitmap = np.unpackbits(np.frombuffer(zlib.decompress(data[cls.HEADER.size:]), dtype=np.uint8),
+                                   count=num_rows).astype(bool)
+        except (zlib.error, ValueError):
+            return None
+
+        selection = cls(bitmap)
+        return selection if selection.num_selected == num_selected else None
+
+    def write(self, path):
+        """
+        Write selection to a file
+
+        Written to a temporary file first and then moved into place, so
+        concurrent readers never see a partially written selection.
+
+        :param Path path:  Where to write the selection
+        """
+        temp_path = get_temporary_path(path)
+        try:
+            with temp_path.open("wb") as outfile:
+                outfile.write(self.HEADER.pack(self.MAGIC, self.num_rows, self.num_selected))
+                outfile.write(zlib.compress(np.packbits(self.bitmap).tobytes()))
+
+            os.replace(temp_path, path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+    def get_rows(self, start=0, count=None):
+        """
+        Get row numbers of selected rows
+
+        :param int start:  Number of selected rows to skip
+        :param int count:  Number of row numbers to return; `None` to return
+        all remaining
+        :return numpy.ndarray:  Row numbers in the file selected from, in
+        ascending order
+        """
+        chunks = []
+        skip = max(0, start)
+        remaining = self.num_selected if count is None else count
+        for chunk_start in range(0, self.num_rows, self.CHUNK_SIZE):
+            if remaining <= 0:
+                break
+
+            rows = np.flatnonzero(self.bitmap[chunk_start:chunk_start + self.CHUNK_SIZE])
+            if skip >= len(rows):
+                skip -= len(rows)
+                continue
+
+            rows = rows[skip:skip + remaining] + chunk_start
+            skip = 0
+            remaining -= len(rows)
+            chunks.append(rows)
+
+        return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int64)
+
+    def __contains__(self, row):
+        return 0 <= row < self.num_rows and bool(self.bitmap[row])
+
+
+class ColumnStore:
+    """
+    Columnar copy of the mapped items in a result file
+
+    Processors that only need one or two values per item still need to parse
+    every field of every item, and map it, when iterating through a dataset
+    with `DataSet.iterate_items()`. The column store contains the mapped
+    items split by column: a folder with one file per column, each with one
+    JSON-encoded value per line, and a manifest that records which file
+    belongs to which column. Reading a column then only requires reading and
+    decoding that column's file.
+
+    Like the other indexes, the manifest records the fingerprint of the
+    result file the store was built for. Like the mapped item cache, it also
+    records the version of the mapper the items were mapped with. The store
+    is considered stale if either no longer matches.
+    """
+    #: Format version, stored in the manifest
+    VERSION = 2
+
+    #: Name of the manifest file in the store folder
+    MANIFEST = "manifest.json"
+
+    #: Number of values to buffer in memory, across all columns, before
+    #: writing them to the column files while building
+    BUFFER_SIZE = 100000
+
+    path = None
+    num_rows = 0
+    columns = None
+
+    def __init__(self, path, num_rows, columns):
+        """
+        Instantiate column store reader
+
+        Use `ColumnStore.load()` or `ColumnStore.build()` rather than calling
+        this directly.
+
+        :param Path path:  Path to store folder
+        :param int num_rows:  Number of items in the store
+        :param dict columns:  Column names, with the name of the file in
+        which the column's values are stored as value
+        """
+        self.path = path
+        self.num_rows = num_rows
+        self.columns = columns
+
+    @classmethod
+    def load(cls, store_path, data_path, mapper_version):
+        """
+        Load an existing column store
+
+        :param Path store_path:  Path to store folder
+        :param Path data_path:  Path to the result file the store is for
+        :param str mapper_version:  Version of the mapper that is to be used;
+        a store built with another version is not used
+        :return ColumnStore|None:  Store, or `None` if no valid (non-stale)
+        store exists at the given path
+        """
+        manifest_path = store_path.joinpath(cls.MANIFEST)
+        if not manifest_path.exists() or not data_path.exists():
+            return None
+
+        try:
+            manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+        if manifest.get("version") != cls.VERSION \
+                or tuple(manifest.get("fingerprint", ())) != SidecarIndex.get_fingerprint(data_path) \
+                or manifest.get("mapper") != mapper_version:
+            return None
+
+        return cls(store_path, manifest["num_rows"], manifest["columns"])
+
+    @classmethod
+    def build(cls, store_path, data_path, mapper_version, items, processor=None):
+        """
+        Build column store for a result file
+
+        The store is written to a temporary folder first and then moved into
+        place, so concurrent readers never see a partially written store.
+
+        :param Path store_path:  Where to write the store
+        :param Path data_path:  Path to the result file the items are from
+        :param str mapper_version:  Version of the mapper the items are
+        mapped with
+        :param items:  Iterable of (mapped) items, as dictionaries
+        :param processor:  Processor that requested the store, if any. Its
+        `interrupted` flag is respected while building.
+        :return ColumnStore:  The freshly built store
+        """
+        fingerprint = SidecarIndex.get_fingerprint(data_path)
+        temp_path = get_temporary_path(store_path)
+        temp_path.mkdir()
+        columns = {}
+        buffers = {}
+        num_buffered = 0
+        num_rows = 0
+        try:
+            for item in items:
+                if num_rows % 10000 == 0 and hasattr(processor, "interrupted") and processor.interrupted:
+                    raise ProcessorInterruptedException("Interrupted while building column store")
+
+                for column, value in item.items():
+                    if column not in buffers:
+                        # column first seen in this item; earlier items do
+                        # not have a value for it
+                        columns[column] = f"{len(columns)}.column"
+                        buffers[column] = ["null\n" * num_rows]
+
+                    buffers[column].append(json.dumps(value, ensure_ascii=False, default=str) + "\n")
+
+                for column in buffers.keys() - item.keys():
+                    buffers[column].append("null\n")
+
+                num_rows += 1
+                num_buffered += len(buffers)
+                if num_buffered >= cls.BUFFER_SIZE:
+                    cls._write_buffers(temp_path, columns, buffers)
+                    num_buffered = 0
+
+            cls._write_buffers(temp_path, columns, buffers)
+
+            with temp_path.joinpath(cls.MANIFEST).open("w", encoding="utf-8") as outfile:
+                json.dump({
+                    "version": cls.VERSION,
+                    "fingerprint": fingerprint,
+                    "mapper": mapper_version,
+                    "num_rows": num_rows,
+                    "columns": columns
+                }, outfile)
+
+            try:
+                if store_path.exists():
+                    shutil.rmtree(store_path)
+                os.replace(temp_path, store_path)
+            except OSError:
+                # another thread or process put a store in place in the
+                # meantime; use that one if it is for the same data
+                column_store = cls.load(store_path, data_path, mapper_version)
+                if not column_store:
+                    raise
+                return column_store
+        finally:
+            if temp_path.exists():
+                shutil.rmtree(temp_path)
+
+        return cls(store_path, num_rows, columns)
+
+    @staticmethod
+    def _write_buffers(path, columns, buffers):
+        """
+        Append buffered column values to the column files
+
+        Files are only opened while writing, so that the number of open files
+        does not grow with the number of columns.
+
+        :param Path path:  Store folder to write to
+        :param dict columns:  Column names, with file name as value
+        :param dict buffers:  Column names, with a list of encoded values to
+        append as value. The lists are emptied after writing.
+        """
+        for column, values in buffers.items():
+            if not values:
+                continue
+
+            with path.joinpath(columns[column]).open("a", encoding="utf-8", newline="\n") as outfile:
+                outfile.writelines(values)
+
+            values.clear()
+
+    def has_columns(self, columns):
+        """
+        Check if the store contains the given columns
+
+        :param list columns:  Column names
+        :return bool:
+        """
+        return all(column in self.columns for column in columns)
+
+    def iterate_batches(self, columns, batch_size=10000, processor=None):
+        """
+        Iterate through values of the given columns, in batches
+
+        :param list columns:  Column names to read. All must be in the store.
+        :param int batch_size:  Number of values per column per batch
+        :param processor:  Processor iterating the store, if any. Its
+        `interrupted` flag is checked for every batch.
+        :return generator:  Yields dictionaries with column names as keys
+        and a list of (at most `batch_size`) values as value
+        """
+        column_files = {column: self.path.joinpath(self.columns[column]).open(encoding="utf-8", newline="\n")
+                        for column in columns}
+        try:
+            while True:
+                if hasattr(processor, "interrupted") and processor.interrupted:
+                    raise ProcessorInterruptedException("Interrupted while reading column store")
+
+                batch = {}
+                for column, column_file in column_files.items():
+                    lines = list(itertools.islice(column_file, batch_size))
+                    # decoding a whole batch in one go is much faster than
+                    # decoding values one by one
+                    batch[column] = json.loads("[" + ",".join(lines) + "]") if lines else []
+
+                if not columns or not batch[columns[0]]:
+                    break
+
+                yield batch
+        finally:
+            for column_file in column_files.values():
+                column_file.close()
+
+
+class MappedItemCache:
+    """
+    Cache of the mapped items in a result file
+
+    Mapping items with a data source's `map_item()` can be expensive, and
+    would otherwise be repeated every time a dataset is iterated, i.e. for
+    every processor that is run on it. The cache is an NDJSON file with one
+    line per item in the result file, containing the mapped item (or the
+    reason it could not be mapped).
+
+    The first line of the file records the fingerprint of the result file and
+    the version of the mapper the items were mapped with. If either no longer
+    matches, the cache is stale and must be rebuilt.
+    """
+    #: Format version, stored in the header
+    VERSION = 1
+
+    path = None
+
+    def __init__(self, path):
+        """
+        Instantiate cache reader
+
+        Use `MappedItemCache.load()` rather than calling this directly.
+
+        :param Path path:  Path to cache file
+        """
+        self.path = path
+
+    @classmethod
+    def get_header(cls, data_path, mapper_version):
+        """
+        Get header for a cache file
+
+        :param Path data_path:  Path to the result file
+        :param str mapper_version:  Version of the mapper
+        :return dict:  Header
+        """
+        return {
+            "version": cls.VERSION,
+            "fingerprint": list(SidecarIndex.get_fingerprint(data_path)),
+            "mapper": mapper_version
+        }
+
+    @classmethod
+    def load(cls, cache_path, data_path, mapper_version):
+        """
+        Load an existing cache
+
+        :param Path cache_path:  Path to cache file
+        :param Path data_path:  Path to the result file the cache is for
+        :param str mapper_version:  Version of the mapper that is to be used;
+        the cache is only valid if it was made with the same version
+        :return MappedItemCache|None:  Cache, or `None` if no valid (non-stale)
+        cache exists at the given path
+        """
+        if not cache_path.exists() or not data_path.exists():
+            return None
+
+        try:
+            with cache_path.open(encoding="utf-8") as infile:
+                header = json.loads(infile.readline())
+        except (OSError, ValueError):
+            return None
+
+        if header != cls.get_header(data_path, mapper_version):
+            return None
+
+        return cls(cache_path)
+
+    @classmethod
+    def write_through(cls, cache_path, data_path, mapper_version, mapped_items):
+        """
+        Write mapped items to a cache file while passing them on
+
+        Wraps a generator of mapped items (as yielded by
+        `DataSet._map_items()`). The cache file is only put in place once all
+        items have been passed on; if iteration stops early, or an item
+        cannot be stored, the cache is discarded.
+
+        :param Path cache_path:  Where to write the cache
+        :param Path data_path:  Path to the result file the items are from
+        :param str mapper_version:  Version of the mapper
+        :param mapped_items:  Generator of (row number, original item, mapped
+        item) tuples, with a row for every item in the result file
+        :return generator:  Yields the same tuples
+        """
+        header = cls.get_header(data_path, mapper_version)
+        temp_path = get_temporary_path(cache_path)
+        outfile = temp_path.open("w", encoding="utf-8")
+        try:
+            outfile.write(json.dumps(header) + "\n")
+            for row_number, original_item, mapped_item in mapped_items:
+                if outfile:
+                    try:
+                        outfile.write(json.dumps(cls.encode_item(mapped_item)) + "\n")
+                    except (TypeError, ValueError):
+                        # not JSON-serialisable; cannot cache this dataset
+                        outfile.close()
+                        outfile = None
+
+                yield row_number, original_item, mapped_item
+
+            if outfile:
+                outfile.close()
+                os.replace(temp_path, cache_path)
+        finally:
+            mapped_items.close()
+            if outfile:
+                outfile.close()
+
+            if temp_path.exists():
+                temp_path.unlink()
+
+    @staticmethod
+    def encode_item(mapped_item):
+        """
+        Get cache entry for a mapped item
+
+        :param MappedItem|MapItemException mapped_item:  Mapped item, or the
+        exception raised when trying to map it
+        :return dict:  Entry for the cache file
+        """
+        if isinstance(mapped_item, MapItemException):
+            return {"error": str(mapped_item)}
+
+        missing = mapped_item.get_missing_fields()
+        data = mapped_item.get_item_data(safe=True) if missing else mapped_item.data
+        return {"data": data, "missing": missing, "message": mapped_item.get_message()}
+
+    def iterate(self, originals=None, processor=None):
+        """
+        Iterate through cached mapped items
+
+        :param originals:  Iterable of original items, one for each row,
+        to pass on alongside the mapped items. If `None`, `None` is passed
+        instead.
+        :param processor:  Processor iterating the cache, if any. Its
+        `interrupted` flag is checked while iterating.
+        :return generator:  Yields tuples of row number, original item and
+        `MappedItem` (or `MapItemException`), as `DataSet._map_items()`
+        """
+        originals = iter(originals) if originals is not None else itertools.repeat(None)
+        with self.path.open(encoding="utf-8") as infile:
+            infile.readline()  # header
+            for row_number, (line, original_item) in enumerate(zip(infile, originals)):
+                if row_number % 1000 == 0 and hasattr(processor, "interrupted") and processor.interrupted:
+                    raise ProcessorInterruptedException("Processor interrupted while reading mapped items")
+
+                entry = json.loads(line)
+                if "error" in entry:
+                    yield row_number, original_item, MapItemException(entry["error"])
+                    continue
+
+                data = entry["data"]
+                for field in entry["missing"]:
+                    data[field] = MissingMappedField(data[field])
+
+                yield row_number, original_item, MappedItem(data, message=entry["message"])
+
+
+class MediaIndex:
+    """
+    Index of the media files downloaded per item
+
+    Media downloaders record which item(s) each downloaded file belongs to in
+    a `.metadata.json` file in their result archive. Finding the files for a
+    given item that way means reading (and first extracting) that file and
+    looking through all of it. This index instead stores the filenames per
+    item ID, hashed into buckets, so the files for a page of items can be
+    found by reading one small bucket per item.
+
+    The file consists of a header (as for `SidecarIndex`, but with the number
+    of buckets rather than entries), the offset of every bucket plus the end
+    of the last one, and the buckets themselves, with one JSON line per item
+    containing its ID and filenames.
+    """
+    MAGIC = b"4CATMDX1"
+    HEADER = SidecarIndex.HEADER
+    ENTRY = SidecarIndex.ENTRY
+
+    #: Average number of items per bucket
+    ITEMS_PER_BUCKET = 16
+
+    path = None
+    num_buckets = 0
+
+    def __init__(self, path, num_buckets):
+        """
+        Instantiate index reader
+
+        Use `load()` or `build()` rather than calling this directly.
+
+        :param Path path:  Path to index file
+        :param int num_buckets:  Number of buckets in the index
+        """
+        self.path = path
+        self.num_buckets = num_buckets
+
+    @classmethod
+    def load(cls, index_path, data_path):
+        """
+        Load an existing index
+
+        :param Path index_path:  Path to index file
+        :param Path data_path:  Path to the archive the index is for
+        :return MediaIndex|None:  Index, or `None` if no valid (non-stale)
+        index exists at the given path
+        """
+        if not index_path.exists() or not data_path.exists():
+            return None
+
+        try:
+            with index_path.open("rb") as infile:
+                header = infile.read(cls.HEADER.size)
+                if len(header) != cls.HEADER.size:
+                    return None
+
+                magic, size, mtime, num_buckets = cls.HEADER.unpack(header)
+                if magic != cls.MAGIC or (size, mtime) != SidecarIndex.get_fingerprint(data_path):
+                    return None
+
+                infile.seek(cls.HEADER.size + num_buckets * cls.ENTRY.size)
+                end = infile.read(cls.ENTRY.size)
+        except OSError:
+            return None
+
+        if len(end) != cls.ENTRY.size or cls.ENTRY.unpack(end)[0] != index_path.stat().st_size:
+            # incomplete or corrupted
+            return None
+
+        return cls(index_path, num_buckets)
+
+    @classmethod
+    def build(cls, index_path, data_path):
+        """
+        Build index for a media archive
+
+        :param Path index_path:  Where to write the index
+        :param Path data_path:  Path to the ZIP archive with downloaded media
+        :return MediaIndex:  The freshly built index
+        """
+        fingerprint = SidecarIndex.get_fingerprint(data_path)
+        media = cls.get_media_per_item(data_path)
+
+        num_buckets = max(1, len(media) // cls.ITEMS_PER_BUCKET)
+        buckets = [[] for _ in range(num_buckets)]
+        for item_id, filenames in media.items():
+            buckets[cls.get_bucket(item_id, num_buckets)].append(
+                json.dumps([item_id, filenames]).encode("utf-8") + b"\n")
+
+        temp_path = get_temporary_path(index_path)
+        try:
+            with temp_path.open("wb") as outfile:
+                offset = cls.HEADER.size + (num_buckets + 1) * cls.ENTRY.size
+                outfile.write(cls.HEADER.pack(cls.MAGIC, *fingerprint, num_buckets))
+                for bucket in buckets:
+                    outfile.write(cls.ENTRY.pack(offset))
+                    offset += sum([len(line) for line in bucket])
+
+                outfile.write(cls.ENTRY.pack(offset))
+                for bucket in buckets:
+                    outfile.writelines(bucket)
+
+            os.replace(temp_path, index_path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+        return cls(index_path, num_buckets)
+
+    @staticmethod
+    def get_media_per_item(data_path):
+        """
+        Read which files were downloaded for which items from an archive
+
+        Only files that were downloaded successfully are included. Items for
+        which the same file was downloaded more than once only get it once.
+
+        :param Path data_path:  Path to the ZIP archive with downloaded media
+        :return dict:  Filenames per item ID, in the order they occur in the
+        archive's metadata
+        """
+        try:
+            with zipfile.ZipFile(data_path) as archive:
+                with archive.open(".metadata.json") as infile:
+                    metadata = json.load(infile)
+        except (KeyError, zipfile.BadZipFile, ValueError):
+            # no or unreadable metadata, so no files to find
+            return {}
+
+        media = {}
+        for item_metadata in metadata.values():
+            # Make sure we're matching strings
+            post_ids = [str(post_id) for post_id in item_metadata.get("post_ids", [])]
+            if not post_ids:
+                continue
+
+            # Single file (images usually format like this)
+            filenames = []
+            if item_metadata.get("success", True) and "filename" in item_metadata:
+                filenames.append(item_metadata["filename"])
+
+            # Multiple files (videos with the 'files' array)
+            for file in item_metadata.get("files") or []:
+                if file.get("success") and "filename" in file:
+                    filenames.append(file["filename"])
+
+            for post_id in post_ids:
+                for filename in filenames:
+                    if post_id not in media:
+                        media[post_id] = []
+
+                    if filename not in media[post_id]:
+                        media[post_id].append(filename)
+
+        return media
+
+    @staticmethod
+    def get_bucket(item_id, num_buckets):
+        """
+        Get the bucket an item ID is stored in
+
+        :param str item_id:  Item ID
+        :param int num_buckets:  Number of buckets in the index
+        :return int:  Bucket number
+        """
+        return zlib.crc32(item_id.encode("utf-8", errors="surrogatepass")) % num_buckets
+
+    def get_media(self, item_ids=None):
+        """
+        Get filenames of the media downloaded for the given items
+
+        :param list item_ids:  Item IDs to look up; `None` to get the media
+        for all items
+        :return dict:  Filenames per item ID, for items with downloaded media
+        """
+        with self.path.open("rb") as infile:
+            infile.seek(self.HEADER.size)
+            offsets = [entry[0] for entry in self.ENTRY.iter_unpack(infile.read((self.num_buckets + 1) * self.ENTRY.size))]
+
+            if item_ids is None:
+                return {item_id: filenames for item_id, filenames in map(json.loads, infile)}
+
+            item_ids = {str(item_id) for item_id in item_ids}
+            buckets = sorted({self.get_bucket(item_id, self.num_buckets) for item_id in item_ids})
+
+            media = {}
+            for bucket in buckets:
+                infile.seek(offsets[bucket])
+                for line in infile.read(offsets[bucket + 1] - offsets[bucket]).splitlines():
+                    item_id, filenames = json.loads(line)
+                    if item_id in item_ids:
+                        media[item_id] = filenames
+
+        return media
@@ -0,0 +1,209 @@
+"""
+Compact set of value digests
+
+Deduplicating a large dataset by keeping every value seen in a Python set
+requires enough memory for a copy of all of those values, plus the overhead of
+the set itself. A `DigestSet` instead stores a fixed-size digest of each value
+in an open-addressing hash table backed by a numpy array, i.e. 16 bytes per
+slot regardless of the size of the value. Beyond a configurable number of
+values, the table is moved to a memory-mapped file, so that it is held by the
+operating system's page cache rather than by the process.
+
+Two different values are only considered identical if their 128-bit digests
+are, which for any realistic number of values is vanishingly unlikely.
+"""
+import hashlib
+
+import numpy as np
+
+
+class DigestSet:
+    """
+    Set of 128-bit digests of values
+
+    Digests are stored as two 64-bit integers per slot. The first of these
+    always has its lowest bit set, so that zero can mark an empty slot, and
+    its other bits determine the slot the digest is stored in. Collisions are
+    resolved with linear probing.
+    """
+    #: Maximum fraction of slots in use before the table is grown
+    MAX_LOAD = 0.75
+
+    #: Number of slots moved at a time when the table is grown
+    REHASH_CHUNK_SIZE = 1 << 20
+
+    size = 0
+    capacity = 0
+    table = None
+    slots = None
+    spill_path = None
+    max_memory_items = 0
+    table_file = None
+
+    def __init__(self, spill_path=None, max_memory_items=0, capacity=1024):
+        """
+        Set up an empty set
+
+        :param Path spill_path:  Folder to store the table in once it grows
+        beyond `max_memory_items`. If not given, the table is always kept in
+        memory.
+        :param int max_memory_items:  Number of values beyond which the table
+        is stored on disk; 0 to always keep it in memory
+        :param int capacity:  Initial number of slots; rounded up to a power
+        of two
+        """
+        self.spill_path = spill_path
+        self.max_memory_items = max_memory_items
+        self.size = 0
+        self._allocate(1 << max(capacity - 1, 1).bit_length())
+
+    @staticmethod
+    def get_digest(value):
+        """
+        Get digest of a value
+
+        :param str|bytes value:  Value
+        :return tuple:  Digest, as two integers
+        """
+        if type(value) is str:
+            value = value.encode("utf-8", errors="surrogatepass")
+
+        digest = hashlib.blake2b(value, digest_size=16).digest()
+        return int.from_bytes(digest[:8], "little") | 1, int.from_bytes(digest[8:], "little")
+
+    def add(self, value):
+        """
+        Add a value to the set
+
+        :param str|bytes value:  Value
+        :return bool:  `True` if the value was not in the set yet
+        """
+        low, high = self.get_digest(value)
+        slots = self.slots
+        mask = self.capacity - 1
+        slot = (low >> 1) & mask
+        while True:
+            current = slots[slot * 2]
+            if current == 0:
+                break
+
+            if current == low and slots[slot * 2 + 1] == high:
+                return False
+
+            slot = (slot + 1) & mask
+
+        slots[slot * 2] = low
+        slots[slot * 2 + 1] = high
+        self.size += 1
+
+        if self.size > self.capacity * self.MAX_LOAD:
+            self._allocate(self.capacity * 2)
+
+        return True
+
+    def __contains__(self, value):
+        """
+        Check if a value is in the set
+
+        :param str|bytes value:  Value
+        :return bool:
+        """
+        low, high = self.get_digest(value)
+        slots = self.slots
+        mask = self.capacity - 1
+        slot = (low >> 1) & mask
+        while True:
+            current = slots[slot * 2]
+            if current == 0:
+                return False
+
+            if current == low and slots[slot * 2 + 1] == high:
+                return True
+
+            slot = (slot + 1) & mask
+
+    def __len__(self):
+        return self.size
+
+    def close(self):
+        """
+        Release the table, and delete it from disk if it was stored there
+        """
+        self.slots = None
+        self.table = None
+        self._remove_table_file()
+
+    def _allocate(self, capacity):
+        """
+        Allocate a table with the given number of slots
+
+        Digests in the current table, if any, are moved to the new table.
+
+        :param int capacity:  Number of slots; must be a power of two
+        """
+        old_table = self.table
+        old_file = self.table_file
+
+        if self.spill_path and self.max_memory_items and capacity * self.MAX_LOAD > self.max_memory_items:
+            # memmap files are zero-filled (and sparse) when created
+            self.table_file = self.spill_path.joinpath(f"digests-{id(self)}-{capacity}.bin")
+            table = np.memmap(self.table_file, dtype=np.uint64, mode="w+", shape=(capacity * 2,))
+        else:
+            self.table_file = None
+            table = np.zeros(capacity * 2, dtype=np.uint64)
+
+        if old_table is not None:
+            self._rehash(old_table.reshape(-1, 2), table.reshape(-1, 2))
+
+        self.table = table
+        self.capacity = capacity
+        # items of a memoryview are plain Python integers, which are much
+        # faster to work with one by one than numpy scalars
+        self.slots = memoryview(table).cast("B").cast("Q")
+
+        if old_file and old_file != self.table_file:
+            del old_table
+            old_file.unlink(missing_ok=True)
+
+    @staticmethod
+    def _rehash(old_rows, new_rows):
+        """
+        Move all digests from one table to another
+
+        All digests are placed at once: in each round, every digest whose
+        candidate slot is free is placed there (if several want the same slot,
+        only one of them), and the others move on to the next slot. This
+        results in the same probing invariant as inserting them one by one.
+
+        The old table is read in chunks, so that a table stored on disk does
+        not need to be read into memory as a whole.
+
+        :param np.ndarray old_rows:  Table to move digests from, as (slots, 2)
+        :param np.ndarray new_rows:  Empty table to move digests to
+        """
+        mask = np.uint64(len(new_rows) - 1)
+        for start in range(0, len(old_rows), DigestSet.REHASH_CHUNK_SIZE):
+            chunk = np.asarray(old_rows[start:start + DigestSet.REHASH_CHUNK_SIZE])
+            digests = chunk[chunk[:, 0] != 0]
+            slots = (digests[:, 0] >> np.uint64(1)) & mask
+            pending = np.arange(len(digests))
+
+            while len(pending):
+                candidate_slots = slots[pending]
+                free = new_rows[candidate_slots, 0] == 0
+                _, first = np.unique(candidate_slots[free], return_index=True)
+                placed = pending[free][first]
+                new_rows[slots[placed]] = digests[placed]
+
+                is_placed = np.zeros(len(digests), dtype=bool)
+                is_placed[placed] = True
+                pending = pending[~is_placed[pending]]
+                slots[pending] = (slots[pending] + np.uint64(1)) & mask
+
+    def _remove_table_file(self):
+        """
+        Delete the table file, if there is one
+        """
+        if self.table_file:
+            self.table_file.unlink(missing_ok=True)
+            self.table_file = None
@@ -0,0 +1,274 @@
+"""
+Near-duplicate search for bit hashes
+
+Comparing every hash with every other hash quickly becomes infeasible for
+larger datasets, e.g. image hashes for a few hundred thousand downloaded
+images. The classes here make it cheap to find all hashes within a given
+Hamming distance of another hash:
+
+* hashes are packed into Python integers, so the Hamming distance between two
+  of them is a single XOR and bit count, regardless of hash length;
+* an index finds candidate neighbours without scanning all hashes: multi-index
+  hashing looks up exact matches on parts of the hash, and a BK-tree prunes
+  hashes using the triangle inequality. The former is much faster for the
+  small radii typically used for near-duplicate detection;
+* a disjoint set (union-find) structure merges hashes into groups as
+  neighbours are found.
+"""
+import numpy as np
+
+
+def pack_hash(bits) -> int:
+    """
+    Pack a bit hash into an integer
+
+    :param bits:  Hash, as an `ImageHash`, a numpy array or list of bits, or
+    a string of zeroes and ones (optionally prefixed with `0b`)
+    :return int:  Integer with the same bits, in the same order
+    """
+    if hasattr(bits, "hash"):
+        # ImageHash
+        bits = bits.hash
+
+    if isinstance(bits, str):
+        return int(bits.removeprefix("0b") or "0", 2)
+
+    bits = np.asarray(bits, dtype=bool).flatten()
+    # packbits pads with zeroes to a multiple of 8 bits; shift those out again
+    return int.from_bytes(np.packbits(bits).tobytes(), "big") >> (-len(bits) % 8)
+
+
+def get_hash_index(bits: int, radius: int):
+    """
+    Get an empty index suitable for the given hashes and queries
+
+    :param int bits:  Length of the hashes, in bits
+    :param int radius:  Largest distance that will be queried for
+    :return MultiIndex|BKTree:  Index
+    """
+    if bits // (radius + 1) >= 4:
+        return MultiIndex(bits, radius)
+
+    # with such a large radius, parts would be so short that most hashes share
+    # one with any other hash
+    return BKTree()
+
+
+class MultiIndex:
+    """
+    Multi-index hashing of packed hashes, for Hamming distance queries
+
+    Hashes are split into `radius + 1` parts. If two hashes differ in at most
+    `radius` bits, at least one of those parts is identical for both (by the
+    pigeonhole principle), so only hashes that share a part with the query
+    need to be compared. Parts are looked up in one dictionary per part.
+    """
+    radius = 0
+    parts = None
+    tables = None
+    values = None
+    items = None
+
+    def __init__(self, bits: int, radius: int):
+        """
+        Set up an empty index
+
+        :param int bits:  Length of the hashes, in bits
+        :param int radius:  Largest distance that can be queried for
+        """
+        num_parts = min(radius + 1, bits)
+        bounds = [bits * part // num_parts for part in range(num_parts + 1)]
+
+        self.radius = radius
+        self.parts = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        self.tables = [{} for _ in self.parts]
+        self.values = []
+        self.items = []
+
+    def add(self, value: int, item) -> None:
+        """
+        Add a hash to the index
+
+        :param int value:  Packed hash
+        :param item:  Item to return for this hash in queries, e.g. its index
+        """
+        index = len(self.values)
+        self.values.append(value)
+        self.items.append(item)
+
+        for (shift, mask), table in zip(self.parts, self.tables):
+            key = (value >> shift) & mask
+            if key in table:
+                table[key].append(index)
+            else:
+                table[key] = [index]
+
+    def query(self, value: int, radius: int) -> list:
+        """
+        Find all items with a hash within a given distance
+
+        :param int value:  Packed hash to search around
+        :param int radius:  Maximum Hamming distance, inclusive; cannot be
+        larger than the radius the index was created with
+        :return list:  List of `(item, distance)` tuples, in no particular
+        order
+        """
+        if radius > self.radius:
+            raise ValueError(f"Cannot query for distance {radius} in index for distance {self.radius}")
+
+        results = []
+        seen = set()
+        values = self.values
+        for (shift, mask), table in zip(self.parts, self.tables):
+            for index in table.get((value >> shift) & mask, ()):
+                if index in seen:
+                    continue
+
+                seen.add(index)
+                distance = (values[index] ^ value).bit_count()
+                if distance <= radius:
+                    results.append((self.items[index], distance))
+
+        return results
+
+    def __len__(self):
+        return len(self.values)
+
+
+class BKTree:
+    """
+    BK-tree of packed hashes, for Hamming distance queries
+
+    Each node stores a hash and the items with that hash; its children are
+    keyed by their distance to the node. Because Hamming distance is a metric,
+    a query for hashes within `radius` of some hash only needs to descend
+    into children whose key differs at most `radius` from the query's distance
+    to the node.
+    """
+    root = None
+    size = 0
+
+    def __init__(self):
+        """
+        Set up an empty tree
+        """
+        # nodes are [hash, [items], {distance: child}]
+        self.root = None
+        self.size = 0
+
+    def add(self, value: int, item) -> None:
+        """
+        Add a hash to the tree
+
+        :param int value:  Packed hash
+        :param item:  Item to return for this hash in queries, e.g. its index
+        """
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+
+        node = self.root
+        while True:
+            distance = (node[0] ^ value).bit_count()
+            if distance == 0:
+                node[1].append(item)
+                return
+
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+
+            node = child
+
+    def query(self, value: int, radius: int) -> list:
+        """
+        Find all items with a hash within a given distance
+
+        :param int value:  Packed hash to search around
+        :param int radius:  Maximum Hamming distance, inclusive
+        :return list:  List of `(item, distance)` tuples, in no particular
+        order
+        """
+        if self.root is None:
+            return []
+
+        results = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = (node[0] ^ value).bit_count()
+            if distance <= radius:
+                results.extend([(item, distance) for item in node[1]])
+
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+
+        return results
+
+    def __len__(self):
+        return self.size
+
+
+class UnionFind:
+    """
+    Disjoint set of items `0..n-1`, with path halving and union by size
+    """
+    parent = None
+    size = None
+
+    def __init__(self, n: int):
+        """
+        Start with every item in its own set
+
+        :param int n:  Number of items
+        """
+        self.parent = list(range(n))
+        self.size = [1] * n
+
+    def find(self, item: int) -> int:
+        """
+        Get the representative item of an item's set
+
+        :param int item:  Item
+        :return int:  Representative item
+        """
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+
+        return item
+
+    def union(self, a: int, b: int) -> bool:
+        """
+        Merge the sets of two items
+
+        :param int a:  Item
+        :param int b:  Item
+        :return bool:  `False` if both items were already in the same set
+        """
+        a = self.find(a)
+        b = self.find(b)
+        if a == b:
+            return False
+
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return True
+
+    def labels(self) -> list[int]:
+        """
+        Label each item with the number of its set
+
+        Sets are numbered `0..k-1` in order of their first item.
+
+        :return list:  Set label per item
+        """
+        numbers = {}
+        return [numbers.setdefault(self.find(item), len(numbers)) for item in range(len(self.parent))]
@@ -1,6 +1,7 @@
 """
 Miscellaneous helper functions for the 4CAT backend
 """
+import multiprocessing
 import subprocess
 import imagehash
 import hashlib
@@ -356,6 +357,28 @@ def find_extensions():
     return extensions, errors
 
 
+def get_process_context():
+    """
+    Get multiprocessing context to start worker processes with
+
+    The backend runs workers as threads of a single process. Forking that
+    process copies any locks other threads hold at that moment, e.g. those of
+    log handlers or the database connection pool, which can make the child
+    process deadlock. Worker processes are therefore forked from a separate
+    server process instead, which has the modules most processes need
+    already imported, so that starting them remains cheap. Functions and
+    arguments passed to these processes must be picklable.
+
+    :return:  Multiprocessing context
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["common.lib.dataset", "backend.lib.processor"])
+    return context
+
+
 def convert_to_int(value, default: int=0) -> int:
     """
     Convert a value to an integer, with a fallback
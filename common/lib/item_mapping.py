@@ -48,15 +48,16 @@ class MappedItem:
         :param bool safe:  Replace MissingMappedFields with their default value
         :return dict:
         """
-        data = self.data.copy()
+        if not safe:
+            return self.data
 
-        # replace MissingMappedFields
-        if safe:
-            for field, value in data.items():
-                if type(value) is MissingMappedField:
-                    data[field] = value.value
+        # replace MissingMappedFields, without changing the item itself
+        data = self.data.copy()
+        for field, value in data.items():
+            if type(value) is MissingMappedField:
+                data[field] = value.value
 
-        return self.data
+        return data
 
     def get_message(self):
         """
@@ -85,6 +86,10 @@ class DatasetItem(dict):
     :todo: consider just-in-time mapping by only storing the original and
     calling the mapper only when the object is accessed as a dict
     """
+    #: Zero-based position of the item in the dataset's result file, set by
+    #: `DataSet.iterate_items()`
+    row_number = None
+
     def __init__(self, mapper, original, mapped_object, data_file, *args, **kwargs):
         """
         DatasetItem init
@@ -21,6 +21,11 @@ class Job:
 	#: claimable again. See `park()` and `queue.release_all()`.
 	STATUS_PARKED = -1
 
+	#: Database notification channel on which is announced that a job may
+	#: have become claimable; the back-end listens on this to start jobs
+	#: without waiting for its next scan of the queue
+	NOTIFY_CHANNEL = "4cat_jobs"
+
 	is_finished = False
 	is_claimed = False
 	is_parked = False
@@ -159,6 +164,7 @@ class Job:
 
 		self.db.update("jobs", data=update,
 					   where={"jobtype": self.data["jobtype"], "remote_id": self.data["remote_id"]})
+		self.db.notify(self.NOTIFY_CHANNEL, self.data["jobtype"])
 		self.is_claimed = False
 
 	def park(self):
@@ -3,7 +3,7 @@ import base64
 import mimetypes
 
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Callable, List, Optional, Union
 
 from pydantic import SecretStr
 from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
@@ -15,6 +15,8 @@ from langchain_openai import ChatOpenAI
 from langchain_mistralai import ChatMistralAI
 from langchain_deepseek import ChatDeepSeek
 
+from common.lib.llm.cache import LLMResponseCache
+
 
 class LLMAdapter:
     def __init__(
@@ -25,6 +27,7 @@ class LLMAdapter:
             temperature: float = 0.1,
             max_tokens: int = 1000,
             client_kwargs: Optional[dict] = None,
+            cache: Optional[LLMResponseCache] = None,
     ):
         """
         Instantiate an adapter to interface with an LLM model
@@ -36,15 +39,19 @@ class LLMAdapter:
         :param float temperature:  Temperature hyperparameter
         :param int max_tokens:  Max tokens to generate
         :param dict client_kwargs:  Optional parameters for the LLM adapter class
+        :param LLMResponseCache cache:  Cache to re-use earlier responses to
+          the same prompt from, if any
         """
         self.model = model
         self.server = server
         self.api_key = api_key or "dummy-key"  # need a key, even if not required
         self.temperature = temperature
         self.structured_output = False
+        self.structure = None
         self.parser = None
         self.max_tokens = max_tokens
         self.client_kwargs = dict(client_kwargs) if client_kwargs else {}
+        self.cache = cache
 
         self.llm: BaseChatModel = self._load_llm()
 
@@ -129,6 +136,7 @@ class LLMAdapter:
             temperature: float = 0.1,
             files: Optional[List[str]] = None,
             media_files: Optional[List[Union[str, Path]]] = None,
+            before_invoke: Optional[Callable[[], None]] = None,
     ) -> BaseMessage:
         """
         Supports string input or LangChain message list, with optional multimodal files.
@@ -138,6 +146,8 @@ class LLMAdapter:
         :param temperature: Temperature for generation
         :param files: Optional list of media URLs for multimodal input
         :param media_files: Optional list of local file paths for multimodal input (base64-encoded)
+        :param before_invoke: Optional function to call right before the model is invoked, e.g. to respect a rate
+            limit. Not called if the response is taken from the cache.
         :returns: Generated response message
         """
         if isinstance(messages, str):
@@ -163,11 +173,30 @@ class LLMAdapter:
             "local_id"]:
             kwargs = {}
 
+        cache_key = None
+        if self.cache:
+            # everything that determines the response; media files are
+            # included in the messages, base64-encoded
+            cache_key = self.cache.get_key(
+                self.server.get("type"), self.server.get("url"), self.model["wrapper"], self.model["local_id"],
+                [(message.type, message.content) for message in lc_messages], self.structure,
+                kwargs.get("temperature", self.temperature), self.max_tokens
+            )
+            response = self.cache.get(cache_key)
+            if response is not None:
+                return response
+
+        if before_invoke:
+            before_invoke()
+
         try:
             response = self.llm.invoke(lc_messages, **kwargs)
         except Exception as e:
             raise e
 
+        if cache_key and response:
+            self.cache.set(cache_key, response)
+
         return response
 
     def create_multimodal_content(
@@ -312,6 +341,7 @@ class LLMAdapter:
             json_schema = json.loads(json_schema)
 
         json.dumps(json_schema)  # To validate / raise an error
+        self.structure = {"schema": json_schema, "method": method, "include_raw": include_raw, "strict": strict}
 
         # LM Studio needs some more guidance
         if self.model["wrapper"] == "openai-like":
@@ -0,0 +1,161 @@
+"""
+Local cache of LLM responses.
+
+Prompting an LLM with the same prompt and settings as before - e.g. when
+re-running a processor after changing one parameter, or after it crashed
+halfway - would otherwise mean paying (in time or money) for the same
+responses again. Responses are therefore stored on disk, in files named after
+a hash of everything that determines them, and shared across datasets.
+
+The cache has a maximum size. Once it is exceeded, the least recently used
+responses are removed; the modification time of a file is updated whenever
+its response is used, so the oldest files are the least recently used.
+"""
+
+import hashlib
+import pickle
+import json
+import time
+import os
+
+from pathlib import Path
+
+
+class LLMResponseCache:
+    """
+    Content-addressed cache of LLM responses
+
+    Responses are stored as pickles, one file per response, in subfolders
+    named after the first two characters of the hash, so that no folder
+    becomes very large. Since each file is written to a temporary file first
+    and then moved into place, the cache can be used by several processors at
+    the same time.
+    """
+    #: Fraction of the maximum size the cache is reduced to when evicting, so
+    #: that not every new response leads to an eviction
+    EVICT_TO = 0.9
+
+    path = None
+    max_size = 0
+    written = 0
+
+    def __init__(self, path, max_size):
+        """
+        Open cache
+
+        :param Path path:  Folder to store the cache in; created if it does
+          not exist
+        :param int max_size:  Maximum size of the cache, in bytes
+        """
+        self.path = Path(path)
+        self.max_size = max_size
+        self.written = 0
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def get_key(*components):
+        """
+        Get cache key for a request
+
+        :param components:  Anything determining the response, e.g. the model,
+          prompt and temperature. Must be serialisable as JSON, though objects
+          that are not are included via their string representation.
+        :return str:  Key
+        """
+        serialised = json.dumps(components, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(serialised.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+    def get_path(self, key):
+        """
+        Get path of the file a response is stored in
+
+        :param str key:  Cache key
+        :return Path:
+        """
+        return self.path.joinpath(key[:2], f"{key}.pickle")
+
+    def get(self, key):
+        """
+        Get cached response
+
+        :param str key:  Cache key
+        :return:  Response, or `None` if it is not in the cache
+        """
+        path = self.get_path(key)
+        try:
+            with path.open("rb") as infile:
+                response = pickle.load(infile)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            # not cached, evicted in the meantime, or no longer readable
+            return None
+
+        try:
+            # mark as recently used
+            os.utime(path)
+        except OSError:
+            pass
+
+        return response
+
+    def set(self, key, response):
+        """
+        Store response
+
+        :param str key:  Cache key
+        :param response:  Response to store; must be picklable
+        """
+        path = self.get_path(key)
+        path.parent.mkdir(exist_ok=True)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}-{id(response)}.tmp")
+        try:
+            with temp_path.open("wb") as outfile:
+                pickle.dump(response, outfile)
+            os.replace(temp_path, path)
+            self.written += path.stat().st_size
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            # caching is an optimisation; a response that cannot be stored
+            # is simply requested again next time
+            temp_path.unlink(missing_ok=True)
+
+    def evict(self):
+        """
+        Remove least recently used responses until the cache is small enough
+
+        Only does anything if the cache is larger than its maximum size.
+
+        :return int:  Number of responses removed
+        """
+        files = []
+        size = 0
+        for folder in self.path.iterdir():
+            if not folder.is_dir():
+                continue
+
+            for file in folder.iterdir():
+                try:
+                    stat = file.stat()
+                except FileNotFoundError:
+                    # removed by another process in the meantime
+                    continue
+
+                if file.suffix == ".tmp" and stat.st_mtime > time.time() - 3600:
+                    # probably still being written
+                    continue
+
+                files.append((stat.st_mtime, stat.st_size, file))
+                size += stat.st_size
+
+        removed = 0
+        if size <= self.max_size:
+            return removed
+
+        files.sort()
+        for mtime, file_size, file in files:
+            if size <= self.max_size * self.EVICT_TO:
+                break
+
+            file.unlink(missing_ok=True)
+            size -= file_size
+            removed += 1
+
+        return removed
@@ -0,0 +1,150 @@
+"""
+Keep several LLM requests in flight at once.
+
+Most of the time spent prompting an LLM for each item in a dataset is spent
+waiting for the server to respond. Local servers (e.g. Ollama or vLLM) and
+third-party APIs can generally handle several requests at the same time, so
+rather than waiting for each response before sending the next prompt, the
+pipeline sends up to a given number of requests concurrently, in threads.
+Responses are still returned in the order in which the requests were made, so
+results can be written as if the requests had been made one by one.
+"""
+
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class LLMRequestPipeline:
+    """
+    Bounded pipeline of LLM requests
+
+    Use `submit()` to send a request; it returns the responses that are due,
+    in order, once the maximum number of requests is in flight. After the last
+    request, `finish()` returns the remaining responses. With a maximum of one
+    request in flight, each request is completed before `submit()` returns,
+    i.e. requests are made synchronously.
+
+    If there is a minimum interval between requests, the request function
+    should call `wait()` right before it sends the request. Requests that turn
+    out not to be needed, e.g. because the response is cached, are then not
+    delayed.
+    """
+    max_in_flight = 1
+    interval = 0
+    pending = None
+    pool = None
+    last_request = 0
+    lock = None
+
+    def __init__(self, max_in_flight=1, interval=0):
+        """
+        Set up pipeline
+
+        :param int max_in_flight:  Maximum number of requests to send
+          concurrently
+        :param float interval:  Minimum number of seconds between the start of
+          two requests, to stay within the server's rate limit (see `wait()`)
+        """
+        self.max_in_flight = max(1, max_in_flight)
+        self.interval = interval
+        self.pending = deque()
+        self.pool = ThreadPoolExecutor(max_workers=self.max_in_flight) if self.max_in_flight > 1 else None
+        self.last_request = 0
+        self.lock = threading.Lock()
+
+    def submit(self, context, request, *args, **kwargs):
+        """
+        Send a request
+
+        :param context:  Anything needed to process the response; returned
+          with it
+        :param callable request:  Function making the request, e.g. an
+          adapter's `generate_text`
+        :param args:  Positional arguments for the function
+        :param kwargs:  Keyword arguments for the function
+        :return list:  `(context, response, exception)` tuples for requests
+          that have completed, in the order they were submitted. `exception`
+          is the exception raised by the request, if any, in which case
+          `response` is `None`.
+        """
+        if self.pool:
+            self.pending.append((context, self.pool.submit(request, *args, **kwargs)))
+        else:
+            self.pending.append((context, self._call(request, *args, **kwargs)))
+
+        completed = []
+        while len(self.pending) >= self.max_in_flight:
+            completed.append(self._next_response())
+
+        return completed
+
+    def wait(self):
+        """
+        Wait until the next request may be sent
+
+        Waits until at least `interval` seconds have passed since the previous
+        call. Can be called from the pipeline's threads.
+        """
+        if not self.interval:
+            return
+
+        with self.lock:
+            delay = self.last_request + self.interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.last_request = time.monotonic()
+
+    def finish(self):
+        """
+        Wait for all requests that are still in flight
+
+        :return list:  `(context, response, exception)` tuples, in the order
+          the requests were submitted
+        """
+        completed = []
+        while self.pending:
+            completed.append(self._next_response())
+
+        self.close()
+        return completed
+
+    def close(self):
+        """
+        Stop the pipeline
+
+        Requests that have not started yet are cancelled; responses to
+        requests that are in flight are discarded.
+        """
+        self.pending.clear()
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _next_response(self):
+        """
+        Wait for the oldest request in flight
+
+        :return tuple:  `(context, response, exception)`
+        """
+        context, outcome = self.pending.popleft()
+        if not self.pool:
+            return (context, *outcome)
+
+        try:
+            return context, outcome.result(), None
+        except Exception as e:
+            return context, None, e
+
+    @staticmethod
+    def _call(request, *args, **kwargs):
+        """
+        Make a request in the current thread
+
+        :return tuple:  `(response, exception)`
+        """
+        try:
+            return request(*args, **kwargs), None
+        except Exception as e:
+            return None, e
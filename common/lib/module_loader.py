@@ -3,13 +3,100 @@ Load modules and datasources dynamically
 """
 from pathlib import Path
 import importlib
+import hashlib
+import io
 import inspect
 import pickle
+import uuid
 import sys
 import re
 import os
 
 
+class WorkerReference:
+    """
+    Reference to a worker class that has not been imported yet
+
+    Stored in the module collector's `workers` and `processors` dictionaries
+    in place of the class until the class is first needed.
+    """
+    metadata = None
+    worker_class = None
+
+    def __init__(self, metadata):
+        """
+        :param dict metadata:  Worker metadata, as stored in the module
+        manifest
+        """
+        self.metadata = metadata
+        self.worker_class = None
+
+    def load(self):
+        """
+        Import the worker's module and get the class
+
+        :return:  Worker class
+        """
+        if self.worker_class is None:
+            module = self.metadata["module"]
+            if module not in sys.modules:
+                importlib.import_module(module)
+
+            worker_class = getattr(sys.modules[module], self.metadata["class_name"])
+            worker_class.filepath = self.metadata["filepath"]
+            worker_class.is_extension = self.metadata["is_extension"]
+            if self.metadata["is_extension"]:
+                worker_class.extension_name = self.metadata["extension_name"]
+
+            self.worker_class = worker_class
+
+        return self.worker_class
+
+
+class LazyModuleDict(dict):
+    """
+    Dictionary of worker classes that imports them on first access
+
+    Values may be `WorkerReference`s, which are replaced by the class they
+    refer to when the value is retrieved. Checking for keys does not import
+    anything.
+    """
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if type(value) is WorkerReference:
+            value = value.load()
+            super().__setitem__(key, value)
+
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+
+class CompatibilityPickler(pickle.Pickler):
+    """
+    Pickler that only accepts objects that can be unpickled cheaply
+
+    Used to check whether a processor's `compatibility` can be stored in the
+    module manifest. Unpickling an object refers to the classes and functions
+    it uses by module; if any of those were defined in a processor's module,
+    loading the manifest would import that module after all.
+    """
+    def reducer_override(self, obj):
+        if isinstance(obj, type) or inspect.isroutine(obj):
+            module = getattr(obj, "__module__", None) or ""
+            if module not in ("builtins", "shutil") and not module.startswith("common."):
+                raise pickle.PicklingError(f"{obj!r} is defined in {module}")
+
+        return NotImplemented
+
+
 class ModuleCollector:
     """
     Collects all modular appendages of 4CAT
@@ -29,18 +116,36 @@ class ModuleCollector:
     the first one already indexed. Also note that the file path and extension flag 
     are also stored on the worker classes themselves, which Python shares 
     process-wide through its module cache.
+
+    Importing all modules is slow and memory-intensive, since between them
+    they use most of 4CAT's dependencies. What is found is therefore recorded
+    in a manifest (see `load_modules()`), and as long as no code has changed,
+    modules are only imported when a worker class is actually used. Metadata
+    of workers that have not been imported can be read via `get_metadata()`.
     """
     ignore = []
     missing_modules = {}
     log_buffer = None
     config = None
 
+    #: Outcomes of processor compatibility checks that do not depend on the
+    #: individual dataset; see DataSet.get_compatible_processors()
+    compatibility_cache = None
+
     PROCESSOR = 1
     WORKER = 2
 
-    workers = {}
-    processors = {}
+    #: Manifest format version; manifests of another version are rebuilt
+    MANIFEST_VERSION = 1
+
+    #: Worker class attributes stored in the manifest
+    MANIFEST_ATTRIBUTES = ("title", "category", "description", "extension", "is_hidden", "max_workers", "priority",
+                           "resource_class")
+
+    workers = LazyModuleDict()
+    processors = LazyModuleDict()
     datasources = {}
+    metadata = {}
 
     def __init__(self, config, write_cache=False):
         """
@@ -56,6 +161,7 @@ class ModuleCollector:
         # this can be flushed later once the logger is available
         self.log_buffer = ""
         self.config = config
+        self.compatibility_cache = {"shapes": {}, "environment": {}}
 
         self.load_datasources()
         self.load_modules()
@@ -67,9 +173,8 @@ class ModuleCollector:
         # cache module-defined config options for use by the config manager
         if write_cache:
             module_config = {}
-            for worker in self.workers.values():
-                if hasattr(worker, "config") and type(worker.config) is dict:
-                    module_config.update(worker.config)
+            for worker_type in self.workers:
+                module_config.update(self.metadata[worker_type]["config"])
 
             with config.get("PATH_CONFIG").joinpath("module_config.bin").open("wb") as outfile:
                 pickle.dump(module_config, outfile)
@@ -106,9 +211,14 @@ class ModuleCollector:
         are found by importing any python files found in the given locations,
         and looking for relevant classes within those python files, that extend
         `BasicProcessor` or `BasicWorker` and are not abstract.
+
+        The metadata of the classes found this way is stored in a manifest
+        file. If that file exists and none of the code it was built from (or
+        the installed packages) has changed since, the manifest is used and
+        modules are not imported until a worker class is retrieved from the
+        `workers` or `processors` dictionaries.
         """
         # look for workers and processors in pre-defined folders and datasources
-
         extension_path = self.config.get('PATH_EXTENSIONS')
         enabled_extensions = [e for e, s in self.config.get("extensions.enabled").items() if s["enabled"]]
 
@@ -117,9 +227,67 @@ class ModuleCollector:
                  extension_path,
                  *[self.datasources[datasource]["path"] for datasource in self.datasources]] # extension datasources will be here and the above line...
 
+        fingerprint = self.get_modules_fingerprint(paths, enabled_extensions)
+        manifest_path = self.get_manifest_path()
+        manifest = self.read_manifest(manifest_path, fingerprint)
+        if not manifest:
+            manifest = self.build_manifest(paths, extension_path, enabled_extensions)
+            manifest["fingerprint"] = fingerprint
+            if manifest_path:
+                self.write_manifest(manifest_path, manifest)
+
+        for module_name, missing_module in manifest["missing"]:
+            self.ignore.append(module_name)
+            if missing_module not in self.missing_modules:
+                self.missing_modules[missing_module] = [module_name]
+            else:
+                self.missing_modules[missing_module].append(module_name)
+
+        for worker_type, metadata in manifest["workers"].items():
+            if worker_type in self.workers:
+                # already indexed
+                continue
+
+            self.metadata[worker_type] = metadata
+            reference = WorkerReference(metadata)
+            dict.__setitem__(self.workers, worker_type, reference)
+            if metadata["is_processor"]:
+                dict.__setitem__(self.processors, worker_type, reference)
+
+        # sort by category for more convenient display in interfaces
+        sorted_processors = sorted(dict.keys(self.processors))
+        categorised_processors = LazyModuleDict()
+        for worker_type in sorted(sorted_processors,
+                                  key=lambda item: "0" if self.metadata[item]["category"] == "Presets" else
+                                  self.metadata[item]["category"]):
+            dict.__setitem__(categorised_processors, worker_type, dict.__getitem__(self.processors, worker_type))
+
+        # Give a heads-up if not all modules were installed properly
+        if self.missing_modules:
+            warning = "Warning: Not all modules could be found, which might cause data sources and modules to not " \
+                      "function.\nMissing modules:\n"
+            for missing_module, processor_list in self.missing_modules.items():
+                warning += "\t%s (for %s)\n" % (missing_module, ", ".join(processor_list))
+
+            self.log_buffer += warning
+
+        self.processors = categorised_processors
+
+    def build_manifest(self, paths, extension_path, enabled_extensions):
+        """
+        Import all modules and collect the metadata of their workers
+
+        :param list paths:  Folders to look for modules in
+        :param Path extension_path:  Folder extensions are in
+        :param list enabled_extensions:  Names of enabled extensions
+        :return dict:  Manifest, with the metadata of each worker class (by
+        type) as `workers` and `(module, missing module)` tuples for modules
+        that could not be imported as `missing`
+        """
         root_match = re.compile(r"^%s" % re.escape(str(self.config.get('PATH_ROOT'))))
         root_path = self.config.get('PATH_ROOT')
 
+        manifest = {"version": self.MANIFEST_VERSION, "workers": {}, "missing": []}
         for folder in paths:
             # loop through folders, and files in those folders, recursively
             is_extension = extension_path in folder.parents or folder == extension_path
@@ -147,12 +315,8 @@ class ModuleCollector:
                         module = importlib.import_module(module_name)
                     except (SyntaxError, ImportError) as e:
                         # this is fine, just ignore this data source and give a heads up
-                        self.ignore.append(module_name)
                         key_name = e.name if hasattr(e, "name") else module_name
-                        if key_name not in self.missing_modules:
-                            self.missing_modules[key_name] = [module_name]
-                        else:
-                            self.missing_modules[key_name].append(module_name)
+                        manifest["missing"].append((module_name, key_name))
                         continue
 
                     # see if module contains the right type of content by looping
@@ -163,45 +327,160 @@ class ModuleCollector:
                             # this is not the module we're looking for (e.g. a base class imported from elsewhere), skip it
                             continue
 
-                        if component[1].type in self.workers:
+                        if component[1].type in manifest["workers"]:
                             # already indexed
                             continue
 
                         # extract data that is useful for the scheduler and other
                         # parts of 4CAT
-                        relative_path = root_match.sub("", str(file))
+                        manifest["workers"][component[1].type] = self.get_worker_metadata(
+                            component[1], module_name, root_match.sub("", str(file)), is_extension, extension_name)
 
-                        self.workers[component[1].type] = component[1]
-                        self.workers[component[1].type].filepath = relative_path
-                        self.workers[component[1].type].is_extension = is_extension
-                        if is_extension:
-                            self.workers[component[1].type].extension_name = extension_name
+        return manifest
 
-                        # we can't use issubclass() because for that we would need
-                        # to import BasicProcessor, which would lead to a circular
-                        # import
-                        if self.is_4cat_class(component[1], only_processors=True):
-                            self.processors[component[1].type] = self.workers[component[1].type]
+    def get_worker_metadata(self, worker_class, module_name, filepath, is_extension, extension_name):
+        """
+        Collect metadata for a worker class
+
+        This is what the rest of 4CAT can know about a worker without
+        importing it.
+
+        :param worker_class:  Worker class
+        :param str module_name:  Name of the module the class is defined in
+        :param str filepath:  Path of the module file, relative to the 4CAT
+        root
+        :param bool is_extension:  Whether the module is part of an extension
+        :param str|None extension_name:  Name of that extension
+        :return dict:  Metadata
+        """
+        metadata = {attribute: getattr(worker_class, attribute, None) for attribute in self.MANIFEST_ATTRIBUTES}
+        metadata.update({
+            "type": worker_class.type,
+            "module": module_name,
+            "class_name": worker_class.__name__,
+            "filepath": filepath,
+            "is_extension": is_extension,
+            "extension_name": extension_name,
+            # we can't use issubclass() because for that we would need
+            # to import BasicProcessor, which would lead to a circular
+            # import
+            "is_processor": self.is_4cat_class(worker_class, only_processors=True),
+            "is_from_collector": worker_class.type.endswith("-search") or worker_class.type.endswith("-import"),
+            "has_ensure_job": hasattr(worker_class, "ensure_job"),
+            "config": worker_class.config if type(getattr(worker_class, "config", None)) is dict else {},
+            "compatibility": None,
+        })
+
+        # compatibility can be checked without importing the processor if it
+        # is declared via a (picklable) Compatibility object and not
+        # overridden via is_compatible_with()
+        base_class = next((c for c in worker_class.__mro__ if c.__name__ == "BasicProcessor"), None)
+        compatibility = getattr(worker_class, "compatibility", None)
+        if base_class and compatibility is not None and \
+                getattr(worker_class.is_compatible_with, "__func__", None) is base_class.is_compatible_with.__func__:
+            try:
+                CompatibilityPickler(io.BytesIO()).dump(compatibility)
+                metadata["compatibility"] = compatibility
+            except (pickle.PicklingError, TypeError, AttributeError):
+                pass
 
-        # sort by category for more convenient display in interfaces
-        sorted_processors = {id: self.processors[id] for id in
-                             sorted(self.processors)}
+        return metadata
 
-        categorised_processors = {id: sorted_processors[id] for id in
-                                  sorted(sorted_processors,
-                                         key=lambda item: "0" if sorted_processors[item].category == "Presets" else
-                                         sorted_processors[item].category)}
+    def get_manifest_path(self):
+        """
+        Get path to module manifest
 
-        # Give a heads-up if not all modules were installed properly
-        if self.missing_modules:
-            warning = "Warning: Not all modules could be found, which might cause data sources and modules to not " \
-                      "function.\nMissing modules:\n"
-            for missing_module, processor_list in self.missing_modules.items():
-                warning += "\t%s (for %s)\n" % (missing_module, ", ".join(processor_list))
+        :return Path|None:  Path, or `None` if there is no config folder to
+        store the manifest in
+        """
+        config_path = self.config.get("PATH_CONFIG")
+        return config_path.joinpath("module_manifest.bin") if config_path else None
 
-            self.log_buffer += warning
+    def get_modules_fingerprint(self, paths, enabled_extensions):
+        """
+        Get fingerprint of the code modules are loaded from
 
-        self.processors = categorised_processors
+        Covers all Python files in the given folders and 4CAT's shared code
+        (since modules may inherit from classes defined there), and the
+        folders Python packages are loaded from, which change when packages
+        are installed or removed.
+
+        :param list paths:  Folders modules are loaded from
+        :param list enabled_extensions:  Names of enabled extensions
+        :return str:  Fingerprint
+        """
+        root_path = self.config.get('PATH_ROOT')
+        fingerprint = hashlib.md5()
+        fingerprint.update(repr((sys.version, sorted(enabled_extensions))).encode())
+
+        for folder in [*paths, root_path.joinpath("backend/lib"), root_path.joinpath("common")]:
+            for root, dirs, files in os.walk(folder, followlinks=True):
+                for filename in sorted(files):
+                    if filename.endswith(".py"):
+                        stat = os.stat(os.path.join(root, filename))
+                        fingerprint.update(f"{root}/{filename}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+
+        for folder in sys.path:
+            if os.path.isdir(folder):
+                fingerprint.update(f"{folder}:{os.stat(folder).st_mtime_ns}\n".encode())
+
+        return fingerprint.hexdigest()
+
+    def read_manifest(self, manifest_path, fingerprint):
+        """
+        Read module manifest
+
+        :param Path|None manifest_path:  Path to manifest
+        :param str fingerprint:  Current fingerprint of module code
+        :return dict|None:  Manifest, or `None` if there is no manifest for
+        the current code
+        """
+        if not manifest_path or not manifest_path.exists():
+            return None
+
+        try:
+            with manifest_path.open("rb") as infile:
+                manifest = pickle.load(infile)
+        except Exception:
+            # corrupt, or refers to classes that no longer exist; rebuild
+            return None
+
+        if type(manifest) is not dict or manifest.get("version") != self.MANIFEST_VERSION \
+                or manifest.get("fingerprint") != fingerprint:
+            return None
+
+        return manifest
+
+    def write_manifest(self, manifest_path, manifest):
+        """
+        Write module manifest
+
+        The front-end and back-end may be started at the same time, so the
+        manifest is written to a temporary file and then moved into place.
+
+        :param Path manifest_path:  Path to manifest
+        :param dict manifest:  Manifest
+        """
+        temp_path = manifest_path.with_name(f"{manifest_path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            with temp_path.open("wb") as outfile:
+                pickle.dump(manifest, outfile)
+            os.replace(temp_path, manifest_path)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError) as e:
+            self.log_buffer += f"Could not write module manifest: {e}\n"
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+    def get_metadata(self, worker_type):
+        """
+        Get metadata for a worker without importing it
+
+        :param str worker_type:  Worker type
+        :return dict:  Metadata, as collected by `get_worker_metadata()`, or
+        an empty dictionary for unknown workers
+        """
+        return self.metadata.get(worker_type, {})
 
     def load_datasources(self):
         """
@@ -361,10 +640,10 @@ class ModuleCollector:
         This import worker modules on-demand, so the code is only loaded if a
         worker that needs the code is actually queued and run
 
-        :return:  Worker class for the given worker metadata
+        :param str|dict worker:  Worker type, or worker metadata
+        :return:  Worker class for the given worker
         """
-        module = worker["module"]
-        if module not in sys.modules:
-            importlib.import_module(module)
+        if type(worker) is not str:
+            worker = worker["type"]
 
-        return getattr(sys.modules[module], worker["class_name"])
\ No newline at end of file
+        return self.workers[worker]
\ No newline at end of file
@@ -123,6 +123,28 @@ class JobQueue:
 
 		return [Job.get_by_data(job, self.db) for job in jobs if job]
 
+	def get_next_claimable_time(self):
+		"""
+		Get the time at which the next currently unclaimable job becomes
+		claimable
+
+		Jobs may be queued to be claimed only after a given time, and
+		recurring jobs can only be claimed once per interval. This returns the
+		earliest such time that is still in the future, so one knows when to
+		check the queue again.
+
+		:return int|None:  Timestamp, or `None` if no jobs are waiting for a
+		future time
+		"""
+		now = int(time.time())
+		next_time = self.db.fetchone(
+			"SELECT MIN(claimable_after) AS next_time FROM ("
+			"  SELECT GREATEST(timestamp_after, CASE WHEN interval > 0 THEN timestamp_lastclaimed + interval ELSE 0 END) AS claimable_after"
+			"    FROM jobs WHERE timestamp_claimed = 0"
+			") AS waiting WHERE claimable_after >= %s", (now,))
+
+		return next_time["next_time"] if next_time else None
+
 	def get_job_count(self, jobtype="*"):
 		"""
 		Get total number of jobs
@@ -194,6 +216,7 @@ class JobQueue:
 		}
 
 		self.db.insert("jobs", data, safe=True, constraints=("jobtype", "remote_id"))
+		self.db.notify(Job.NOTIFY_CHANNEL, worker_or_type)
 
 		return Job.get_by_data(data, database=self.db)
 
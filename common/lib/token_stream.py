@@ -0,0 +1,262 @@
+"""
+Compact, streamable storage of tokenised documents
+
+The tokeniser splits a dataset into documents (e.g. one per item or sentence),
+and each document into tokens. Storing these as a JSON list of lists means a
+processor using the tokens has to parse the whole list into memory before it
+can use any of it. A token stream instead consists of:
+
+* a vocabulary, i.e. all distinct tokens, in order of first occurrence;
+* the tokens of all documents, in order, as 32-bit positions in the
+  vocabulary;
+* per document, the position of its first token in that array.
+
+The arrays are stored as-is, so they can be memory-mapped: documents can be
+read one by one, and e.g. token frequencies can be counted without creating a
+Python string per token.
+
+A token stream file contains a magic number, the token IDs, padding to a
+multiple of 8 bytes, the document offsets (one more than there are
+documents, the last marking the end of the last document), the vocabulary as
+a JSON list, and a footer with the size and position of each of these.
+"""
+import array
+import pickle
+import struct
+import json
+import sys
+
+import numpy as np
+
+
+class TokenStream:
+    """
+    Read documents from a token stream file
+
+    Iterating over the stream yields each document as a list of tokens, so it
+    can be used in place of a list of token lists.
+    """
+    #: Start and end of token stream files
+    MAGIC = b"4CATTOK1"
+
+    #: Number of tokens, number of documents, position of offsets, position
+    #: of vocabulary, magic number
+    FOOTER = struct.Struct("<QQQQ8s")
+
+    #: Number of documents read at a time when iterating
+    CHUNK_SIZE = 4096
+
+    path = None
+    vocabulary = None
+    token_ids = None
+    offsets = None
+
+    def __init__(self, path):
+        """
+        Open a token stream
+
+        :param Path path:  Path to token stream file
+        """
+        self.path = path
+        with path.open("rb") as infile:
+            if infile.read(len(self.MAGIC)) != self.MAGIC:
+                raise ValueError(f"{path.name} is not a token stream")
+
+            file_size = infile.seek(0, 2)
+            if file_size < len(self.MAGIC) + self.FOOTER.size:
+                raise ValueError(f"Token stream {path.name} is incomplete")
+
+            infile.seek(file_size - self.FOOTER.size)
+            num_tokens, num_documents, offsets_start, vocabulary_start, magic = self.FOOTER.unpack(
+                infile.read(self.FOOTER.size))
+            if magic != self.MAGIC:
+                raise ValueError(f"Token stream {path.name} is incomplete")
+
+            infile.seek(vocabulary_start)
+            vocabulary = infile.read(file_size - self.FOOTER.size - vocabulary_start)
+
+        self.vocabulary = json.loads(vocabulary.decode("utf-8", errors="surrogatepass"))
+        self.token_ids = self._map("<u4", len(self.MAGIC), num_tokens)
+        self.offsets = self._map("<u8", offsets_start, num_documents + 1)
+
+    def _map(self, dtype, start, length):
+        """
+        Memory-map an array in the file
+
+        :param str dtype:  Type of the array's items
+        :param int start:  Position of the array in the file
+        :param int length:  Number of items in the array
+        :return np.ndarray:  Read-only array
+        """
+        if not length:
+            # empty files or arrays cannot be mapped
+            return np.zeros(0, dtype=dtype)
+
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=start, shape=(length,))
+
+    def get_token_ids(self, index):
+        """
+        Get the tokens of a document as positions in the vocabulary
+
+        :param int index:  Document number
+        :return np.ndarray:  Token IDs
+        """
+        return self.token_ids[int(self.offsets[index]):int(self.offsets[index + 1])]
+
+    def count_tokens(self):
+        """
+        Count how often each token in the vocabulary occurs in the stream
+
+        :return np.ndarray:  Number of occurrences per token ID
+        """
+        counts = np.zeros(len(self.vocabulary), dtype=np.int64)
+        chunk_size = self.CHUNK_SIZE * 256
+        for start in range(0, len(self.token_ids), chunk_size):
+            counts += np.bincount(self.token_ids[start:start + chunk_size], minlength=len(self.vocabulary))
+
+        return counts
+
+    def __getitem__(self, index):
+        """
+        Get a document
+
+        :param int index:  Document number
+        :return list:  Tokens
+        """
+        vocabulary = self.vocabulary
+        return [vocabulary[token_id] for token_id in self.get_token_ids(index).tolist()]
+
+    def __iter__(self):
+        """
+        Iterate through documents
+
+        :return generator:  Yields a list of tokens per document
+        """
+        vocabulary = self.vocabulary
+        num_documents = len(self)
+        for start in range(0, num_documents, self.CHUNK_SIZE):
+            end = min(start + self.CHUNK_SIZE, num_documents)
+            bounds = self.offsets[start:end + 1].tolist()
+            tokens = [vocabulary[token_id] for token_id in self.token_ids[bounds[0]:bounds[-1]].tolist()]
+            for document in range(end - start):
+                yield tokens[bounds[document] - bounds[0]:bounds[document + 1] - bounds[0]]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+class TokenStreamWriter:
+    """
+    Write documents to a token stream file
+
+    Documents are written as they are added; only the vocabulary and the
+    document offsets are kept in memory until the stream is closed.
+    """
+    #: Number of token IDs kept in memory before they are written to the file
+    BUFFER_SIZE = 1 << 16
+
+    path = None
+    handle = None
+    vocabulary = None
+    offsets = None
+    buffer = None
+    num_tokens = 0
+
+    def __init__(self, path):
+        """
+        Start a new token stream
+
+        :param Path path:  Path to write the stream to; overwritten if it
+        exists
+        """
+        self.path = path
+        self.vocabulary = {}
+        self.offsets = array.array("Q", [0])
+        self.buffer = array.array("I")
+        self.num_tokens = 0
+        self.handle = path.open("wb")
+        self.handle.write(TokenStream.MAGIC)
+
+    def add_document(self, tokens):
+        """
+        Add a document to the stream
+
+        :param list tokens:  Tokens in the document
+        :return int:  Document number
+        """
+        vocabulary = self.vocabulary
+        buffer = self.buffer
+        buffered = len(buffer)
+        for token in tokens:
+            token_id = vocabulary.get(token)
+            if token_id is None:
+                token_id = vocabulary[token] = len(vocabulary)
+
+            buffer.append(token_id)
+
+        self.num_tokens += len(buffer) - buffered
+        self.offsets.append(self.num_tokens)
+
+        if len(buffer) >= self.BUFFER_SIZE:
+            self._write_array(buffer)
+            self.buffer = array.array("I")
+
+        return len(self.offsets) - 2
+
+    def close(self):
+        """
+        Write the vocabulary and document offsets, and close the file
+        """
+        if not self.handle:
+            return
+
+        handle = self.handle
+        self._write_array(self.buffer)
+        handle.write(b"\0" * (-handle.tell() % 8))
+
+        offsets_start = handle.tell()
+        self._write_array(self.offsets)
+
+        vocabulary_start = handle.tell()
+        handle.write(json.dumps(list(self.vocabulary), ensure_ascii=False).encode("utf-8", errors="surrogatepass"))
+        handle.write(TokenStream.FOOTER.pack(self.num_tokens, len(self.offsets) - 1, offsets_start, vocabulary_start,
+                                             TokenStream.MAGIC))
+        handle.close()
+        self.handle = None
+
+    def _write_array(self, values):
+        """
+        Write an array of integers to the file, little-endian
+
+        :param array.array values:  Integers
+        """
+        if sys.byteorder == "big":
+            values = array.array(values.typecode, values)
+            values.byteswap()
+
+        self.handle.write(values.tobytes())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def load_tokens(path):
+    """
+    Get the documents in a token file
+
+    Token files written by older versions of the tokeniser, i.e. JSON or
+    pickle dumps of a list of token lists, are loaded into memory as a whole;
+    token streams are read as they are iterated through.
+
+    :param Path path:  Path to token file
+    :return TokenStream|list:  Documents, as lists of tokens
+    """
+    if path.suffix == ".tokens":
+        return TokenStream(path)
+
+    token_unpacker = pickle if path.suffix == ".pb" else json
+    with path.open("rb") as infile:
+        return token_unpacker.load(infile)
@@ -16,8 +16,9 @@ Flow:
    -> create separate sets of new posts and deleted posts
    -> mark deleted posts as deleted
    -> add new posts to database
-      -> save_post(): save post data to database
+      -> save_posts(): save data for all new posts to database at once
          -> queue_image(): if an image was attached, queue a job to scrape it
+      -> save_post(): save posts one by one if that fails
    -> update_thread(): update thread data
 """
 import psycopg2
@@ -27,6 +28,8 @@ import json
 import time
 import six
 
+from psycopg2 import sql
+
 from backend.lib.scraper import BasicJSONScraper
 from common.lib.exceptions import JobAlreadyExistsException
 
@@ -113,19 +116,18 @@ class ThreadScraper4chan(BasicJSONScraper):
 		deleted = set()
 		if not thread["is_sticky"]:
 			deleted = set(post_dict_db.keys()) - set(post_dict_scrape.keys())
-			for post_id in deleted:
-				self.db.upsert("posts_%s_deleted" % self.prefix, data={"id_seq": post_id_map[post_id], "timestamp_deleted": self.init_time}, constraints=["id_seq"], commit=False)
+			if deleted:
+				self.db.execute_many(
+					sql.SQL("INSERT INTO {} (id_seq, timestamp_deleted) VALUES %s ON CONFLICT (id_seq) DO UPDATE SET timestamp_deleted = EXCLUDED.timestamp_deleted").format(
+						sql.Identifier("posts_%s_deleted" % self.prefix)),
+					replacements=[(post_id_map[post_id], self.init_time) for post_id in deleted], commit=False,
+					page_size=1000)
 			self.db.commit()
 
 		# add new posts
 		new = set(post_dict_scrape.keys()) - set(post_dict_db.keys())
-		new_posts = 0
-		new_ids = set()
-		for post_id in new:
-			added = self.save_post(post_dict_scrape[post_id], thread, first_post)
-			if added:
-				new_posts += 1
-				new_ids.add(added)
+		new_ids = self.save_posts([post_dict_scrape[post_id] for post_id in new], thread, first_post)
+		new_posts = len(new_ids)
 
 		all_ids = set([post_id_map[post_id] for post_id in post_dict_scrape.keys() if post_id in post_id_map]).union(new_ids)
 		undeleted = 0
@@ -144,6 +146,64 @@ class ThreadScraper4chan(BasicJSONScraper):
 		# return the amount of new posts
 		return new_posts
 
+	def save_posts(self, posts, thread, first_post):
+		"""
+		Add posts to database
+
+		All posts are inserted with a single query. Posts that are already in
+		the database are skipped. If the query fails, e.g. because of invalid
+		data in one of the posts, the posts are saved one by one with
+		`save_post()` instead, so only the offending post is lost.
+
+		:param list posts:  Post data to add
+		:param dict thread:  Data for thread the posts belong to
+		:param dict first_post:  First post in thread
+		:return set:  `id_seq` of each post that was inserted
+		"""
+		post_data = {}
+		for post in posts:
+			data = self.get_post_data(post, thread)
+			if data:
+				post_data[post["no"]] = data
+
+		if not post_data:
+			return set()
+
+		columns = list(next(iter(post_data.values())).keys())
+		query = sql.SQL("INSERT INTO {} ({}) VALUES %s ON CONFLICT (id, board) DO NOTHING RETURNING id, id_seq").format(
+			sql.Identifier("posts_" + self.prefix), sql.SQL(", ").join([sql.Identifier(column) for column in columns]))
+
+		try:
+			inserted = self.db.execute_many(query, replacements=[tuple(data.values()) for data in post_data.values()],
+											commit=False, page_size=1000, fetch=True)
+		except (psycopg2.Error, ValueError) as e:
+			self.db.rollback()
+			self.log.warning("Could not save posts for thread %s/%s/%s in bulk (%s), saving one by one" % (
+				self.datasource, thread["board"], thread["id"], e))
+			new_ids = set()
+			for post in [post for post in posts if post["no"] in post_data]:
+				added = self.save_post(post, thread, first_post)
+				if added:
+					new_ids.add(added)
+			return new_ids
+
+		# posts that were skipped because they were already in the database
+		inserted = {row["id"]: row["id_seq"] for row in inserted}
+		dupes = [post_id for post_id in post_data if post_id not in inserted]
+		if dupes:
+			for dupe in self.db.fetchall("SELECT * FROM posts_" + self.prefix + " WHERE board = %s AND id IN %s",
+										 (thread["board"], tuple(dupes))):
+				self.log.info("Post %s in thread %s/%s/%s scraped twice: first seen in thread %s at %s" % (
+					dupe["id"], self.datasource, thread["board"], thread["id"], dupe["thread_id"], dupe["timestamp"]))
+
+		# Download images (exclude .webm files)
+		if self.config.get("fourchan-search.save_images"):
+			for post in posts:
+				if post["no"] in inserted and "filename" in post and post["ext"] != ".webm":
+					self.queue_image(post, thread)
+
+		return set(inserted.values())
+
 	def save_post(self, post, thread, first_post):
 		"""
 		Add post to database
@@ -153,11 +213,49 @@ class ThreadScraper4chan(BasicJSONScraper):
 		:param dict first_post:  First post in thread
 		:return bool:  Whether the post was inserted
 		"""
+		post_data = self.get_post_data(post, thread)
+		if not post_data:
+			return False
+
+		# now insert the post into the database
+		return_value = True
+		try:
+			return_value = self.db.insert("posts_" + self.prefix, post_data, return_field="id_seq")
+		except psycopg2.IntegrityError as e:
+			self.db.rollback()
+			dupe = self.db.fetchone("SELECT * from posts_" + self.prefix + " WHERE id = %s" % (str(post["no"]),))
+			if dupe:
+				self.log.info("Post %s in thread %s/%s/%s (time: %s) scraped twice: first seen as %s in thread %s at %s" % (
+				 post["no"], self.datasource, thread["board"], thread["id"], post["time"], dupe["id"], dupe["thread_id"], dupe["timestamp"]))
+			else:
+				self.log.error("Post %s in thread %s/%s/%s hit database constraint (%s) but no dupe was found?" % (
+				post["no"], self.datasource, thread["board"], thread["id"], e))
+
+			return False
+		except ValueError as e:
+			self.db.rollback()
+			self.log.error("ValueError (%s) during scrape of thread %s" % (e, post["no"]))
+
+		# Download images (exclude .webm files)
+		if "filename" in post and post["ext"] != ".webm" and self.config.get("fourchan-search.save_images"):
+			self.queue_image(post, thread)
+
+		return return_value
+
+	def get_post_data(self, post, thread):
+		"""
+		Get database row for a scraped post
+
+		:param dict post: Post data, as scraped
+		:param dict thread: Data for thread the post belongs to
+		:return dict|None:  Row to insert, or `None` if the post is missing
+		required data
+		"""
 		# check for data integrity
 		missing = set(self.required_fields) - set(post.keys())
 		if missing != set():
 			self.log.warning("Missing fields %s in scraped post in %s/%s, ignoring" % (repr(missing), self.datasource, self.job.data["remote_id"]))
-			return False
+			return None
 
 		# save dimensions as a dumpable dict - no need to make it indexable
 		if len({"w", "h", "tn_h", "tn_w"} - set(post.keys())) == 0:
@@ -189,36 +287,13 @@ class ThreadScraper4chan(BasicJSONScraper):
 				{field: post[field] for field in post.keys() if field not in self.known_fields})
 		}
 
-		# now insert the post into the database
-		return_value = True
-		try:
-			for field in post_data:
-				if not isinstance(post_data[field], six.string_types):
-					continue
-				# apparently, sometimes \0 appears in posts or something; psycopg2 can't cope with this
-				post_data[field] = post_data[field].replace("\0", "")
-
-			return_value = self.db.insert("posts_" + self.prefix, post_data, return_field="id_seq")
-		except psycopg2.IntegrityError as e:
-			self.db.rollback()
-			dupe = self.db.fetchone("SELECT * from posts_" + self.prefix + " WHERE id = %s" % (str(post["no"]),))
-			if dupe:
-				self.log.info("Post %s in thread %s/%s/%s (time: %s) scraped twice: first seen as %s in thread %s at %s" % (
-				 post["no"], self.datasource, thread["board"], thread["id"], post["time"], dupe["id"], dupe["thread_id"], dupe["timestamp"]))
-			else:
-				self.log.error("Post %s in thread %s/%s/%s hit database constraint (%s) but no dupe was found?" % (
-				post["no"], self.datasource, thread["board"], thread["id"], e))
-
-			return False
-		except ValueError as e:
-			self.db.rollback()
-			self.log.error("ValueError (%s) during scrape of thread %s" % (e, post["no"]))
+		for field in post_data:
+			if not isinstance(post_data[field], six.string_types):
+				continue
+			# apparently, sometimes \0 appears in posts or something; psycopg2 can't cope with this
+			post_data[field] = post_data[field].replace("\0", "")
 
-		# Download images (exclude .webm files)
-		if "filename" in post and post["ext"] != ".webm" and self.config.get("fourchan-search.save_images"):
-			self.queue_image(post, thread)
-
-		return return_value
+		return post_data
 
 	def queue_image(self, post, thread):
 		"""
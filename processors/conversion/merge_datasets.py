@@ -1,6 +1,8 @@
 """
 Merge one dataset with another (creating a new dataset)
 """
+import heapq
+import shutil
 import csv
 import json
 
@@ -33,6 +35,9 @@ class DatasetMerger(BasicProcessor):
     # a collector's csv or ndjson output
     compatibility = Compatibility(is_collector=True, extensions={"csv", "ndjson"})
 
+    # maximum number of item IDs kept in memory while looking for duplicates
+    RUN_SIZE = 250000
+
     @staticmethod
     def get_dataset_from_url(url, db, modules=None):
         """
@@ -156,9 +161,16 @@ class DatasetMerger(BasicProcessor):
         sorted_canonical_fieldnames = None
         writer = None
 
-        # find potential duplicates and check if columns are compatible (if
-        # merging csvs)
-        seen_ids = set()
+        # find potential duplicates
+        duplicate_items = None
+        if self.parameters["merge"] != "keep":
+            try:
+                duplicate_items = self.find_duplicates(source_datasets, total_items)
+            except NotImplementedError:
+                return self.dataset.finish_with_error("Datasets comprising other than NDJSON or CSV files cannot be "
+                                                      "merged. You can only merge NDJSON or CSV datasets.")
+
+        # check if columns are compatible (if merging csvs) and write items
         with self.dataset.get_results_path().open("w", encoding="utf-8", newline="") as outfile:
             for dataset in source_datasets:
                 warnings[dataset.key] = {}
@@ -187,12 +199,14 @@ class DatasetMerger(BasicProcessor):
                                                                       "attributes per item (are they not the same type or "
                                                                       "has one been altered by a processor?)")
 
+                        # items are in the same order as when looking for
+                        # duplicates, so the item's position identifies it
+                        position = processed
                         processed += 1
-                        if self.parameters["merge"] != "keep" and mapped_item.get("id") in seen_ids:
+                        if duplicate_items and duplicate_items[position >> 3] & (1 << (position & 7)):
                             duplicates += 1
                             continue
 
-                        seen_ids.add(mapped_item.get("id"))
                         merged += 1
 
                         if dataset.get_extension() == "csv":
@@ -231,6 +245,88 @@ class DatasetMerger(BasicProcessor):
             self.dataset.update_status(final_status, is_final=True)
             self.dataset.finish(processed)
 
+    def find_duplicates(self, datasets, total_items):
+        """
+        Find items with an ID that already occurred in the merged datasets
+
+        Keeping all IDs seen in memory does not scale to merging large
+        datasets. Instead, the IDs are read via `DataSet.iterate_columns()`,
+        so items do not need to be mapped again, and written to sorted run
+        files of at most `RUN_SIZE` IDs each, together with the position of
+        their item. The runs are then merged; of items with the same ID, only
+        the one that comes first is not a duplicate.
+
+        :param list datasets:  Datasets to merge, in order
+        :param int total_items:  Expected number of items, for status updates
+        :return bytearray:  Bitmap with one bit per item (in the order in which
+        the datasets are merged), set for items that are duplicates
+        """
+        staging_area = self.dataset.get_staging_area()
+        runs = []
+        buffer = []
+        position = 0
+
+        for dataset in datasets:
+            for batch in dataset.iterate_columns(["id"], processor=self):
+                if self.interrupted:
+                    raise ProcessorInterruptedException("Interrupted while looking for duplicates")
+
+                for item_id in batch["id"]:
+                    # the JSON encoding of an ID sorts (and compares) the same
+                    # for every item with that ID, whatever its type
+                    buffer.append((json.dumps(item_id, default=str), position))
+                    position += 1
+
+                if len(buffer) >= self.RUN_SIZE:
+                    runs.append(self.write_run(staging_area.joinpath(f"{len(runs)}.run"), buffer))
+                    buffer = []
+
+                self.dataset.update_status(f"Looking for duplicates ({position:,} of {total_items:,} items read)")
+
+        buffer.sort()
+        duplicate_items = bytearray((position + 7) // 8)
+        previous_id = None
+        for item_id, position in heapq.merge(buffer, *[self.read_run(run) for run in runs]):
+            # runs are sorted by ID and then position, so the first item with
+            # a given ID is the one that came first in the merged datasets
+            if item_id == previous_id:
+                duplicate_items[position >> 3] |= 1 << (position & 7)
+
+            previous_id = item_id
+
+        shutil.rmtree(staging_area, ignore_errors=True)
+        return duplicate_items
+
+    @staticmethod
+    def write_run(path, items):
+        """
+        Write a sorted run of IDs to disk
+
+        :param Path path:  Path to write to
+        :param list items:  List of `(encoded ID, position)` tuples, sorted in
+        place before writing
+        :return Path:  Path of the run file
+        """
+        items.sort()
+        with path.open("w", encoding="utf-8", newline="\n") as outfile:
+            # encoded IDs cannot contain tabs or newlines, as JSON escapes them
+            outfile.writelines([f"{item_id}\t{position}\n" for item_id, position in items])
+
+        return path
+
+    @staticmethod
+    def read_run(path):
+        """
+        Read a sorted run of IDs from disk
+
+        :param Path path:  Path to run file written by `write_run()`
+        :return generator:  Yields `(encoded ID, position)` tuples
+        """
+        with path.open(encoding="utf-8", newline="\n") as infile:
+            for line in infile:
+                item_id, position = line.rstrip("\n").rsplit("\t", 1)
+                yield item_id, int(position)
+
     def update_progress(self, processed, total, force=False):
         """
         Convenience function because in this processor the update is called in a couple of places
@@ -49,39 +49,53 @@ class BaseFilter(BasicProcessor):
         # Check if we need to copy over annotations
         copy_annotations = True if self.source_dataset.num_annotations() > 0 else False
 
-        zip_file = False
-        with self.dataset.get_results_path().open("w", encoding="utf-8", **kwargs) as outfile:
+        # CSV and NDJSON datasets can be filtered by storing which rows match,
+        # rather than a copy of them
+        as_view = parent_extension in ("csv", "ndjson") and self.config.get("4cat.filter_views", False)
 
-            writer = None
-            # Loop through all filtered posts. These ought to be the `original` object in case of a MappedItem; we're
-            # filtering, not changing the data (at least in principle).
+        zip_file = False
+        if as_view:
+            rows = []
             for item in matching_items:
-
-                # We're only storing the original items here.
-                # We still need the mapped data for annotations.
-                item_original = item.original
-
-                # Save the actual item
-                if parent_extension == "csv":
-                    if not writer:
-                        writer = csv.DictWriter(outfile, fieldnames=item_original.keys())
-                        writer.writeheader()
-                    writer.writerow(item_original)
-                elif parent_extension == "ndjson":
-                    outfile.write(json.dumps(item_original) + "\n")
-                elif parent_extension == "zip":
-                    if not zip_file:
-                        staging_area = self.dataset.get_staging_area()
-                        zip_file = True
-                    # copy the file from the source dataset to the new dataset
-                    shutil.copy2(item.file, staging_area)
-                else:
-                    raise NotImplementedError("Parent datasource of type %s cannot be filtered" % parent_extension)
-
+                rows.append(item.row_number)
                 if copy_annotations:
                     self.item_ids.append(item.get("id", ""))
 
-                num_posts += 1
+            if rows:
+                num_posts = self.dataset.save_as_view(self.source_dataset, rows, processor=self)
+
+        else:
+            with self.dataset.get_results_path().open("w", encoding="utf-8", **kwargs) as outfile:
+                writer = None
+                # Loop through all filtered posts. These ought to be the `original` object in case of a MappedItem; we're
+                # filtering, not changing the data (at least in principle).
+                for item in matching_items:
+
+                    # We're only storing the original items here.
+                    # We still need the mapped data for annotations.
+                    item_original = item.original
+
+                    # Save the actual item
+                    if parent_extension == "csv":
+                        if not writer:
+                            writer = csv.DictWriter(outfile, fieldnames=item_original.keys())
+                            writer.writeheader()
+                        writer.writerow(item_original)
+                    elif parent_extension == "ndjson":
+                        outfile.write(json.dumps(item_original) + "\n")
+                    elif parent_extension == "zip":
+                        if not zip_file:
+                            staging_area = self.dataset.get_staging_area()
+                            zip_file = True
+                        # copy the file from the source dataset to the new dataset
+                        shutil.copy2(item.file, staging_area)
+                    else:
+                        raise NotImplementedError("Parent datasource of type %s cannot be filtered" % parent_extension)
+
+                    if copy_annotations:
+                        self.item_ids.append(item.get("id", ""))
+
+                    num_posts += 1
 
         if num_posts == 0:
             self.dataset.update_status("No items matched your criteria", is_final=True)
@@ -5,6 +5,7 @@ import json
 
 from processors.filtering.base_filter import BaseFilter
 from common.lib.compatibility import Compatibility
+from common.lib.digest_set import DigestSet
 from common.lib.helpers import UserInput
 
 __author__ = "Sal Hagen"
@@ -25,6 +26,17 @@ class UniqueFilter(BaseFilter):
     # Allow on top-level CSV/NDJSON datasets
     compatibility = Compatibility(top_dataset_only=True, extensions={"csv", "ndjson"})
 
+    config = {
+        "unique-filter.max_memory_items": {
+            "type": UserInput.OPTION_TEXT,
+            "coerce_type": int,
+            "default": 5000000,
+            "help": "Unique filter: items in memory",
+            "tooltip": "When comparing hashes, the hashes of at most this many unique values are kept in memory; "
+                       "beyond that, they are stored on disk. Each takes about 20 bytes."
+        }
+    }
+
     def filter_items(self):
         """
         Create a generator to iterate through items that can be passed to create either a csv or ndjson. Use
@@ -49,44 +61,74 @@ class UniqueFilter(BaseFilter):
             columns = set(columns)
 
         # use sets, which auto-hash and deduplicate
-        known_values = {column: set() for column in columns}
-        known_items = set()
-
-        # iterate through posts and see if they match
-        for mapped_item in self.source_dataset.iterate_items(processor=self):
-            unique_item = False
-
-            if match_mode == "all":
-                # we can't hash a dictionary
-                # so instead, hash the json dump of the dictionary!
-                full_item = json.dumps({k: v for k, v in mapped_item.items() if k in columns})
-                if full_item not in known_items:
-                    unique_item = True
-                    known_items.add(full_item)
-
-            elif match_mode == "any":
-                unique_columns = set()
-                for column in columns:
-                    value = mapped_item.get(column)
-                    if type(value) is str and fold_case:
-                        value = value.lower()
-
-                    if value not in known_values[column]:
-                        unique_columns.add(column)
-                        known_values[column].add(value)
-
-                if unique_columns == columns:
-                    unique_item = True
+        # when comparing hashes, store digests of values instead, which take
+        # far less memory and can be moved to disk for very large datasets
+        if self.parameters.get("hash", True):
+            spill_path = self.dataset.get_staging_area()
+            max_memory_items = self.config.get("unique-filter.max_memory_items", 5000000)
+            known_values = {column: DigestSet(spill_path, max_memory_items) for column in columns}
+            known_items = DigestSet(spill_path, max_memory_items)
+
+            def encode(value):
+                # prefix strings, so e.g. "1" and 1 remain different values
+                return json.dumps(value, default=str) if type(value) is not str else "s" + value
+
+            def add(known, value):
+                return known.add(value)
+        else:
+            known_values = {column: set() for column in columns}
+            known_items = set()
 
-            if unique_item:
-                unique += 1
-                yield mapped_item
+            def encode(value):
+                return value
 
-            if processed % 500 == 0:
-                self.dataset.update_status("Processed %i posts (%i unique)" % (processed, unique))
-                self.dataset.update_progress(processed / self.source_dataset.num_rows)
+            def add(known, value):
+                # like DigestSet.add(), return whether the value is new
+                if value in known:
+                    return False
+                known.add(value)
+                return True
 
-            processed += 1
+        # iterate through posts and see if they match
+        try:
+            for mapped_item in self.source_dataset.iterate_items(processor=self):
+                unique_item = False
+
+                if match_mode == "all":
+                    # we can't hash a dictionary
+                    # so instead, hash the json dump of the dictionary!
+                    full_item = json.dumps({k: v for k, v in mapped_item.items() if k in columns})
+                    if add(known_items, full_item):
+                        unique_item = True
+
+                elif match_mode == "any":
+                    unique_columns = set()
+                    for column in columns:
+                        value = mapped_item.get(column)
+                        if type(value) is str and fold_case:
+                            value = value.lower()
+
+                        if add(known_values[column], encode(value)):
+                            unique_columns.add(column)
+
+                    if unique_columns == columns:
+                        unique_item = True
+
+                if unique_item:
+                    unique += 1
+                    yield mapped_item
+
+                if processed % 500 == 0:
+                    self.dataset.update_status("Processed %i posts (%i unique)" % (processed, unique))
+                    self.dataset.update_progress(processed / self.source_dataset.num_rows)
+
+                processed += 1
+        finally:
+            # digest sets that were moved to disk keep a file open, and
+            # delete it when closed
+            for known in (known_items, *known_values.values()):
+                if type(known) is DigestSet:
+                    known.close()
 
     @classmethod
     def get_options(cls, parent_dataset=None, config=None):
@@ -125,6 +167,13 @@ class UniqueFilter(BaseFilter):
                         "match a similar combination of values in another item, or if any single value has been "
                         "seen before. Ignored when matching on a single value."
             },
+            "hash": {
+                "type": UserInput.OPTION_TOGGLE,
+                "help": "Compare hashes",
+                "default": True,
+                "tooltip": "Compare hashes of values rather than the values themselves. This uses much less memory for "
+                        "large datasets. The chance that different values have the same hash is negligible."
+            },
             "fold-case": {
                 "type": UserInput.OPTION_TOGGLE,
                 "help": "Case insensitive",
@@ -29,6 +29,7 @@ class AudioToText(BasicProcessor):
     description = ("Detect speech and other sounds in audio and convert to text with either OpenAI's Whisper or "
                    " GPT models (GPT only via API).")  # description displayed in UI
     extension = "ndjson"  # extension of result file, used internally and in UI
+    resource_class = BasicProcessor.RESOURCE_ML
 
     # Allow on audio datasets
     compatibility = Compatibility(media_types={"audio"}, type_prefixes={"audio-extractor"})
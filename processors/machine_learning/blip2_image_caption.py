@@ -26,6 +26,7 @@ class CategorizeImagesCLIP(BasicProcessor):
     title = "Generate image captions using OpenAI's BLIP2 model"  # title displayed in UI
     description = "The BLIP2 model uses a pretrained image encoder combined with an LLM to generate image captions. The model can also be prompted and uses the image plus prompt to generate text responses."  # description displayed in UI
     extension = "ndjson"  # extension of result file, used internally and in UI
+    resource_class = BasicProcessor.RESOURCE_ML
 
     # image datasets (image archives or image-downloader output), when BLIP2 is enabled
     compatibility = Compatibility(media_types={"image"}, type_prefixes={"image-downloader"}, required_settings={"dmi-service-manager.fc_blip2_enabled", "dmi-service-manager.ab_server_address"}, preferred_followups=["image-text-wall"])
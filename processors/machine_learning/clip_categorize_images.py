@@ -28,6 +28,7 @@ class CategorizeImagesCLIP(BasicProcessor):
     description = ("Provide a list of categories and classify images with OpenAI's CLIP models. This will estimate "
                    "the likelihood an image belongs to a category (total of all category values will be 100%).")  # description displayed in UI
     extension = "ndjson"  # extension of result file, used internally and in UI
+    resource_class = BasicProcessor.RESOURCE_ML
 
     # image datasets (image archives or image-downloader output), when CLIP is enabled
     compatibility = Compatibility(media_types={"image"}, type_prefixes={"image-downloader"}, required_settings={"dmi-service-manager.cc_clip_enabled", "dmi-service-manager.ab_server_address"}, preferred_followups=["image-category-wall"])
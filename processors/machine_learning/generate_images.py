@@ -28,6 +28,7 @@ class StableDiffusionImageGenerator(BasicProcessor):
     title = "Generate images from text prompts"  # title displayed in UI
     description = "Given a list of prompts, generates images using the Stable Diffusion XL image model."  # description displayed in UI
     extension = "zip"  # extension of result file, used internally and in UI
+    resource_class = BasicProcessor.RESOURCE_ML
 
     # coarse map spec; is_compatible_with (below) is the runtime truth -- it also requires the
     # dataset to have columns (a prompt source), which can't be declared statically
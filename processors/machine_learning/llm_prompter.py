@@ -17,8 +17,10 @@ from datetime import datetime, timedelta
 
 from common.lib.item_mapping import MappedItem
 from common.lib.exceptions import ProcessorInterruptedException, QueryParametersException, QueryNeedsExplicitConfirmationException
-from common.lib.helpers import UserInput, nthify, andify, remove_nuls, flatten_dict
+from common.lib.helpers import UserInput, nthify, andify, remove_nuls, flatten_dict, convert_to_int
 from common.lib.llm.adapter import LLMAdapter
+from common.lib.llm.pipeline import LLMRequestPipeline
+from common.lib.llm.cache import LLMResponseCache
 from backend.lib.processor import BasicProcessor
 from common.lib.compatibility import Compatibility
 
@@ -38,6 +40,12 @@ class LLMPrompter(BasicProcessor):
     # tables, OR zip archives of image/video/audio media (_almost_ all zips but not)
     compatibility = Compatibility(extensions={"csv", "ndjson", "zip"})
 
+    # minimum number of seconds between requests to a server, to stay within
+    # its rate limit
+    request_intervals = {
+        "mistral": 1
+    }
+
     references = [
         "[Törnberg, Petter. 2023. 'How to Use LLMs for Text Analysis.' arXiv:2307.13106.](https://arxiv.org/pdf/2307."
         "13106)",
@@ -301,6 +309,14 @@ class LLMPrompter(BasicProcessor):
                 "tooltip": "Some models include reasoning in their output, between <think></think> tags. This option "
                            "removes this tag and its contents from the output.",
             },
+            "use_cache": {
+                "type": UserInput.OPTION_TOGGLE,
+                "help": "Re-use earlier responses",
+                "default": True,
+                "tooltip": "If the same prompt was sent to the same model with the same settings before, use the "
+                           "response it got then instead of prompting the model again. Disable to always get new "
+                           "responses, e.g. to compare outputs across runs.",
+            },
             "limit": {
                 "type": UserInput.OPTION_TEXT,
                 "help": "Only annotate this many items, then stop",
@@ -317,6 +333,9 @@ class LLMPrompter(BasicProcessor):
             }
         })
 
+        if config and not config.get("llm.response_cache_size"):
+            del options["use_cache"]
+
         # Get the media columns for the select media columns option
         if not is_media_parent and parent_dataset and parent_dataset.get_columns():
             columns = parent_dataset.get_columns()
@@ -445,6 +464,12 @@ class LLMPrompter(BasicProcessor):
         base_url_str = "" if not server["url"] else f" at base URL '{server['url']}'"
         self.dataset.log(f"Using LLM server '{server['_id']}' with model '{model['local_id']}'{base_url_str}")
 
+        # responses to prompts that were sent before can be re-used
+        cache = None
+        cache_size = convert_to_int(self.config.get("llm.response_cache_size", 0), 0)
+        if self.parameters.get("use_cache", True) and cache_size > 0:
+            cache = LLMResponseCache(self.config.get("PATH_DATA").joinpath(".llm-cache"), cache_size * 1024 * 1024)
+
         try:
             llm = LLMAdapter(
                 server=server,
@@ -452,7 +477,8 @@ class LLMPrompter(BasicProcessor):
                 api_key=api_key,
                 temperature=temperature,
                 max_tokens=max_tokens,
-                client_kwargs=client_kwargs
+                client_kwargs=client_kwargs,
+                cache=cache
             )
         except Exception as e:
             self.dataset.finish_with_error(str(e))
@@ -505,6 +531,13 @@ class LLMPrompter(BasicProcessor):
         if system_prompt_base:
             self.dataset.update_status(f'System prompt: "{system_prompt_base}"')
 
+        # several prompts can be sent at the same time, but the results are
+        # still written in the order of the dataset
+        pipeline = LLMRequestPipeline(
+            max_in_flight=convert_to_int(self.config.get("llm.concurrent_requests", 1), 1),
+            interval=self.request_intervals.get(model["server"], 0)
+        )
+
         time_start = time.time()
         with self.dataset.get_results_path().open("w", encoding="utf-8", newline="") as outfile:
 
@@ -544,50 +577,34 @@ class LLMPrompter(BasicProcessor):
                         self.dataset.log(f"Could not load .metadata.json for annotation mapping: {e}. "
                                          f"Annotations will use filenames as item IDs.")
 
-                for item in self.source_dataset.iterate_items(staging_area=staging_area, immediately_delete=True, get_annotations=False):
-
-                    if self.interrupted:
-                        raise ProcessorInterruptedException("Interrupted while generating text through LLMs")
-
-                    # Skip metadata and non-media files
-                    filename = item["id"] if "id" in item else str(item.get("filename", ""))
-                    if not filename or filename.startswith(".") or filename.rsplit(".", 1)[-1].lower() in ("json", "log", "txt"):
-                        continue
-                    row += 1
-
-                    item_id = filename
-                    media_file_path = item.file if hasattr(item, "file") else Path(item.get("path", ""))
-
-                    if not media_file_path or not media_file_path.exists():
-                        self.dataset.log(f"Skipping {filename}: file not found")
-                        skipped += 1
-                        continue
-
-                    prompt = base_prompt if base_prompt else f"Analyze this {media_archive_type} file."
-                    system_prompt = system_prompt_base
+                def write_media_output(request, response, error):
+                    """
+                    Write output for a media file, once the LLM has responded
+
+                    :return bool:  Whether processing can continue
+                    """
+                    nonlocal outputs
+                    item_id = request["item_id"]
+                    filename = request["filename"]
+                    prompt = request["prompt"]
+                    system_prompt = request["system_prompt"]
                     model_id = model['local_id']
 
-                    self.dataset.update_status(f"Processing {media_archive_type} file {row:,}/{max_processed:,} "
-                                               f"with {model['local_id']}")
-                    try:
-                        response = llm.generate_text(
-                            prompt,
-                            system_prompt=system_prompt,
-                            temperature=temperature,
-                            media_files=[media_file_path],
-                        )
-                    except Exception as e:
+                    # the file was kept for the request; it is no longer needed
+                    request["media_file_path"].unlink(missing_ok=True)
+
+                    if error:
                         # Best-effort heuristic to detect model incompatibility with media type.
                         # Error messages vary by server; this catches common patterns.
-                        error_str = str(e).lower()
+                        error_str = str(error).lower()
                         if "vision" in error_str or "image" in error_str or "multimodal" in error_str or "media" in error_str:
                             self.dataset.finish_with_error(
                                 f"The model '{model_id}' does not appear to support {media_archive_type} input. "
-                                f"Please use a model with {media_archive_type} support (e.g. a vision model for images): {e}"
+                                f"Please use a model with {media_archive_type} support (e.g. a vision model for images): {error}"
                             )
-                            return
-                        self.dataset.finish_with_warning(outputs, f"Not all items processed: {e}")
-                        return
+                            return False
+                        self.dataset.finish_with_warning(outputs, f"Not all items processed: {error}")
+                        return False
 
                     # Set model name from the response for more details
                     if hasattr(response, "response_metadata"):
@@ -599,7 +616,7 @@ class LLMPrompter(BasicProcessor):
                         structured_warning = " with your specified JSON schema" if structured_output else ""
                         warning = f"{model_id} could not return text{structured_warning}. Consider editing your prompt or changing settings."
                         self.dataset.finish_with_warning(outputs, warning)
-                        return
+                        return False
 
                     # Parse structured or plain output
                     if structured_output:
@@ -610,7 +627,7 @@ class LLMPrompter(BasicProcessor):
                             jsonschema.validate(instance=response, schema=json_schema)
                         except (ValidationError, SchemaError) as e:
                             self.dataset.finish_with_error(f"Invalid JSON schema and/or LLM output: `{e}`")
-                            return
+                            return False
                     else:
                         output = response.content
                         if not isinstance(output, list):
@@ -688,6 +705,46 @@ class LLMPrompter(BasicProcessor):
                                         f"{file_basename}: {remove_nuls(output_value)}"
                                     )
 
+                    return True
+
+                # files are deleted once the LLM has responded, since the
+                # request may still be in flight when the next file is read
+                for item in self.source_dataset.iterate_items(staging_area=staging_area, immediately_delete=False, get_annotations=False):
+
+                    if self.interrupted:
+                        pipeline.close()
+                        raise ProcessorInterruptedException("Interrupted while generating text through LLMs")
+
+                    # Skip metadata and non-media files
+                    filename = item["id"] if "id" in item else str(item.get("filename", ""))
+                    if not filename or filename.startswith(".") or filename.rsplit(".", 1)[-1].lower() in ("json", "log", "txt"):
+                        continue
+                    row += 1
+
+                    item_id = filename
+                    media_file_path = item.file if hasattr(item, "file") else Path(item.get("path", ""))
+
+                    if not media_file_path or not media_file_path.exists():
+                        self.dataset.log(f"Skipping {filename}: file not found")
+                        skipped += 1
+                        continue
+
+                    prompt = base_prompt if base_prompt else f"Analyze this {media_archive_type} file."
+                    system_prompt = system_prompt_base
+
+                    self.dataset.update_status(f"Processing {media_archive_type} file {row:,}/{max_processed:,} "
+                                               f"with {model['local_id']}")
+                    request = {"item_id": item_id, "filename": filename, "prompt": prompt,
+                               "system_prompt": system_prompt, "media_file_path": media_file_path}
+                    for request, response, error in pipeline.submit(request, llm.generate_text, prompt,
+                                                                    system_prompt=system_prompt,
+                                                                    temperature=temperature,
+                                                                    media_files=[media_file_path],
+                                                                    before_invoke=pipeline.wait):
+                        if not write_media_output(request, response, error):
+                            pipeline.close()
+                            return
+
                     i += 1
                     if limit and i >= max_processed:
                         limit_reached = True
@@ -710,21 +767,176 @@ class LLMPrompter(BasicProcessor):
 
                     self.dataset.update_progress(row / max_processed)
 
-                    # Rate limits for different servers
-                    if model["server"] == "mistral":
-                        time.sleep(1)
-
                     if limit_reached:
                         break
 
+                for request, response, error in pipeline.finish():
+                    if not write_media_output(request, response, error):
+                        pipeline.close()
+                        return
+
             else:
                 # Text-based dataset processing (CSV or NDJSON)
                 row = 0
                 max_processed = min(limit, self.source_dataset.num_rows) if limit else self.source_dataset.num_rows
+
+                def write_text_output(request, response, error):
+                    """
+                    Write output for a prompt, once the LLM has responded
+
+                    :return bool:  Whether processing can continue
+                    """
+                    nonlocal outputs, skipped
+                    row = request["row"]
+                    prompt = request["prompt"]
+                    system_prompt = request["system_prompt"]
+                    media_urls = request["media_urls"]
+                    json_schema = request["json_schema"]
+                    batched_data = request["batched_data"]
+                    batched_ids = request["batched_ids"]
+                    n_batched = len(batched_ids)
+
+                    # Catch 404 errors with media URLs, we simply skip these
+                    if isinstance(error, requests.exceptions.HTTPError):
+                        if error.response.status_code == 404 and media_urls:
+                            self.dataset.log(f"Skipping row {row} because of media URL is not reachable, ({error})")
+                            skipped += 1
+                            return True
+                        else:
+                            self.dataset.finish_with_warning(outputs, f"{error}")
+                            return False
+                    # Broad exception, but necessary with all the different LLM servers and options...
+                    elif error:
+                        self.dataset.finish_with_warning(outputs, f"Not all items processed: {error}")
+                        return False
+
+                    if not response:
+                        structured_warning = " with your specified JSON schema" if structured_output else ""
+                        warning = f"{model['name']} could not return text{structured_warning}. Consider editing your prompt or changing settings."
+                        self.dataset.finish_with_warning(outputs, warning)
+                        return False
+
+                    # Always parse JSON outputs in the case of batches.
+                    if use_batches or structured_output:
+                        if isinstance(response, str):
+                            response = json.loads(response)
+                    
+                        # Check whether input/output value lengths match
+                        if use_batches:
+                            output = self.parse_batched_response(response)
+
+                            if len(output) != n_batched:
+                                self.dataset.update_status(f"Output did not result in {n_batched} item(s).\nInput:\n"
+                                                           f"{prompt}\nOutput:\n{response}")
+                                self.dataset.finish_with_warning(outputs, "Model could not output as many values as the batch. See log "
+                                                               "for incorrect output. Try lowering the batch size, "
+                                                               "editing the prompt, or using a different model.")
+                                return False
+                        else:
+                            output = [response]
+
+                        # Also validate whether the JSON schema and the output match
+                        try:
+                            jsonschema.validate(instance=response, schema=json_schema)
+                        except (ValidationError, SchemaError) as e:
+                            self.dataset.finish_with_error(f"Invalid JSON schema and/or LLM output: `{e}`")
+                            return False
+
+                    # Else we'll just store the output in a list
+                    else:
+
+                        output = response.content
+
+                        if not isinstance(output, list):
+                            output = [output]
+
+                        # More cleaning
+                        # Newer OpenAI models and Magistral return annoying nested dict with 'thinking'/'reasoning and
+                        # 'text', flatten it
+                        if len(output) > 0 and isinstance(output[0], dict) and output[0].get("type") in ["thinking",
+                                                                                                         "reasoning"]:
+                            reasoning_string = output[0].get("type")  # "thinking" or "reasoning"
+                            output_flat = {reasoning_string: "", "text": []}
+
+                            for output_part in output:
+                                if output_part.get("type") == reasoning_string:
+                                    if reasoning_string in output_part and isinstance(output_part[reasoning_string], list):
+                                        output_flat[reasoning_string] += "\n".join(
+                                            [think.get("text", "") for think in output_part.get(reasoning_string, [])])
+                                    else:
+                                        output_flat[reasoning_string] += output_part.get("text", "")
+                                else:
+                                    output_flat["text"].append(output_part.get("text", ""))
+
+                            output_flat["text"] = "\n".join(output_flat["text"])
+                            output = [output_flat]
+
+                    for n, output_item in enumerate(output):
+
+                        # Retrieve the input values used
+                        if use_batches:
+                            input_value = [v[n] for v in batched_data.values()]
+                        else:
+                            input_value = [v[0] for v in batched_data.values()]
+
+                        time_created = int(time.time())
+
+                        # remove reasoning if so desired
+                        if hide_think:
+                            if isinstance(output_item, str):
+                                output_item = re.sub(r"<think>.*</think>", "", output_item, flags=re.DOTALL).strip()
+                            elif isinstance(output_item, dict):
+                                if "thinking" in output_item:
+                                    del output_item["thinking"]
+
+                        result = {
+                            "id": batched_ids[n],
+                            "output": output_item,
+                            "input_value": input_value,
+                            "prompt": prompt if not use_batches else base_prompt,  # Insert dataset values if not batching
+                            "temperature": temperature,
+                            "max_tokens": max_tokens,
+                            "model": model["local_id"],
+                            "time_created": datetime.fromtimestamp(time_created).strftime("%Y-%m-%d %H:%M:%S"),
+                            "time_created_utc": time_created,
+                            "batch_number": n + 1 if use_batches else "",
+                            "system_prompt": system_prompt,
+                        }
+                        outfile.write(json.dumps(result) + "\n")
+                        outputs += 1
+
+                        if save_annotations:
+                            # Save annotations for every value produced by the LLM, in case of structured output.
+                            # Else this will just save one string.
+                            if isinstance(output_item, dict):
+                                annotation_output = flatten_dict({model['name']: output_item})
+                            elif self.parameters.get("annotation_label"):
+                                annotation_output = {self.parameters.get("annotation_label"): output_item}
+                            else:
+                                annotation_output = {model['name'] + "_output": output_item}
+
+                            for output_key, output_value in annotation_output.items():
+
+                                # Skip 'signature' and 'type' annotations for Google
+                                if model["server"] == "google" and output_key in ("extras.signature", ".type"):
+                                    continue
+
+                                annotation = {
+                                    "label": output_key,
+                                    "item_id": batched_ids[n],
+                                    "value": remove_nuls(output_value),
+                                    "type": "text",
+                                }
+
+                                annotations.append(annotation)
+
+                    return True
+
                 for item in self.source_dataset.iterate_items():
                     row += 1
 
                     if self.interrupted:
+                        pipeline.close()
                         raise ProcessorInterruptedException("Interrupted while generating text through LLMs")
 
                     # Replace with dataset values
@@ -831,7 +1043,8 @@ class LLMPrompter(BasicProcessor):
                                     api_key=api_key,
                                     temperature=temperature,
                                     max_tokens=max_tokens,
-                                    client_kwargs=client_kwargs
+                                    client_kwargs=client_kwargs,
+                                    cache=cache
                                 )
                                 llm.set_structure(json_schema)
 
@@ -844,158 +1057,23 @@ class LLMPrompter(BasicProcessor):
                         batch_str = f" and {n_batched} items batched into the prompt" if use_batches else ""
                         self.dataset.update_status(f"Generating text at row {row:,}/"
                                                    f"{max_processed:,} with {model['name']}{batch_str}")
-                        # Now finally generate some text!
-                        try:
-                            response = llm.generate_text(
-                                prompt,
-                                system_prompt=system_prompt,
-                                temperature=temperature,
-                                files=media_urls
-                            )
-
-                        # Catch 404 errors with media URLs, we simply skip these
-                        except requests.exceptions.HTTPError as e:
-                            if e.response.status_code == 404 and media_urls:
-                                self.dataset.log(f"Skipping row {row} because of media URL is not reachable, ({e})")
-                                skipped += 1
-                                continue
-                            else:
-                                self.dataset.finish_with_warning(outputs, f"{e}")
-                                return
-                        # Broad exception, but necessary with all the different LLM servers and options...
-                        except Exception as e:
-                            self.dataset.finish_with_warning(outputs, f"Not all items processed: {e}")
-                            return
-
-                        if not response:
-                            structured_warning = " with your specified JSON schema" if structured_output else ""
-                            warning = f"{model['name']} could not return text{structured_warning}. Consider editing your prompt or changing settings."
-                            self.dataset.finish_with_warning(outputs, warning)
-                            return
-
-                        # Always parse JSON outputs in the case of batches.
-                        if use_batches or structured_output:
-                            if isinstance(response, str):
-                                response = json.loads(response)
-                        
-                            # Check whether input/output value lengths match
-                            if use_batches:
-                                output = self.parse_batched_response(response)
-
-                                if len(output) != n_batched:
-                                    self.dataset.update_status(f"Output did not result in {n_batched} item(s).\nInput:\n"
-                                                               f"{prompt}\nOutput:\n{response}")
-                                    self.dataset.finish_with_warning(outputs, "Model could not output as many values as the batch. See log "
-                                                                   "for incorrect output. Try lowering the batch size, "
-                                                                   "editing the prompt, or using a different model.")
-                                    return
-                            else:
-                                output = [response]
-
-                            # Also validate whether the JSON schema and the output match
-                            try:
-                                jsonschema.validate(instance=response, schema=json_schema)
-                            except (ValidationError, SchemaError) as e:
-                                self.dataset.finish_with_error(f"Invalid JSON schema and/or LLM output: `{e}`")
+                        request = {"row": row, "prompt": prompt, "system_prompt": system_prompt,
+                                   "media_urls": media_urls, "json_schema": json_schema,
+                                   "batched_data": batched_data, "batched_ids": batched_ids}
+                        for request, response, error in pipeline.submit(request, llm.generate_text, prompt,
+                                                                        system_prompt=system_prompt,
+                                                                        temperature=temperature,
+                                                                        files=media_urls,
+                                                                        before_invoke=pipeline.wait):
+                            if not write_text_output(request, response, error):
+                                pipeline.close()
                                 return
 
-                        # Else we'll just store the output in a list
-                        else:
-
-                            output = response.content
-
-                            if not isinstance(output, list):
-                                output = [output]
-
-                            # More cleaning
-                            # Newer OpenAI models and Magistral return annoying nested dict with 'thinking'/'reasoning and
-                            # 'text', flatten it
-                            if len(output) > 0 and isinstance(output[0], dict) and output[0].get("type") in ["thinking",
-                                                                                                             "reasoning"]:
-                                reasoning_string = output[0].get("type")  # "thinking" or "reasoning"
-                                output_flat = {reasoning_string: "", "text": []}
-
-                                for output_part in output:
-                                    if output_part.get("type") == reasoning_string:
-                                        if reasoning_string in output_part and isinstance(output_part[reasoning_string], list):
-                                            output_flat[reasoning_string] += "\n".join(
-                                                [think.get("text", "") for think in output_part.get(reasoning_string, [])])
-                                        else:
-                                            output_flat[reasoning_string] += output_part.get("text", "")
-                                    else:
-                                        output_flat["text"].append(output_part.get("text", ""))
-
-                                output_flat["text"] = "\n".join(output_flat["text"])
-                                output = [output_flat]
-
-                        for n, output_item in enumerate(output):
-
-                            # Retrieve the input values used
-                            if use_batches:
-                                input_value = [v[n] for v in batched_data.values()]
-                            else:
-                                input_value = [v[0] for v in batched_data.values()]
-
-                            time_created = int(time.time())
-
-                            # remove reasoning if so desired
-                            if hide_think:
-                                if isinstance(output_item, str):
-                                    output_item = re.sub(r"<think>.*</think>", "", output_item, flags=re.DOTALL).strip()
-                                elif isinstance(output_item, dict):
-                                    if "thinking" in output_item:
-                                        del output_item["thinking"]
-
-                            result = {
-                                "id": batched_ids[n],
-                                "output": output_item,
-                                "input_value": input_value,
-                                "prompt": prompt if not use_batches else base_prompt,  # Insert dataset values if not batching
-                                "temperature": temperature,
-                                "max_tokens": max_tokens,
-                                "model": model["local_id"],
-                                "time_created": datetime.fromtimestamp(time_created).strftime("%Y-%m-%d %H:%M:%S"),
-                                "time_created_utc": time_created,
-                                "batch_number": n + 1 if use_batches else "",
-                                "system_prompt": system_prompt,
-                            }
-                            outfile.write(json.dumps(result) + "\n")
-                            outputs += 1
-
-                            if save_annotations:
-                                # Save annotations for every value produced by the LLM, in case of structured output.
-                                # Else this will just save one string.
-                                if isinstance(output_item, dict):
-                                    annotation_output = flatten_dict({model['name']: output_item})
-                                elif self.parameters.get("annotation_label"):
-                                    annotation_output = {self.parameters.get("annotation_label"): output_item}
-                                else:
-                                    annotation_output = {model['name'] + "_output": output_item}
-
-                                for output_key, output_value in annotation_output.items():
-
-                                    # Skip 'signature' and 'type' annotations for Google
-                                    if model["server"] == "google" and output_key in ("extras.signature", ".type"):
-                                        continue
-
-                                    annotation = {
-                                        "label": output_key,
-                                        "item_id": batched_ids[n],
-                                        "value": remove_nuls(output_value),
-                                        "type": "text",
-                                    }
-
-                                    annotations.append(annotation)
-
                         # Remove batched data and store what row we've left off
                         batched_ids = []
                         batched_data = {}
                         n_batched = 0
 
-                        # Rate limits for different servers
-                        if model["server"] == "mistral":
-                            time.sleep(1)
-
                     # Write annotations in batches
                     if (i % 1000 == 0 and annotations) or limit_reached:
                         self.save_annotations(annotations)
@@ -1005,8 +1083,16 @@ class LLMPrompter(BasicProcessor):
                     if limit_reached:
                         break
 
+                for request, response, error in pipeline.finish():
+                    if not write_text_output(request, response, error):
+                        pipeline.close()
+                        return
+
         outfile.close()
 
+        if cache and cache.written:
+            cache.evict()
+
         if not outputs:
             self.dataset.finish_with_error("Did not generate any output")
             return
@@ -33,6 +33,7 @@ class PixPlotGenerator(BasicProcessor):
     description = "Put all images from an archive into a PixPlot visualisation: an explorable map of images " \
                   "algorithmically grouped by similarity."
     extension = "html"  # extension of result file, used internally and in UI
+    resource_class = BasicProcessor.RESOURCE_ML
 
     # image datasets (image archives or image-downloader output), when PixPlot is enabled
     compatibility = Compatibility(media_types={"image"}, type_prefixes={"image-downloader"}, required_settings={"dmi-service-manager.db_pixplot_enabled", "dmi-service-manager.ab_server_address"})
@@ -97,38 +97,42 @@ class CountPosts(BasicProcessor):
         with self.dataset.get_results_path().open("w"):
             counter = 0
 
-            for post in self.source_dataset.iterate_items(self):
-                # Ensure the post has a date
-                if timeframe != "all" and not post.get(column):
-                    # Count these as "unknown_date"
-                    unknown_dates += 1
-                else:
-                    try:
-                        date = get_interval_descriptor(post, timeframe, item_column=column)
-                    except ValueError as e:
+            # only one column is needed, so read just that column
+            for batch in self.source_dataset.iterate_columns([column], processor=self):
+                for value in batch[column]:
+                    post = {column: value}
+
+                    # Ensure the post has a date
+                    if timeframe != "all" and not post.get(column):
+                        # Count these as "unknown_date"
+                        unknown_dates += 1
+                    else:
+                        try:
+                            date = get_interval_descriptor(post, timeframe, item_column=column)
+                        except ValueError as e:
+                            self.dataset.update_status(
+                                f"{e}, cannot count items per {timeframe}", is_final=True
+                            )
+                            self.dataset.update_status(0)
+                            return
+
+                        # Add a count for the respective timeframe
+                        if date not in intervals:
+                            intervals[date] = {}
+                            intervals[date]["absolute"] = 1
+                        else:
+                            intervals[date]["absolute"] += 1
+
+                        first_interval = min(first_interval, date)
+                        last_interval = max(last_interval, date)
+
+                    counter += 1
+
+                    if counter % 2500 == 0:
                         self.dataset.update_status(
-                            f"{e}, cannot count items per {timeframe}", is_final=True
+                            f"Counted {counter:,} of {self.source_dataset.num_rows:,} items."
                         )
-                        self.dataset.update_status(0)
-                        return
-
-                    # Add a count for the respective timeframe
-                    if date not in intervals:
-                        intervals[date] = {}
-                        intervals[date]["absolute"] = 1
-                    else:
-                        intervals[date]["absolute"] += 1
-
-                    first_interval = min(first_interval, date)
-                    last_interval = max(last_interval, date)
-
-                counter += 1
-
-                if counter % 2500 == 0:
-                    self.dataset.update_status(
-                        f"Counted {counter:,} of {self.source_dataset.num_rows:,} items."
-                    )
-                    self.dataset.update_progress(counter / self.source_dataset.num_rows)
+                        self.dataset.update_progress(counter / self.source_dataset.num_rows)
 
             # pad interval if needed, this is useful if the result is to be
             # visualised as a histogram, for example
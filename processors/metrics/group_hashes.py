@@ -5,6 +5,7 @@ import imagehash
 from backend.lib.processor import BasicProcessor
 from common.lib.compatibility import Compatibility
 from common.lib.exceptions import ProcessorInterruptedException
+from common.lib.hash_index import UnionFind, get_hash_index, pack_hash
 from common.lib.helpers import UserInput, normalize_crhash_components
 
 __author__ = "Dale Wahl"
@@ -59,27 +60,34 @@ class HashGrouper(BasicProcessor):
         - For crhash: Each item may be either an object with `.hashes` or a list of
           component ImageHash objects. Distance is the minimum pairwise Hamming distance
           between components. Allowed bits per pair uses the smaller component bit-length.
+
+        Hashes are indexed (see `common.lib.hash_index`) and grouped with
+        union-find, so that not every pair of hashes needs to be compared.
         """
         n = len(hashes)
         if n == 0:
             return []
 
-        # Prebind distance and allowed bits based on type
+        # Rather than comparing every pair of hashes, each hash is looked up in
+        # an index of the hashes before it, and merged with the groups of any
+        # hashes found within the allowed distance
+        groups = UnionFind(n)
         if hash_type in ("phash", "whash-haar", "whash-db4"):
             if hash_size is None:
                 raise ValueError("hash_size required for fixed-length hashes")
             total_bits = int(hash_size) * int(hash_size)
-            allowed_const = int((similarity_pct / 100.0) * total_bits)
-
-            def distance_fn(i: int, j: int) -> int:
-                return hashes[i] - hashes[j]
+            allowed_bits = int((similarity_pct / 100.0) * total_bits)
 
-            def allowed_bits(i: int, j: int) -> int:
-                return allowed_const
+            index = get_hash_index(total_bits, allowed_bits)
+            for i, h in enumerate(hashes):
+                packed = pack_hash(h)
+                for j, _ in index.query(packed, allowed_bits):
+                    groups.union(i, j)
+                index.add(packed, i)
 
         elif hash_type == "crhash":
             # Normalize to lists of components and precompute component bit lengths
-            comps = []  # list[list[ImageHash]]
+            comps = []  # list[list[tuple[bits, packed hash]]]
             comp_bits = []
             for idx, h in enumerate(hashes):
                 try:
@@ -90,49 +98,32 @@ class HashGrouper(BasicProcessor):
                     bits0 = c[0].hash.size
                 except Exception as e:
                     raise ValueError(f"Invalid crop-resistant component at index {idx}: {e}")
-                comps.append(c)
+                comps.append([(component.hash.size, pack_hash(component)) for component in c])
                 comp_bits.append(bits0)
 
-            def distance_fn(i: int, j: int) -> int:
-                best = None
-                for a in comps[i]:
-                    for b in comps[j]:
-                        d = a - b
-                        if best is None or d < best:
-                            best = d
-                            if best == 0:
-                                return 0
-                return best  # type: ignore[return-value]
-
-            def allowed_bits(i: int, j: int) -> int:
-                bits = comp_bits[i] if comp_bits[i] <= comp_bits[j] else comp_bits[j]
-                return int((similarity_pct / 100.0) * bits)
+            # Distance is the minimum distance between any two components, so
+            # two items are similar if any of their components are. Components
+            # can only be compared to components of the same size; allowed bits
+            # per pair uses the smaller component bit-length of the two items.
+            radius = int((similarity_pct / 100.0) * max(comp_bits))
+            indexes = {}
+            for i, components in enumerate(comps):
+                for bits, packed in components:
+                    if bits not in indexes:
+                        continue
+                    for j, distance in indexes[bits].query(packed, radius):
+                        if distance <= int((similarity_pct / 100.0) * min(comp_bits[i], comp_bits[j])):
+                            groups.union(i, j)
+
+                for bits, packed in components:
+                    if bits not in indexes:
+                        indexes[bits] = get_hash_index(bits, radius)
+                    indexes[bits].add(packed, i)
 
         else:
             raise ValueError(f"Unknown hash type for grouping: {hash_type}")
 
-        # Connected-components labeling
-        visited = [False] * n
-        labels = [-1] * n
-        gid = 0
-        for seed in range(n):
-            if visited[seed]:
-                continue
-            stack = [seed]
-            visited[seed] = True
-            labels[seed] = gid
-            while stack:
-                u = stack.pop()
-                for v in range(n):
-                    if visited[v]:
-                        continue
-                    d = distance_fn(u, v)
-                    if d <= allowed_bits(u, v):
-                        visited[v] = True
-                        labels[v] = gid
-                        stack.append(v)
-            gid += 1
-        return labels
+        return groups.labels()
 
     def process(self):
         """
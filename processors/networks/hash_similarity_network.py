@@ -4,11 +4,11 @@ Calculate similarity of hashes and create a GEXF network file.
 Only supports bit based hashes currently (e.g., 101010101110110011)
 """
 import networkx as nx
-import numpy as np
 
 from backend.lib.processor import BasicProcessor
 from common.lib.compatibility import Compatibility
-from common.lib.exceptions import ProcessorException
+from common.lib.exceptions import ProcessorInterruptedException
+from common.lib.hash_index import get_hash_index, pack_hash
 from common.lib.helpers import UserInput
 
 
@@ -132,7 +132,7 @@ class HashSimilarityNetworker(BasicProcessor):
             if item_hash:
                 if len(item_hash) == bit_length:
                     identifiers.append(item_id)
-                    hashes.append(np.array(item_hash))
+                    hashes.append(pack_hash(item_hash))
 
                     # Append any metadata associated with hash for Gephi
                     for key, value in item.items():
@@ -166,41 +166,28 @@ class HashSimilarityNetworker(BasicProcessor):
         for node in identifiers:
             network.add_node(node, **hash_metadata[node])
 
-        hashes = np.array(hashes)
+        # rather than comparing all pairs of hashes, look up each hash's
+        # neighbours among the hashes before it in an index; any pair that is
+        # similar enough is at most this many bits apart
+        max_distance = int((1 - percent_similar) * bit_length)
         self.dataset.update_status("Comparing %i hashes with each other" % len(hashes))
-        comparisons = 0
-        expected_comparisons = np.math.comb(len(hashes), 2)
+        index = get_hash_index(bit_length, max_distance)
         for i, current_hash in enumerate(hashes):
-            # Remove this hash from hashes (as previous calculations have already occured and it is unnecessary to
-            # compare a hash to itself)
-            hashes = hashes[1:]
-
-            # Compare current hash
-            xor_result = np.bitwise_xor(current_hash, hashes)
-
-            # Add comparisons to network
-            for j, xor_comparison in enumerate(xor_result):
-                id1 = identifiers[i]
-                # Node 2 is this iteration plus comparison number PLUS one as the first hash of this set has been
-                # removed (e.g., very first ID2 is 0+0+1)
-                id2 = identifiers[i+j+1]
-
-                # Check if edge exists (it shouldn't!)
-                edge = (id1, id2)
-                if edge in network.edges():
-                    raise ProcessorException('Error in processing hash similarities')
-
-                # Check if xor_comparison is less than requested similarity
-                # xor compares each bit and returns 0 if a bit is the same and 1 if different
-                edge_percent_similar = 1 - (xor_comparison.sum() / bit_length)
+            if self.interrupted:
+                raise ProcessorInterruptedException("Interrupted while comparing hashes")
+
+            for j, distance in sorted(index.query(current_hash, max_distance)):
+                # xor compares each bit and returns 0 if a bit is the same and
+                # 1 if different, so the distance is the number of different bits
+                edge_percent_similar = 1 - (distance / bit_length)
                 if edge_percent_similar > percent_similar:
-                    network.add_edge(id1, id2, weight=edge_percent_similar)
+                    network.add_edge(identifiers[j], identifiers[i], weight=edge_percent_similar)
+
+            index.add(current_hash, i)
 
-                comparisons += 1
-                if comparisons % 500 == 0:
-                    self.dataset.update_status(
-                        "Calculated %i of %i hash similarities" % (comparisons, expected_comparisons))
-                    self.dataset.update_progress(comparisons / expected_comparisons)
+            if i % 500 == 0:
+                self.dataset.update_status("Compared %i of %i hashes" % (i, len(hashes)))
+                self.dataset.update_progress(i / len(hashes))
 
         if not network.edges():
             self.dataset.finish_as_empty("No edges could be created for the given parameters")
@@ -2,7 +2,6 @@
 Calculate word collocations from tokens
 """
 import json
-import pickle
 
 
 import operator
@@ -11,6 +10,7 @@ from nltk.collocations import TrigramCollocationFinder, BigramCollocationFinder
 from common.lib.helpers import UserInput
 from backend.lib.processor import BasicProcessor
 from common.lib.compatibility import Compatibility
+from common.lib.token_stream import load_tokens
 
 
 class GetCollocations(BasicProcessor):
@@ -167,11 +167,7 @@ class GetCollocations(BasicProcessor):
 
 				# Don't get co-words from metadata
 				continue
-			# we support both pickle and json dumps of vectors
-			token_unpacker = pickle if token_file.file.suffix == "pb" else json
-
-			with token_file.file.open("rb") as binary_tokens:
-				tokens = token_unpacker.load(binary_tokens)
+			tokens = load_tokens(token_file.file)
 
 			# Get the date
 			date_string = token_file.file.stem
@@ -107,10 +107,10 @@ class TopicModelWordExtractor(BasicProcessor):
         for token_filename, model_data in model_metadata.items():
             for topic in model_data['model_topics'].values():
                 topics.append({
-                                'topic_interval': token_filename.rstrip('.json'),
+                                'topic_interval': token_filename.rsplit('.', 1)[0],
                                 'topic_number': topic['topic_index'] + 1, # Adding 1 to conform with other processors
                                 'top_five_features': ', '.join([f+': '+str(w) for f,w in topic['top_five_features'].items()]),
-                                'number_of_documents': topics_count[token_filename.rstrip('.json') + str(topic['topic_index'])],
+                                'number_of_documents': topics_count[token_filename.rsplit('.', 1)[0] + str(topic['topic_index'])],
                                 })
 
         self.write_csv_items_and_finish(topics)
@@ -12,6 +12,7 @@ from common.lib.helpers import UserInput, convert_to_int
 from backend.lib.processor import BasicProcessor
 from common.lib.compatibility import Compatibility
 from common.lib.exceptions import ProcessorInterruptedException
+from common.lib.token_stream import TokenStream
 
 __author__ = "Sal Hagen"
 __credits__ = ["Sal Hagen", "Stijn Peeters", "Tom Willaert"]
@@ -32,6 +33,8 @@ class GenerateWordEmbeddings(BasicProcessor):
 				  "e.g. exist of 100 numbers). These numeric word representations can be used to extract words with similar contexts. " \
 				  "Note that good models require a lot of data."  # description displayed in UI
 	extension = "zip"  # extension of result file, used internally and in UI
+	run_in_process = True  # CPU-bound, so do not share the interpreter with other workers
+	resource_class = BasicProcessor.RESOURCE_CPU
 
 	# Allow processor on token sets
 	compatibility = Compatibility(types={"tokenise-posts"}, preferred_followups=["similar-word2vec", "histwords-vectspace"])
@@ -210,8 +213,9 @@ class GenerateWordEmbeddings(BasicProcessor):
 		"""
 		Read tokens from token dump
 
-		If the tokens were saved as JSON, take advantage of this and return
-		them as a generator, reducing memory usage and allowing interruption.
+		Tokens are returned as a generator, reducing memory usage and allowing
+		interruption. This is not possible for token files in the JSON format
+		used by older versions of the tokeniser, which are read as a whole.
 
 		:param Path file:
 		:param Path staging_area:  Path to staging area, so it can be cleaned
@@ -221,6 +225,16 @@ class GenerateWordEmbeddings(BasicProcessor):
 		:return list:  A set of tokens
 		"""
 
+		if file.suffix == ".tokens":
+			for token_set in TokenStream(file):
+				if self.interrupted:
+					shutil.rmtree(staging_area)
+					raise ProcessorInterruptedException("Interrupted while reading tokens")
+
+				yield phraser[token_set] if phraser else token_set
+
+			return
+
 		if file.suffix == "pb":
 			with file.open("rb") as input:
 				return pickle.load(input)
@@ -137,7 +137,7 @@ class TopicModelWordExtractor(BasicProcessor):
         for interval in token_metadata_parameters.get('intervals'):
             if self.parameters.get('include_top_features'):
                 model_column_names += [interval + '_topic_' + str(i+1) + '_' + '-'.join(
-                    [f for f in model_metadata[interval+'.json']['model_topics'][str(i)]['top_five_features']]
+                    [f for f in self.get_interval_model(model_metadata, interval)['model_topics'][str(i)]['top_five_features']]
                 ) for i in range(model_metadata_parameters.get('topics'))]
             else:
                 model_column_names += [interval + '_topic_' + str(i+1)
@@ -179,7 +179,7 @@ class TopicModelWordExtractor(BasicProcessor):
                     # don't start counting with 0)
                     if self.parameters.get('include_top_features'):
                         related_topic_columns = [interval + '_topic_' + str(i+1) + '_' + '-'.join(
-                            [f for f in model_metadata[interval+'.json']['model_topics'][str(i)]['top_five_features']]
+                            [f for f in self.get_interval_model(model_metadata, interval)['model_topics'][str(i)]['top_five_features']]
                         ) for i in range(model_metadata_parameters.get('topics'))]
                     else:
                         related_topic_columns = [interval + '_topic_' + str(i+1)
@@ -242,3 +242,20 @@ class TopicModelWordExtractor(BasicProcessor):
 
         self.dataset.update_status("Results saved")
         self.dataset.finish(index)
+
+    @staticmethod
+    def get_interval_model(model_metadata, interval):
+        """
+        Get metadata for the model of a given interval
+
+        Models are stored under the name of the token file they were made
+        from; older versions of the tokeniser stored tokens as JSON.
+
+        :param dict model_metadata:  Model metadata, per token file
+        :param str interval:  Interval
+        :return dict:  Model metadata
+        """
+        if interval + ".tokens" in model_metadata:
+            return model_metadata[interval + ".tokens"]
+
+        return model_metadata[interval + ".json"]
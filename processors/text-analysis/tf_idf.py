@@ -1,8 +1,6 @@
 """
 Create a csv with tf-idf ranked terms
 """
-import json
-import pickle
 import numpy as np
 import pandas as pd
 import itertools
@@ -10,6 +8,7 @@ import itertools
 from common.lib.helpers import UserInput, convert_to_int
 from backend.lib.processor import BasicProcessor
 from common.lib.compatibility import Compatibility
+from common.lib.token_stream import load_tokens
 
 from sklearn.feature_extraction.text import TfidfVectorizer
 from gensim.models import TfidfModel
@@ -31,6 +30,8 @@ class TfIdf(BasicProcessor):
 	title = "Tf-idf"  # title displayed in UI
 	description = "Get the tf-idf values of tokenised text. Works better with more documents (e.g. time-separated)."  # description displayed in UI
 	extension = "csv"  # extension of result file, used internally and in UI
+	run_in_process = True  # CPU-bound, so do not share the interpreter with other workers
+	resource_class = BasicProcessor.RESOURCE_CPU
 
 	# Allow processor on token sets
 	compatibility = Compatibility(
@@ -148,19 +149,14 @@ class TfIdf(BasicProcessor):
 			date_string = token_file.file.stem
 			dates.append(date_string)
 
-			# we support both pickle and json dumps of vectors
-			token_unpacker = pickle if token_file.file.suffix == "pb" else json
-
 			try:
-				with token_file.file.open("rb") as binary_tokens:
-					# these were saved as pickle dumps so we need the binary mode
-					item_tokens = token_unpacker.load(binary_tokens)
+				item_tokens = load_tokens(token_file.file)
 
-					# Flatten the list of list of tokens - we're treating the whole time series as one document.
-					item_tokens = list(itertools.chain.from_iterable(item_tokens))
+				# Flatten the list of list of tokens - we're treating the whole time series as one document.
+				item_tokens = list(itertools.chain.from_iterable(item_tokens))
 
-					# Add to all date's tokens
-					tokens.append(item_tokens)
+				# Add to all date's tokens
+				tokens.append(item_tokens)
 
 			except UnicodeDecodeError:
 				self.dataset.finish_with_error("Error reading input data. If it was imported from outside 4CAT, make sure it is encoded as UTF-8.")
@@ -2,20 +2,30 @@
 Tokenize post bodies
 """
 import ahocorasick
+import concurrent.futures
+import collections
+import itertools
+import hashlib
 import razdel
 import string
+import tempfile
 import jieba
 import json
 import re
 import os
 
+from pathlib import Path
+
 import nltk
 from nltk.stem.snowball import SnowballStemmer
 from nltk.stem import WordNetLemmatizer
 from nltk.tokenize import word_tokenize, TweetTokenizer, sent_tokenize
 from razdel.substring import Substring
 
-from common.lib.helpers import UserInput, get_interval_descriptor
+from common.lib.helpers import UserInput, get_interval_descriptor, convert_to_int, get_process_context
+from common.lib.exceptions import ProcessorException, ProcessorInterruptedException
+from common.lib.dataset_index import SidecarIndex
+from common.lib.token_stream import TokenStreamWriter
 from backend.lib.processor import BasicProcessor
 from common.lib.compatibility import Compatibility
 
@@ -48,6 +58,40 @@ class Tokenise(BasicProcessor):
         "[Words in OpenTaal word list](https://github.com/OpenTaal/opentaal-wordlist)"
     ]
 
+    config = {
+        "tokenise.cache_tokens": {
+            "type": UserInput.OPTION_TOGGLE,
+            "default": True,
+            "help": "Cache tokens",
+            "tooltip": "Store the tokens of a dataset next to it, so tokenising it again with the same settings (but "
+                       "possibly grouping tokens differently) does not require tokenising all items again. Uses "
+                       "additional disk space."
+        },
+        "tokenise.processes": {
+            "type": UserInput.OPTION_TEXT,
+            "coerce_type": int,
+            "default": 1,
+            "min": 1,
+            "help": "Tokeniser processes",
+            "tooltip": "Number of processes to tokenise items with. Using more than one process speeds up tokenising "
+                       "larger datasets, at the cost of keeping more CPU cores busy. The tokens are the same either way."
+        }
+    }
+
+    # parameters that determine which tokens are produced for an item; see
+    # get_token_cache_path()
+    TOKEN_CACHE_PARAMETERS = ("columns", "language", "tokenizer_type", "grouping-per", "stem", "lemmatise", "filter",
+                              "accept_words", "reject_words", "only_unique")
+    TOKEN_CACHE_VERSION = 1
+
+    # number of token caches to keep per dataset
+    MAX_TOKEN_CACHES = 3
+
+    # items are only tokenised in parallel for datasets with at least this many
+    # items, and sent to worker processes in chunks of this many
+    MIN_PARALLEL_ITEMS = 5000
+    ITEMS_PER_CHUNK = 500
+
     @classmethod
     def get_options(cls, parent_dataset=None, config=None):
         """
@@ -200,30 +244,20 @@ class Tokenise(BasicProcessor):
         containing tokenised items, grouped per time unit as specified in the
         parameters.
 
-        Tokens are stored as a JSON dump per 'output unit'; each output unit
-        corresponds to e.g. a month or year depending on the processor
-        parameters. JSON files are partially encoded 'manually', since we don't
-        want to keep all tokens for a given output unit in memory until it's
-        done, as for large datasets that may exceed memory capacity. Instead,
-        we keep a file handle open while tokenising and write the tokens to
-        that file per tokenised item. Since we simply need to store a list of
-        strings, we can concatenate these lists manually, only using the json
-        export options for the token lists. In other words, files are written
-        as such:
-
-        first, the opening bracket for a list of lists:
-            [
-
-        then, if not the first token in the list, a comma:
-            ,
+        Tokens are stored as a token stream per 'output unit'; each output
+        unit corresponds to e.g. a month or year depending on the processor
+        parameters. See `common.lib.token_stream` for the file format; it
+        allows follow-up processors to read the documents one by one instead
+        of loading all tokens for an output unit into memory at once.
 
-        then for each item, a list of tokens, with json.dumps:
+        Since we don't want to keep all tokens for a given output unit in
+        memory until it's done either, as for large datasets that may exceed
+        memory capacity, tokens are first written to a temporary file per
+        output unit, as one JSON list of tokens per line:
             ["token1","token2"]
 
-        then after all tokens are done for an output unit, a closing bracket:
-            ]
-
-        The result is valid JSON, written in chunks.
+        After all items have been tokenised, these files are converted to
+        token streams one by one.
         """
         columns = self.parameters.get("columns")
         if not columns:
@@ -235,38 +269,201 @@ class Tokenise(BasicProcessor):
             columns = [columns]
 
         save_annotations = self.parameters.get("save_annotations", False)
+        language = self.parameters.get("language", "english")
 
-        self.dataset.update_status("Building filtering automaton")
+        # prepare staging area
+        staging_area = self.dataset.get_staging_area()
+
+        # process items
+        docs_per = self.parameters.get("docs_per")
+        grouping = "item" if self.parameters.get("grouping-per", "") == "item" else "sentence"
+
+        # this is how we'll keep track of the subsets of tokens
+        output_files = {}
+        current_output_path = None
+        output_file_handle = None
+
+        # Get sentence tokenizer
+        sentence_method, sentence_error = self.get_sentence_method(language=language, grouping=grouping, dataset=self.dataset)
+
+        # Collect metadata
+        metadata = {'parameters':{'columns':columns, 'grouped_by':grouping, 'language':language, 'intervals':set()}}
+        processed = 0
+        annotations = []
+
+        # Only get annotations if the text to tokenise are annotations
+        get_annotations = False
+        if self.source_dataset.annotation_fields:
+            annotation_field_labels = self.source_dataset.get_annotation_field_labels()
+            for column in columns:
+                # Duplicate annotation labels names get a `_2` appended, so we remove this if present.
+                # (This has an edge case where annotations are unnecessarily retrieved when a regular column name is the
+                # same as an annotation label, but should speed things up anyway).
+                column = re.sub(r"_\d+$", "", column)
+                if column in annotation_field_labels:
+                    get_annotations = True
+                    break
+
+        # tokens are taken from the cache if this dataset was tokenised with
+        # the same settings before; else they are cached while tokenising
+        # annotations may change at any time, so then the cache is not used
+        cache_path = None
+        if not get_annotations and self.config.get("tokenise.cache_tokens", True):
+            cache_path = self.get_token_cache_path(sentence_method)
+
+        if cache_path and cache_path.exists():
+            self.dataset.update_status("Reading tokens from cache")
+            item_tokens = self.iterate_cached_tokens(cache_path)
+        else:
+            item_tokens = self.iterate_tokens(columns, language, sentence_method, get_annotations, cache_path)
+
+        self.dataset.update_status("Processing items")
+        try:
+            for item_id, item, documents in item_tokens:
+                # determine what output unit this item belongs to
+                if docs_per != "thread":
+                    try:
+                        document_descriptor = get_interval_descriptor(item, docs_per)
+                    except ValueError as e:
+                        self.dataset.update_status("%s, cannot count items per %s" % (str(e), docs_per), is_final=True)
+                        self.dataset.update_status(0)
+                        return
+                else:
+                    # Ensure descriptor is a safe filename (strip disallowed characters)
+                    document_descriptor = re.sub(r"[^a-zA-Z0-9._+-]", "", str(item.get("thread_id", "") if item.get("thread_id") else "undefined")) or "undefined"
+
+                # Prep metadata
+                # document_numbers lists the indexes for documents found in filename relating to this post/item
+                # It should only have one index if grouped_by is "item", but may have more if grouped_by is "sentence" or multiple columns are provided
+                metadata['parameters']['intervals'].add(document_descriptor)
+                if item_id in metadata:
+                    # Items may be processed multiple times over time, so we need to keep track of all documents
+                    self.dataset.log(f"Note: duplicate item ID {item_id} found in dataset; items will be processed multiple times")
+                else:
+                    metadata[item_id] = {}
+                if document_descriptor not in metadata[item_id]:
+                    metadata[item_id][document_descriptor] = {
+                        'filename': document_descriptor + ".tokens",
+                        'document_numbers': [],
+                        'interval': document_descriptor,
+                        'multiple_docs': False,
+                    }
+
+                if processed % 500 == 0:
+                    self.dataset.update_progress(processed / self.source_dataset.num_rows)
+                    self.dataset.update_status(f"Processing items ({processed:,} of {self.source_dataset.num_rows:,}; in set '{document_descriptor}')")
+                processed += 1
+
+                for i, document_tokens in enumerate(documents):
+                    # write tokens to file
+                    # this writes lists of json lists, with the outer list serialised
+                    # 'manually' and the token lists serialised by the json library
+                    if document_tokens:
+                        output_path = staging_area.joinpath(document_descriptor + ".tokens")
+
+                        if current_output_path != output_path:
+                            if output_file_handle:
+                                output_file_handle.close()
+                            output_file_handle = self.get_temporary_token_path(output_path).open("a")
+
+                            if output_path not in output_files:
+                                output_files[output_path] = 0
+
+                            current_output_path = output_path
+
+                        output_file_handle.write(json.dumps(document_tokens) + "\n")
+                        metadata[item_id][document_descriptor]['document_numbers'].append(output_files[output_path])
+                        if i > 0:
+                            # TODO: potentially store the different docs and map them to the item; the item_topic_matrix processor could make use of this
+                            # However, why someone would want to predict topics for different parts of a item seems unclear
+                            metadata[item_id][document_descriptor]['multiple_docs'] = True
+
+                        # Possibly save tokens as annotations, in batches of 1000 to prevent memory hog
+                        if save_annotations:
+                            annotations.append({
+                                "label": "tokens",
+                                "item_id": item_id,
+                                "value": ",".join(document_tokens)
+                            })
+                            if processed % 1000 == 0:
+                                self.save_annotations(annotations, hide_in_explorer=True)
+                                annotations = []
+
+                        output_files[output_path] += 1
+        except ProcessorException as e:
+            self.dataset.finish_with_error(str(e))
+            return
+        finally:
+            if output_file_handle:
+                output_file_handle.close()
+
+        # Safe leftover annotations
+        if annotations:
+            self.save_annotations(annotations, hide_in_explorer=True)
+
+        # convert token lists to token streams
+        # we do this now because only here do we know all files have been
+        # fully written - if items are out of order, the tokeniser may
+        # need to repeatedly switch between various token files
+        self.dataset.update_status("Writing token files")
+        for output_path in output_files:
+            temp_path = self.get_temporary_token_path(output_path)
+            with TokenStreamWriter(output_path) as token_stream, temp_path.open() as infile:
+                for line in infile:
+                    if self.interrupted:
+                        raise ProcessorInterruptedException("Interrupted while writing token files")
 
-        link_regex = re.compile(r"https?://[^\s]+")
-        symbol = re.compile(r"[" + re.escape(string.punctuation) + "’‘“”" + "]")
-        numbers = re.compile(r"\b[0-9]+\b")
+                    token_stream.add_document(json.loads(line))
+
+            temp_path.unlink()
+
+        # Save the metadata in our staging area
+        metadata['parameters']['intervals'] = list(metadata['parameters']['intervals'])
+        with staging_area.joinpath(".token_metadata.json").open("w", encoding="utf-8") as outfile:
+            json.dump(metadata, outfile)
+
+        warning = None
+        if sentence_error:
+            warning = f"Finished tokenizing; Unable to group by sentence ({language} not supported), instead grouped by item."
+
+        # create zip of archive and delete temporary files and folder
+        self.write_archive_and_finish(staging_area, warning=warning)
+
+    @staticmethod
+    def get_temporary_token_path(output_path):
+        """
+        Get path to write tokens to before they are converted to a token stream
+
+        :param Path output_path:  Path to token stream
+        :return Path:  Path to temporary file
+        """
+        return output_path.with_name(output_path.name + ".tmp")
+
+    def iterate_tokens(self, columns, language, sentence_method, get_annotations, cache_path=None):
+        """
+        Tokenise the items in the source dataset
+
+        Each item is split into documents (one per column, or one per sentence
+        per column), and each document into tokens. If a cache path is given,
+        the tokens are also written to a token cache there; see
+        `get_token_cache_path()`.
+
+        :param list columns:  Columns to tokenise
+        :param str language:  Language of the text
+        :param sentence_method:  Function to split text into documents with
+        :param bool get_annotations:  Whether to include annotations when
+        iterating the items
+        :param Path cache_path:  Where to write the token cache, if anywhere
+        :return generator:  Yields a tuple per item with its ID, a dictionary
+        with the item's `timestamp` and `thread_id` (to group items by), and
+        a list of token lists, one per document
+        """
+        self.dataset.update_status("Building filtering automaton")
 
         # load general stopwords dictionary
         with open(self.config.get("PATH_ROOT").joinpath("common/assets/stopwords-iso.json"), encoding="utf-8") as infile:
             stopwords_iso = json.load(infile)
 
-        # Twitter tokenizer if indicated
-        language = self.parameters.get("language", "english")
-        if self.parameters.get("tokenizer_type") == "jieba-cut":
-            tokenizer = jieba.cut
-            tokenizer_args = {"cut_all": False}
-        elif self.parameters.get("tokenizer_type") == "jieba-cut-all":
-            tokenizer = jieba.cut
-            tokenizer_args = {"cut_all": True}
-        elif self.parameters.get("tokenizer_type") == "jieba-search":
-            tokenizer = jieba.cut_for_search
-            tokenizer_args = {}
-        elif self.parameters.get("tokenizer_type") == "razdel":
-            tokenizer = razdel.tokenize
-            tokenizer_args = {}
-        elif self.parameters.get("tokenizer_type") == "twitter":
-            tokenizer = TweetTokenizer(preserve_case=False).tokenize
-            tokenizer_args = {}
-        else:
-            tokenizer = word_tokenize
-            tokenizer_args = {"language": language} if language != "other" else {}
-
         # load word filters - words to exclude from tokenisation
         word_filter = set()
         for wordlist in self.parameters.get("filter", []):
@@ -313,213 +510,217 @@ class Tokenise(BasicProcessor):
             reject_words = [str(word).strip().lower() for word in self.parameters["reject_words"].split(",")]
             word_filter.update(reject_words)
 
-        # Use an Aho-Corasick trie to filter tokens - significantly faster
-        # than a native Python list or matching by regex
-        automaton = ahocorasick.Automaton()
-        for word in word_filter:
-            if word:
-                # the value doesn't matter to us here, we just want to know if
-                # the string occurs
-                automaton.add_word(word, 1)
-
-        # initialise pre-processors if needed
-        stemmer = None
-        lemmatizer = None
-        if self.parameters.get("language") != "other":
-            if self.parameters.get("stem"):
-                stemmer = SnowballStemmer(language)
-
-            if self.parameters.get("lemmatise"):
-                lemmatizer = WordNetLemmatizer()
-
-        # Only keep unique words?
-        only_unique = self.parameters.get("only_unique")
-
-        # prepare staging area
-        staging_area = self.dataset.get_staging_area()
-
-        # process items
-        self.dataset.update_status("Processing items")
-        docs_per = self.parameters.get("docs_per")
-        grouping = "item" if self.parameters.get("grouping-per", "") == "item" else "sentence"
-
-        # this is how we'll keep track of the subsets of tokens
-        output_files = {}
-        current_output_path = None
-        output_file_handle = None
-
-        # Get sentence tokenizer
-        sentence_method, sentence_error = self.get_sentence_method(language=language, grouping=grouping, dataset=self.dataset)
-
-        # Collect metadata
-        metadata = {'parameters':{'columns':columns, 'grouped_by':grouping, 'language':language, 'intervals':set()}}
-        processed = 0
-        annotations = []
-
-        # Only get annotations if the text to tokenise are annotations
-        get_annotations = False
-        if self.source_dataset.annotation_fields:
-            annotation_field_labels = self.source_dataset.get_annotation_field_labels()
-            for column in columns:
-                # Duplicate annotation labels names get a `_2` appended, so we remove this if present.
-                # (This has an edge case where annotations are unnecessarily retrieved when a regular column name is the
-                # same as an annotation label, but should speed things up anyway).
-                column = re.sub(r"_\d+$", "", column)
-                if column in annotation_field_labels:
-                    get_annotations = True
-                    break
-
-        for item in self.source_dataset.iterate_items(self, get_annotations=get_annotations):
-            # determine what output unit this item belongs to
-            if docs_per != "thread":
-                try:
-                    document_descriptor = get_interval_descriptor(item, docs_per)
-                except ValueError as e:
-                    self.dataset.update_status("%s, cannot count items per %s" % (str(e), docs_per), is_final=True)
-                    self.dataset.update_status(0)
-                    return
-            else:
-                # Ensure descriptor is a safe filename (strip disallowed characters)
-                document_descriptor = re.sub(r"[^a-zA-Z0-9._+-]", "", str(item.get("thread_id", "") if item.get("thread_id") else "undefined")) or "undefined"
-
-            # Prep metadata
-            # document_numbers lists the indexes for documents found in filename relating to this post/item
-            # It should only have one index if grouped_by is "item", but may have more if grouped_by is "sentence" or multiple columns are provided
-            metadata['parameters']['intervals'].add(document_descriptor)
-            item_id = item.get('id')
-            if item_id in metadata:
-                # Items may be processed multiple times over time, so we need to keep track of all documents
-                self.dataset.log(f"Note: duplicate item ID {item_id} found in dataset; items will be processed multiple times")
+        # set up the tokeniser; this also builds the automaton used to
+        # filter words
+        tokenise_item = ItemTokeniser(language, sentence_method, self.parameters.get("tokenizer_type"), word_filter,
+                                      stem=self.parameters.get("stem"), lemmatise=self.parameters.get("lemmatise"),
+                                      only_unique=self.parameters.get("only_unique"))
+
+        cache_file = None
+        if cache_path:
+            # several jobs may write the same cache at the same time, also
+            # within the same process, so each needs a temporary file of
+            # its own
+            temp_fd, temp_path = tempfile.mkstemp(dir=cache_path.parent, prefix=f"{cache_path.name}.", suffix=".tmp")
+            temp_path = Path(temp_path)
+            cache_file = os.fdopen(temp_fd, "w", encoding="utf-8", newline="\n")
+
+        finished = False
+        try:
+            items = self.iterate_item_texts(columns, get_annotations)
+            num_processes = self.get_tokenise_processes()
+            if num_processes > 1:
+                tokenised_items = self.tokenise_in_parallel(items, tokenise_item, num_processes)
             else:
-                metadata[item_id] = {}
-            if document_descriptor not in metadata[item_id]:
-                metadata[item_id][document_descriptor] = {
-                    'filename': document_descriptor + ".json",
-                    'document_numbers': [],
-                    'interval': document_descriptor,
-                    'multiple_docs': False,
-                }
-
-            groupings = []
+                tokenised_items = ((item_id, item_data, tokenise_item(texts)) for item_id, item_data, texts in items)
+
+            for item_id, item_data, documents in tokenised_items:
+                if cache_file:
+                    cache_file.write(json.dumps([item_id, item_data, documents], default=str) + "\n")
+
+                yield item_id, item_data, documents
+
+            finished = True
+        finally:
+            if cache_file:
+                cache_file.close()
+                if finished:
+                    try:
+                        # if another job wrote the cache in the meantime, it
+                        # is replaced with an identical one
+                        os.replace(temp_path, cache_path)
+                        self.prune_token_caches()
+                    except FileNotFoundError:
+                        # the cache was deleted along with the source
+                        # dataset's indexes in the meantime; tokens are
+                        # simply not cached then
+                        pass
+                else:
+                    temp_path.unlink(missing_ok=True)
+
+    def iterate_item_texts(self, columns, get_annotations):
+        """
+        Get the texts to tokenise from the items in the source dataset
+
+        :param list columns:  Columns to tokenise
+        :param bool get_annotations:  Whether to include annotations when
+        iterating the items
+        :return generator:  Yields a tuple per item with its ID, a dictionary
+        with the item's `timestamp` and `thread_id` (to group items by), and
+        a list with the text in each column
+        """
+        for item in self.source_dataset.iterate_items(self, get_annotations=get_annotations):
             for column in columns:
                 column_value = item.get(column)
                 # Possible to only check ones? Not if column is blank/None for some rows, but not all.
                 if column_value is not None and type(column_value) is not str:
-                    self.dataset.finish_with_error("Column %s contains non text values and cannot be tokenized")
-                    return
-
-                value = [Tokenise.normalise_segment(v) for v in sentence_method(item[column], language) if
-                         v is not None]
-                if value:
-                    groupings.extend(value)
-
-            if processed % 500 == 0:
-                self.dataset.update_progress(processed / self.source_dataset.num_rows)
-                self.dataset.update_status(f"Processing items ({processed:,} of {self.source_dataset.num_rows:,}; in set '{document_descriptor}')")
-            processed += 1
-
-            # tokenise...
-            for i, document in enumerate(groupings):
-                item_tokens = []
-
-                # clean up text and get tokens from it
-                body = link_regex.sub("", document)
+                    raise ProcessorException("Column %s contains non text values and cannot be tokenized" % column)
 
-                # Use differing tokenizers depending on the user input
-                tokens = tokenizer(body, **tokenizer_args)
+            # only these are needed to determine what output unit the item
+            # belongs to
+            item_data = {"timestamp": item.get("timestamp"), "thread_id": item.get("thread_id")}
+            yield item.get("id"), item_data, [item[column] for column in columns]
 
-                # stem, lemmatise and save tokens that are not in filter
-                for token in tokens:
-                    token = Tokenise.normalise_segment(token)
-
-                    token = token.lower()
-                    token = numbers.sub("", symbol.sub("", token))
-
-                    # skip empty and filtered tokens
-                    if not token or token in automaton:
-                        continue
-
-                    if self.parameters["stem"] and stemmer:
-                        token = stemmer.stem(token)
-
-                    if self.parameters["lemmatise"] and lemmatizer:
-                        token = lemmatizer.lemmatize(token)
+    def get_tokenise_processes(self):
+        """
+        Determine how many processes to tokenise items with
 
-                    # append tokens to the item's token list
-                    item_tokens.append(token)
+        Items are only tokenised in parallel if the `tokenise.processes`
+        setting allows it, and for datasets of sufficient size (starting a pool
+        of processes is not free).
 
-                # write tokens to file
-                # this writes lists of json lists, with the outer list serialised
-                # 'manually' and the token lists serialised by the json library
-                if item_tokens:
+        :return int:  Number of processes; 1 to tokenise in this process
+        """
+        num_processes = convert_to_int(self.config.get("tokenise.processes", 1), 1)
+        if num_processes <= 1 or self.source_dataset.num_rows < self.MIN_PARALLEL_ITEMS:
+            return 1
 
-                    # Only keep unique words, if desired
-                    if only_unique:
-                        item_tokens = list(set(item_tokens))
+        return num_processes
 
-                    output_file = staging_area.joinpath(document_descriptor + ".json")
-                    output_path = str(output_file)
+    def tokenise_in_parallel(self, items, tokenise_item, num_processes):
+        """
+        Tokenise items in a pool of worker processes
+
+        Items are sent to the workers in chunks; results are yielded in the
+        same order as the items, so the output is identical to tokenising
+        them one by one. Worker processes are started via
+        `get_process_context()`; each receives the tokeniser once, when it
+        starts.
+
+        :param items:  Items to tokenise, as yielded by `iterate_item_texts()`
+        :param ItemTokeniser tokenise_item:  Tokeniser for an item's texts
+        :param int num_processes:  Number of worker processes
+        :return generator:  Yields the same tuples as `iterate_tokens()`
+        """
+        # the tokeniser is passed via the initializer, so it is set up once
+        # per worker process rather than sent along with every chunk
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=num_processes, mp_context=get_process_context(),
+                                                      initializer=_set_chunk_tokeniser, initargs=(tokenise_item,))
+        pending = collections.deque()
+        try:
+            while True:
+                chunk = list(itertools.islice(items, self.ITEMS_PER_CHUNK))
+                if not chunk:
+                    break
 
-                    if current_output_path != output_path:
-                        if output_file_handle:
-                            output_file_handle.close()
-                        output_file_handle = output_file.open("a")
+                # only the texts are sent to the worker; the rest of the item
+                # stays here until the tokens come back
+                future = pool.submit(_tokenise_chunk, [texts for item_id, item_data, texts in chunk])
+                pending.append(([(item_id, item_data) for item_id, item_data, texts in chunk], future))
+                if len(pending) < num_processes * 2:
+                    continue
 
-                        if output_path not in output_files:
-                            output_file_handle.write("[")
-                            output_files[output_path] = 0
+                if self.interrupted:
+                    raise ProcessorInterruptedException("Interrupted while tokenising items")
 
-                        current_output_path = output_path
+                chunk, future = pending.popleft()
+                for (item_id, item_data), documents in zip(chunk, future.result()):
+                    yield item_id, item_data, documents
 
-                    if output_files[current_output_path] > 0:
-                        output_file_handle.write(",\n")
+            while pending:
+                if self.interrupted:
+                    raise ProcessorInterruptedException("Interrupted while tokenising items")
 
-                    output_file_handle.write(json.dumps(item_tokens))
-                    metadata[item_id][document_descriptor]['document_numbers'].append(output_files[output_path])
-                    if i > 0:
-                        # TODO: potentially store the different docs and map them to the item; the item_topic_matrix processor could make use of this
-                        # However, why someone would want to predict topics for different parts of a item seems unclear
-                        metadata[item_id][document_descriptor]['multiple_docs'] = True
+                chunk, future = pending.popleft()
+                for (item_id, item_data), documents in zip(chunk, future.result()):
+                    yield item_id, item_data, documents
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
 
-                    # Possibly save tokens as annotations, in batches of 1000 to prevent memory hog
-                    if save_annotations:
-                        annotations.append({
-                            "label": "tokens",
-                            "item_id": item_id,
-                            "value": ",".join(item_tokens)
-                        })
-                        if processed % 1000 == 0:
-                            self.save_annotations(annotations, hide_in_explorer=True)
-                            annotations = []
+    def iterate_cached_tokens(self, cache_path):
+        """
+        Read tokens from a token cache
 
-                    output_files[output_path] += 1
+        :param Path cache_path:  Path to token cache
+        :return generator:  Yields the same as `iterate_tokens()`
+        """
+        # mark as recently used, so it is not pruned
+        os.utime(cache_path)
+        with cache_path.open(encoding="utf-8", newline="\n") as infile:
+            for line in infile:
+                if self.interrupted:
+                    raise ProcessorInterruptedException("Interrupted while reading tokens from cache")
 
-        # Safe leftover annotations
-        if annotations:
-            self.save_annotations(annotations, hide_in_explorer=True)
+                item_id, item_data, documents = json.loads(line)
+                yield item_id, item_data, documents
 
-        if output_file_handle:
-            output_file_handle.close()
+    def get_token_cache_path(self, sentence_method):
+        """
+        Get path to the token cache for the source dataset
+
+        Tokenising is slow, and the same dataset is often tokenised with the
+        same settings several times, e.g. to try different follow-up
+        processors. The tokens per item are therefore cached next to the
+        source dataset's result file (see `DataSet.get_index_path()`). The
+        cache is named after a hash of everything that determines the tokens:
+        the source file, the code that maps and tokenises its items, and the
+        parameters that affect tokenisation.
+        Parameters that only determine how the tokens are grouped into files,
+        such as `docs_per`, are not included, so the cache can be reused when
+        only those differ.
+
+        :param sentence_method:  Function used to split text into documents
+        :return Path|None:  Path to the cache (which may not exist yet), or
+        `None` if the source dataset's tokens cannot be cached
+        """
+        source = self.source_dataset
+        if not source.is_finished() or source.get_extension() not in ("csv", "ndjson"):
+            return None
 
-        # close all json lists
-        # we do this now because only here do we know all files have been
-        # fully written - if items are out of order, the tokeniser may
-        # need to repeatedly switch between various token files
-        for output_path in output_files:
-            with open(output_path, "a") as file_handle:
-                file_handle.write("\n]")
+        if source.is_view():
+            data_paths = [source.get_view_path(), source.get_view_source().get_results_path()]
+        else:
+            data_paths = [source.get_results_path()]
+
+        if not all([data_path.exists() for data_path in data_paths]):
+            return None
+
+        cache_key = {
+            "version": self.TOKEN_CACHE_VERSION,
+            "tokeniser": hashlib.md5(Path(__file__).read_bytes()).hexdigest(),
+            "mapper": source.get_mapper_version(),
+            "source": [[data_path.name, *SidecarIndex.get_fingerprint(data_path)] for data_path in data_paths],
+            "sentence_method": getattr(sentence_method, "__name__", ""),
+            **{parameter: self.parameters.get(parameter) for parameter in self.TOKEN_CACHE_PARAMETERS}
+        }
+        cache_hash = hashlib.sha256(json.dumps(cache_key, sort_keys=True).encode("utf-8")).hexdigest()[:16]
 
-        # Save the metadata in our staging area
-        metadata['parameters']['intervals'] = list(metadata['parameters']['intervals'])
-        with staging_area.joinpath(".token_metadata.json").open("w", encoding="utf-8") as outfile:
-            json.dump(metadata, outfile)
+        return source.get_index_path(f"tokens-{cache_hash}")
 
-        warning = None
-        if sentence_error:
-            warning = f"Finished tokenizing; Unable to group by sentence ({language} not supported), instead grouped by item."
+    def prune_token_caches(self):
+        """
+        Delete all but the most recently used token caches of the source
+        dataset
 
-        # create zip of archive and delete temporary files and folder
-        self.write_archive_and_finish(staging_area, warning=warning)
+        Caches for outdated versions of the source file or for settings that
+        are no longer used would otherwise keep taking up disk space.
+        """
+        results_path = self.source_dataset.get_results_path()
+        caches = [path for path in results_path.parent.glob(f"{results_path.name}.tokens-*")
+                  if not path.name.endswith(".tmp")]
+        caches = sorted(caches, key=lambda path: path.stat().st_mtime, reverse=True)
+        for cache_path in caches[self.MAX_TOKEN_CACHES:]:
+            cache_path.unlink(missing_ok=True)
 
     @staticmethod
     def get_sentence_method(language, grouping, dataset=None):
@@ -532,8 +733,7 @@ class Tokenise(BasicProcessor):
         """
 
         # dummy function to pass through data (as an alternative to sent_tokenize later)
-        def dummy_function(x, *args, **kwargs):
-            return [x]
+        dummy_function = Tokenise.dummy_function
 
         # if told so, first split the item into separate sentences
         if grouping == "sentence":
@@ -550,6 +750,19 @@ class Tokenise(BasicProcessor):
         else:
             return dummy_function, False
 
+    @staticmethod
+    def dummy_function(x, *args, **kwargs):
+        """
+        Sentence method that does not split the text
+
+        A static method rather than a local function, so that it can be
+        passed to worker processes along with the tokeniser.
+
+        :param str x:  Text
+        :return list:  List with the text as its only element
+        """
+        return [x]
+
     @staticmethod
     def normalise_segment(segment):
         """
@@ -565,3 +778,176 @@ class Tokenise(BasicProcessor):
             return segment.text
         else:
             return str(segment)
+
+
+class ItemTokeniser:
+    """
+    Split an item's texts into documents and tokenise those
+
+    A class rather than a local function, so that it can be sent to the
+    worker processes items are tokenised in when tokenising in parallel. Only
+    the settings are pickled; the tokeniser, stemmer and word filter automaton
+    are set up again from these when unpickled.
+    """
+    link_regex = re.compile(r"https?://[^\s]+")
+    symbol = re.compile(r"[" + re.escape(string.punctuation) + "’‘“”" + "]")
+    numbers = re.compile(r"\b[0-9]+\b")
+
+    def __init__(self, language, sentence_method, tokenizer_type, word_filter, stem=False, lemmatise=False,
+                 only_unique=False):
+        """
+        Set up tokeniser
+
+        :param str language:  Language of the text
+        :param sentence_method:  Function to split text into documents with
+        :param str tokenizer_type:  Tokeniser to use, as in the processor's
+        `tokenizer_type` option
+        :param word_filter:  Words to leave out
+        :param bool stem:  Stem tokens?
+        :param bool lemmatise:  Lemmatise tokens?
+        :param bool only_unique:  Only keep the first occurrence of each
+        token per document?
+        """
+        self.settings = {
+            "language": language,
+            "sentence_method": sentence_method,
+            "tokenizer_type": tokenizer_type,
+            "word_filter": sorted(word_filter),
+            "stem": stem,
+            "lemmatise": lemmatise,
+            "only_unique": only_unique
+        }
+        self.setup()
+
+    def __getstate__(self):
+        return self.settings
+
+    def __setstate__(self, settings):
+        self.settings = settings
+        self.setup()
+
+    def setup(self):
+        """
+        Set up the tokeniser, stemmer and word filter from the settings
+        """
+        language = self.settings["language"]
+        tokenizer_type = self.settings["tokenizer_type"]
+
+        # Twitter tokenizer if indicated
+        if tokenizer_type == "jieba-cut":
+            self.tokenizer = jieba.cut
+            self.tokenizer_args = {"cut_all": False}
+        elif tokenizer_type == "jieba-cut-all":
+            self.tokenizer = jieba.cut
+            self.tokenizer_args = {"cut_all": True}
+        elif tokenizer_type == "jieba-search":
+            self.tokenizer = jieba.cut_for_search
+            self.tokenizer_args = {}
+        elif tokenizer_type == "razdel":
+            self.tokenizer = razdel.tokenize
+            self.tokenizer_args = {}
+        elif tokenizer_type == "twitter":
+            self.tokenizer = TweetTokenizer(preserve_case=False).tokenize
+            self.tokenizer_args = {}
+        else:
+            self.tokenizer = word_tokenize
+            self.tokenizer_args = {"language": language} if language != "other" else {}
+
+        # Use an Aho-Corasick trie to filter tokens - significantly faster
+        # than a native Python list or matching by regex
+        self.automaton = ahocorasick.Automaton()
+        for word in self.settings["word_filter"]:
+            if word:
+                # the value doesn't matter to us here, we just want to know if
+                # the string occurs
+                self.automaton.add_word(word, 1)
+
+        # initialise pre-processors if needed
+        self.stemmer = None
+        self.lemmatizer = None
+        if language != "other":
+            if self.settings["stem"]:
+                self.stemmer = SnowballStemmer(language)
+
+            if self.settings["lemmatise"]:
+                self.lemmatizer = WordNetLemmatizer()
+
+    def __call__(self, texts):
+        """
+        Split an item's texts into documents and tokenise those
+
+        :param list texts:  Text per column
+        :return list:  List of token lists, one per document
+        """
+        language = self.settings["language"]
+        groupings = []
+        for text in texts:
+            groupings.extend([Tokenise.normalise_segment(v) for v in self.settings["sentence_method"](text, language)
+                              if v is not None])
+
+        # tokenise...
+        documents = []
+        for document in groupings:
+            item_tokens = []
+
+            # clean up text and get tokens from it
+            body = self.link_regex.sub("", document)
+
+            # Use differing tokenizers depending on the user input
+            tokens = self.tokenizer(body, **self.tokenizer_args)
+
+            # stem, lemmatise and save tokens that are not in filter
+            for token in tokens:
+                token = Tokenise.normalise_segment(token)
+
+                token = token.lower()
+                token = self.numbers.sub("", self.symbol.sub("", token))
+
+                # skip empty and filtered tokens
+                if not token or token in self.automaton:
+                    continue
+
+                if self.stemmer:
+                    token = self.stemmer.stem(token)
+
+                if self.lemmatizer:
+                    token = self.lemmatizer.lemmatize(token)
+
+                # append tokens to the item's token list
+                item_tokens.append(token)
+
+            # Only keep unique words, if desired; in order of occurrence, so
+            # the result does not depend on the process it is made in
+            if item_tokens and self.settings["only_unique"]:
+                item_tokens = list(dict.fromkeys(item_tokens))
+
+            # documents without tokens are kept, so that documents
+            # keep their position within the item
+            documents.append(item_tokens)
+
+        return documents
+
+
+# set in worker processes when tokenising in parallel; see
+# Tokenise.tokenise_in_parallel()
+_chunk_tokeniser = None
+
+
+def _set_chunk_tokeniser(tokeniser):
+    """
+    Set function to tokenise items with in a worker process
+
+    :param tokeniser:  Function that tokenises an item's texts
+    """
+    global _chunk_tokeniser
+    _chunk_tokeniser = tokeniser
+
+
+def _tokenise_chunk(texts):
+    """
+    Tokenise a chunk of items in a worker process
+
+    :param list texts:  Texts per item
+    :return list:  Token lists per document, per item
+    """
+    return [_chunk_tokeniser(item_texts) for item_texts in texts]
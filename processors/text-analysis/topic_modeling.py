@@ -6,6 +6,7 @@ from common.lib.helpers import UserInput
 from backend.lib.processor import BasicProcessor
 from common.lib.compatibility import Compatibility
 from common.lib.exceptions import ProcessorInterruptedException
+from common.lib.token_stream import load_tokens
 
 import json
 import pickle
@@ -31,6 +32,8 @@ class TopicModeler(BasicProcessor):
                   "For a given number of topics, tokens are assigned a relevance weight per topic, " \
                   "which can be used to find clusters of related words."  # description displayed in UI
     extension = "zip"  # extension of result file, used internally and in UI
+    run_in_process = True  # CPU-bound, so do not share the interpreter with other workers
+    resource_class = BasicProcessor.RESOURCE_CPU
 
     # Allow processor on token sets
     compatibility = Compatibility(types={"tokenise-posts"}, preferred_followups=["document_count", "document_topic_matrix", "topic-model-words"])
@@ -119,9 +122,7 @@ class TopicModeler(BasicProcessor):
             if self.interrupted:
                 raise ProcessorInterruptedException("Interrupted while topic modeling")
 
-            # temporarily extract file (we cannot use ZipFile.open() as it doesn't support binary modes)
-            with token.file.open("rb") as binary_tokens:
-                tokens = json.load(binary_tokens)
+            tokens = load_tokens(token.file)
 
             self.dataset.update_status("Vectorising token set '%s'" % token.file.stem)
             vectoriser = vectoriser_class(tokenizer=token_helper, lowercase=False, min_df=min_df, max_df=max_df)
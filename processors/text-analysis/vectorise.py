@@ -7,6 +7,7 @@ import itertools
 
 from backend.lib.processor import BasicProcessor
 from common.lib.compatibility import Compatibility
+from common.lib.token_stream import TokenStream, load_tokens
 
 __author__ = "Stijn Peeters"
 __credits__ = ["Stijn Peeters"]
@@ -52,33 +53,35 @@ class Vectorise(BasicProcessor):
 			token_unpacker = pickle if vector_set_name.split(".")[-1] == "pb" else json
 			write_mode = "wb" if token_unpacker is pickle else "w"
 
-			# temporarily extract file (we cannot use ZipFile.open() as it doesn't support binary modes)
-			with packed_tokens.file.open("rb") as binary_tokens:
-				# these were saved as pickle dumps so we need the binary mode
-				tokens = token_unpacker.load(binary_tokens)
+			tokens = load_tokens(packed_tokens.file)
 
+			# all we need is a pretty straightforward frequency count
+			if isinstance(tokens, TokenStream):
+				# the vocabulary is in order of first occurrence, like the
+				# dictionary below
+				vectors = dict(zip(tokens.vocabulary, tokens.count_tokens().tolist()))
+			else:
 				# flatten token list first - we don't have to separate per post
 				tokens = list(itertools.chain.from_iterable(tokens))
 
-				# all we need is a pretty straightforward frequency count
 				vectors = {}
 				for token in tokens:
 					if token not in vectors:
 						vectors[token] = 0
 					vectors[token] += 1
 
-				# convert to vector list
-				vectors_list = [[token, vectors[token]] for token in vectors]
+			# convert to vector list
+			vectors_list = [[token, vectors[token]] for token in vectors]
 
-				# sort
-				vectors_list = sorted(vectors_list, key=lambda item: item[1], reverse=True)
+			# sort
+			vectors_list = sorted(vectors_list, key=lambda item: item[1], reverse=True)
 
-				# dump the resulting file via pickle
-				vector_path = staging_area.joinpath(vector_set_name)
-				vector_paths.append(vector_path)
+			# dump the resulting file via pickle
+			vector_path = staging_area.joinpath(vector_set_name)
+			vector_paths.append(vector_path)
 
-				with vector_path.open(write_mode) as output:
-					token_unpacker.dump(vectors_list, output)
+			with vector_path.open(write_mode) as output:
+				token_unpacker.dump(vectors_list, output)
 
 		# create zip of archive and delete temporary files and folder
 		self.write_archive_and_finish(staging_area)
@@ -3,10 +3,10 @@ Transform tokeniser output into vectors by category w/ filter
 """
 import csv
 import json
-import pickle
 
 from backend.lib.processor import BasicProcessor
 from common.lib.compatibility import Compatibility
+from common.lib.token_stream import load_tokens
 from common.lib.helpers import UserInput
 
 __author__ = "Dale Wahl"
@@ -221,9 +221,6 @@ class VectoriseByCategory(BasicProcessor):
 			self.dataset.update_status("Processing token set %i (%s)" % (index, vector_set_name))
 			self.dataset.update_progress(index / self.source_dataset.num_rows)
 
-			# we support both pickle and json dumps of vectors
-			token_unpacker = pickle if vector_set_name.split(".")[-1] == "pb" else json
-
 			if not separate_by_interval:
 				# Lump all intervals together
 				vector_set_name = "all"
@@ -231,28 +228,25 @@ class VectoriseByCategory(BasicProcessor):
 			if vector_set_name not in vector_sets:
 				vector_sets[vector_set_name] = {}
 
-			# temporarily extract file (we cannot use ZipFile.open() as it doesn't support binary modes)
-			with packed_tokens.file.open("rb") as binary_tokens:
-				# these were saved as pickle dumps so we need the binary mode
-				documents = token_unpacker.load(binary_tokens)
+			documents = load_tokens(packed_tokens.file)
 
-				# Cycle through tokens
-				for i, document in enumerate(documents):
-					if (packed_tokens.file.name, i) not in file_to_category_mapping:
-						# No category for this document
-						self.dataset.log("No category found for document %s-%s" % (packed_tokens.file.name, i))
-						continue
+			# Cycle through tokens
+			for i, document in enumerate(documents):
+				if (packed_tokens.file.name, i) not in file_to_category_mapping:
+					# No category for this document
+					self.dataset.log("No category found for document %s-%s" % (packed_tokens.file.name, i))
+					continue
 
-					# Allow for multiple categories
-					categories = file_to_category_mapping[(packed_tokens.file.name, i)]
-					for category in categories:
-						if category not in vector_sets[vector_set_name]:
-							vector_sets[vector_set_name][category] = {}
-						for token in document:
-							if token not in vector_sets[vector_set_name][category]:
-								vector_sets[vector_set_name][category][token] = 1
-							else:
-								vector_sets[vector_set_name][category][token] += 1
+				# Allow for multiple categories
+				categories = file_to_category_mapping[(packed_tokens.file.name, i)]
+				for category in categories:
+					if category not in vector_sets[vector_set_name]:
+						vector_sets[vector_set_name][category] = {}
+					for token in document:
+						if token not in vector_sets[vector_set_name][category]:
+							vector_sets[vector_set_name][category][token] = 1
+						else:
+							vector_sets[vector_set_name][category][token] += 1
 
 		sets_of_categories = 0
 		for interval, category_data in vector_sets.items():
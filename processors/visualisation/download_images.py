@@ -43,6 +43,7 @@ class ImageDownloader(BasicProcessor):
         "is included in the output archive."
     )  # description displayed in UI
     extension = "zip"  # extension of result file, used internally and in UI
+    resource_class = BasicProcessor.RESOURCE_NETWORK
     media_type = "image"  # media type of the dataset
 
     # Shared list -- other download_* processors reuse this as ImageDownloader.followups
@@ -94,6 +94,7 @@ class VideoDownloaderPlus(BasicProcessor):
     description = "Download videos from URLs and store in a zip file. May take a while to complete as videos are " \
                   "retrieved externally."  # description displayed in UI
     extension = "zip"  # extension of result file, used internally and in UI
+    resource_class = BasicProcessor.RESOURCE_NETWORK
     media_type = "video"  # media type of the processor
 
     # Shared list -- other download_* processors reuse this as VideoDownloaderPlus.followups
@@ -0,0 +1,65 @@
+"""
+Tests for mapping items in common/lib/dataset.py
+
+The dataset is replaced by a minimal stand-in with a result file and a row
+index, since mapping items does not need a database.
+"""
+import json
+from types import SimpleNamespace
+
+from common.lib.dataset import DataSet
+from common.lib.dataset_index import RowIndex
+from common.lib.exceptions import MapItemException
+from common.lib.item_mapping import MappedItem
+
+
+class Mapper:
+    """
+    Stand-in for a processor class with a `map_item()` method
+
+    Defined at module level, so worker processes can import it.
+    """
+    @staticmethod
+    def get_mapped_item(item):
+        if item["id"] % 97 == 5:
+            raise MapItemException(f"Cannot map item {item['id']}")
+
+        return MappedItem({"id": item["id"], "body": item["body"].upper()})
+
+
+def test_map_items_in_parallel(tmp_path):
+    path = tmp_path.joinpath("dataset.ndjson")
+    items = [{"id": i, "body": f"item {i} ünïcode"} for i in range(1000)]
+    path.write_text("".join(json.dumps(item) + "\n" for item in items), encoding="utf-8")
+
+    row_index = RowIndex.build(tmp_path.joinpath("dataset.ndjson.rowindex"), path)
+    dataset = SimpleNamespace(get_results_path=lambda: path, get_row_index=lambda processor=None: row_index)
+
+    def summarise(mapped_items):
+        return [(row_number, original_item, mapped_item.get_item_data()
+                 if isinstance(mapped_item, MappedItem) else str(mapped_item))
+                for row_number, original_item, mapped_item in mapped_items]
+
+    for offset in (0, 100):
+        serial = summarise(DataSet._map_items(Mapper, iter(items[offset:]), offset=offset, copy_original=True))
+        parallel = summarise(DataSet._map_items_in_parallel(dataset, Mapper, 3, offset=offset, rows_per_chunk=64))
+
+        # same items, in the same order, including the unmappable ones
+        assert parallel == serial
+        assert [row_number for row_number, original_item, mapped_item in parallel] == list(range(offset, 1000))
+        assert parallel[102 - offset] == (102, items[102], "Cannot map item 102")
+
+
+def test_iterate_unmapped_items():
+    items = [{"id": i, "body": f"item {i}"} for i in range(3)]
+    dataset = SimpleNamespace(get_own_processor=lambda: None, get_extension=lambda: "ndjson",
+                              _iterate_items=lambda processor=None, offset=0, rows=None: iter(items))
+
+    # without a mapper, the item is yielded as is, with a copy as original
+    # unless no copy is needed
+    for row_number, original_item, item in DataSet._iterate_mapped_items(dataset):
+        assert item is items[row_number]
+        assert original_item == item and original_item is not item
+
+    assert [original_item for row_number, original_item, item
+            in DataSet._iterate_mapped_items(dataset, copy_original=False)] == [None, None, None]
@@ -0,0 +1,190 @@
+"""
+Tests for the dataset sidecar indexes in common/lib/dataset_index.py
+
+These work on plain files and do not need a database or config.
+"""
+import concurrent.futures
+import json
+import csv
+import zipfile
+import io
+
+import pytest
+
+from common.lib.dataset_index import RowIndex, SortIndex, ColumnStore, RowSelection, MediaIndex
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    """
+    A CSV file with values that span multiple lines, quotes, etc
+    """
+    path = tmp_path.joinpath("dataset.csv")
+    bodies = ["plain", 'with "quotes"', "multi\nline\r\nvalue", "comma, here", "ünïcode\n\"x\"", ""]
+    with path.open("w", encoding="utf-8", newline="") as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=("id", "body"))
+        writer.writeheader()
+        for i in range(100):
+            writer.writerow({"id": str(i), "body": bodies[i % len(bodies)]})
+
+    return path
+
+
+def read_csv_from(path, byte_offset=None):
+    """
+    Read a CSV file the way DataSet._iterate_items does, optionally seeking
+    """
+    with path.open("rb") as infile:
+        wrapped_infile = io.TextIOWrapper(infile, encoding="utf-8")
+        reader = csv.DictReader(wrapped_infile)
+        if byte_offset is not None:
+            _ = reader.fieldnames
+            wrapped_infile.seek(byte_offset)
+
+        return list(reader)
+
+
+def test_row_index_csv_multiline(csv_file, tmp_path):
+    index_path = tmp_path.joinpath("dataset.csv.rowindex")
+    row_index = RowIndex.build(index_path, csv_file)
+    all_rows = read_csv_from(csv_file)
+
+    assert row_index.num_rows == len(all_rows) == 100
+    for offset in (0, 1, 2, 5, 51, 99):
+        assert read_csv_from(csv_file, row_index.get_offset(offset)) == all_rows[offset:]
+
+    assert row_index.get_offset(100) is None
+
+
+def test_row_index_ndjson(tmp_path):
+    path = tmp_path.joinpath("dataset.ndjson")
+    items = [{"id": i, "body": "line\nbreak ünïcode"} for i in range(25)]
+    path.write_text("".join(json.dumps(item) + "\n" for item in items), encoding="utf-8")
+
+    row_index = RowIndex.build(tmp_path.joinpath("dataset.ndjson.rowindex"), path)
+    assert row_index.num_rows == 25
+    with path.open(encoding="utf-8") as infile:
+        infile.seek(row_index.get_offset(10))
+        assert [json.loads(line) for line in infile] == items[10:]
+
+
+def test_row_index_stale(csv_file, tmp_path):
+    index_path = tmp_path.joinpath("dataset.csv.rowindex")
+    RowIndex.build(index_path, csv_file)
+    assert RowIndex.load(index_path, csv_file).num_rows == 100
+
+    # changing the result file invalidates the index
+    with csv_file.open("a", encoding="utf-8", newline="") as outfile:
+        outfile.write("100,appended\r\n")
+
+    assert RowIndex.load(index_path, csv_file) is None
+
+
+def test_row_index_concurrent(tmp_path):
+    path = tmp_path.joinpath("dataset.ndjson")
+    path.write_text("".join(json.dumps({"id": i}) + "\n" for i in range(50000)), encoding="utf-8")
+
+    # e.g. the web tool and a processor indexing the same dataset
+    index_path = tmp_path.joinpath("dataset.ndjson.rowindex")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(RowIndex.build, index_path, path) for _ in range(4)]
+        assert [future.result().num_rows for future in futures] == [50000] * 4
+
+    assert RowIndex.load(index_path, path).num_rows == 50000
+    assert sorted([file.name for file in tmp_path.iterdir()]) == ["dataset.ndjson", "dataset.ndjson.rowindex"]
+
+
+def test_sort_index(csv_file, tmp_path):
+    values = [(0, "10"), (1, ""), (2, "2"), (3, "2"), (4, "-1")]
+    sort_index = SortIndex.build(tmp_path.joinpath("dataset.csv.sortindex-asc"), csv_file, values)
+    assert sort_index.get_entries() == [4, 1, 2, 3, 0]
+    assert sort_index.get_entries(2, 2) == [2, 3]
+    assert sort_index.get_entries(4, 10) == [0]
+    assert sort_index.get_entries(5, 10) == []
+
+    # non-numeric values are sorted as strings; ties stay in dataset order
+    values = [(0, "b"), (1, "a"), (2, "10"), (3, "a")]
+    sort_index = SortIndex.build(tmp_path.joinpath("dataset.csv.sortindex-desc"), csv_file, values, reverse=True)
+    assert sort_index.get_entries() == [0, 1, 3, 2]
+
+
+def test_sort_index_chunked(csv_file, tmp_path, monkeypatch):
+    numbers = [(i, str((i * 7919) % 13) if i % 5 else "") for i in range(100)]
+    strings = numbers[:90] + [(90, "abc")] + numbers[91:]
+
+    for values in (numbers, strings):
+        for reverse in (False, True):
+            expected = SortIndex.build(tmp_path.joinpath("dataset.csv.sortindex"), csv_file, values,
+                                       reverse=reverse).get_entries()
+
+            # sorted in chunks of 8 values that are then merged; the values
+            # only turn out not to be numeric in the last chunk
+            monkeypatch.setattr(SortIndex, "CHUNK_SIZE", 8)
+            sort_index = SortIndex.build(tmp_path.joinpath("dataset.csv.sortindex"), csv_file, values,
+                                         reverse=reverse)
+            monkeypatch.undo()
+
+            assert sort_index.get_entries() == expected
+            assert sorted(expected) == list(range(100))
+            assert sorted([file.name for file in tmp_path.iterdir()]) == ["dataset.csv", "dataset.csv.sortindex"]
+
+
+def test_column_store(csv_file, tmp_path, monkeypatch):
+    # values are written in several batches while building
+    monkeypatch.setattr(ColumnStore, "BUFFER_SIZE", 7)
+    items = [{"id": str(i), "body": "multi\nline ünïcode" if i % 2 else None} for i in range(25)]
+    items[20]["extra"] = 1
+    store_path = tmp_path.joinpath("dataset.csv.columns")
+    ColumnStore.build(store_path, csv_file, "v1", items)
+
+    column_store = ColumnStore.load(store_path, csv_file, "v1")
+    assert column_store.num_rows == 25
+    assert column_store.has_columns(["id", "extra"]) and not column_store.has_columns(["id", "missing"])
+
+    batches = list(column_store.iterate_batches(["body", "extra"], batch_size=10))
+    assert [len(batch["body"]) for batch in batches] == [10, 10, 5]
+    assert sum([batch["body"] for batch in batches], []) == [item["body"] for item in items]
+    assert sum([batch["extra"] for batch in batches], []) == [item.get("extra") for item in items]
+
+    # stores of items mapped with another version of the mapper are not used
+    assert ColumnStore.load(store_path, csv_file, "v2") is None
+
+
+def test_row_selection(tmp_path, monkeypatch):
+    monkeypatch.setattr(RowSelection, "CHUNK_SIZE", 64)
+    rows = [0, 3, 63, 64, 65, 200, 999]
+    path = tmp_path.joinpath("view.view")
+    RowSelection.from_rows(rows, 1000).write(path)
+
+    selection = RowSelection.load(path, 1000)
+    assert selection.num_selected == len(rows)
+    assert list(selection.get_rows()) == rows
+    assert list(selection.get_rows(2, 3)) == [63, 64, 65]
+    assert list(selection.get_rows(6)) == [999] and list(selection.get_rows(7)) == []
+    assert 64 in selection and 1 not in selection
+
+    # selections for a file that has since changed are not used
+    assert RowSelection.load(path, 1001) is None
+
+    with pytest.raises(ValueError):
+        RowSelection.from_rows([1000], 1000)
+
+
+def test_media_index(tmp_path):
+    archive_path = tmp_path.joinpath("media.zip")
+    metadata = {f"https://example.com/{i}.jpg": {"post_ids": [i, i + 1], "filename": f"{i}.jpg", "success": i % 5 > 0}
+                for i in range(100)}
+    metadata["https://example.com/video"] = {"post_ids": ["3"], "files": [{"filename": "v.mp4", "success": True},
+                                                                          {"filename": "x.mp4", "success": False}]}
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        archive.writestr(".metadata.json", json.dumps(metadata))
+
+    index_path = tmp_path.joinpath("media.zip.mediaindex")
+    assert MediaIndex.load(index_path, archive_path) is None
+    media_index = MediaIndex.build(index_path, archive_path)
+    assert media_index.num_buckets > 1
+
+    media_index = MediaIndex.load(index_path, archive_path)
+    assert media_index.get_media([3, "6", "missing"]) == {"3": ["2.jpg", "3.jpg", "v.mp4"], "6": ["6.jpg"]}
+    assert media_index.get_media(["0"]) == {}
+    assert len(media_index.get_media()) == 100
@@ -0,0 +1,29 @@
+"""
+Tests for the compact digest set in common/lib/digest_set.py
+"""
+import random
+
+from common.lib.digest_set import DigestSet
+
+
+def test_digest_set(tmp_path, monkeypatch):
+    # grow the table in several chunks
+    monkeypatch.setattr(DigestSet, "REHASH_CHUNK_SIZE", 1000)
+    rng = random.Random(3)
+    values = [str(rng.randint(0, 5000)) for _ in range(20000)]
+
+    # small enough to be moved to disk along the way
+    for max_memory_items in (0, 500):
+        digests = DigestSet(spill_path=tmp_path, max_memory_items=max_memory_items, capacity=4)
+        seen = set()
+        for value in values:
+            assert digests.add(value) == (value not in seen)
+            seen.add(value)
+
+        assert len(digests) == len(seen)
+        assert all(value in digests for value in seen)
+        assert "not a number" not in digests
+        assert (digests.table_file is not None) == bool(max_memory_items)
+
+        digests.close()
+        assert not list(tmp_path.iterdir())
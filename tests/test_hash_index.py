@@ -0,0 +1,49 @@
+"""
+Tests for the Hamming distance indexes in common/lib/hash_index.py
+"""
+import random
+
+import pytest
+
+from common.lib.hash_index import BKTree, MultiIndex, UnionFind, get_hash_index, pack_hash
+
+
+def test_pack_hash():
+    assert pack_hash("0b0101") == pack_hash([0, 1, 0, 1]) == 5
+    assert pack_hash([1] + [0] * 63) == 1 << 63
+    assert (pack_hash("1" * 10) ^ pack_hash("0" * 10)).bit_count() == 10
+
+
+@pytest.mark.parametrize("index_class", [BKTree, MultiIndex])
+def test_query_matches_brute_force(index_class):
+    random.seed(0)
+    bases = [random.getrandbits(64) for _ in range(20)]
+    hashes = [base ^ (1 << random.randrange(64)) * random.randint(0, 1) for base in bases for _ in range(10)]
+    hashes.extend(hashes[:5])  # exact duplicates
+
+    index = BKTree() if index_class is BKTree else MultiIndex(64, 6)
+    for i, value in enumerate(hashes):
+        index.add(value, i)
+
+    for radius in (0, 3, 6):
+        for value in hashes[::7]:
+            expected = {(i, (value ^ other).bit_count()) for i, other in enumerate(hashes)
+                        if (value ^ other).bit_count() <= radius}
+            assert set(index.query(value, radius)) == expected
+
+    if index_class is MultiIndex:
+        with pytest.raises(ValueError):
+            index.query(hashes[0], 7)
+
+
+def test_get_hash_index():
+    assert isinstance(get_hash_index(64, 3), MultiIndex)
+    assert isinstance(get_hash_index(64, 40), BKTree)
+
+
+def test_union_find_labels():
+    groups = UnionFind(6)
+    groups.union(4, 1)
+    groups.union(5, 3)
+    groups.union(3, 1)
+    assert groups.labels() == [0, 1, 2, 1, 1, 1]
@@ -0,0 +1,33 @@
+"""
+Tests for the LLM response cache in common/lib/llm/cache.py
+"""
+import os
+
+from common.lib.llm.cache import LLMResponseCache
+
+
+def test_get_and_set(tmp_path):
+    cache = LLMResponseCache(tmp_path, max_size=1024 * 1024)
+    key = cache.get_key("ollama", "llama3", [("human", "Say hi")], None, 0.1)
+    assert key == cache.get_key("ollama", "llama3", [("human", "Say hi")], None, 0.1)
+    assert key != cache.get_key("ollama", "llama3", [("human", "Say hi")], None, 0.2)
+
+    assert cache.get(key) is None
+    cache.set(key, {"0": "hi"})
+    assert LLMResponseCache(tmp_path, max_size=1024 * 1024).get(key) == {"0": "hi"}
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache = LLMResponseCache(tmp_path, max_size=1024 * 1024)
+    keys = [cache.get_key(i) for i in range(10)]
+    for age, key in enumerate(keys):
+        cache.set(key, "x" * 1000)
+        os.utime(cache.get_path(key), (1000 - age, 1000 - age))
+
+    # using a response makes it the most recently used one
+    assert cache.get(keys[-1]) == "x" * 1000
+
+    cache.max_size = cache.get_path(keys[0]).stat().st_size * 5
+    assert cache.evict() == 6
+    assert [key for key in keys if cache.get_path(key).exists()] == keys[:3] + keys[-1:]
+    assert cache.evict() == 0
@@ -114,6 +114,31 @@ def test_module_collector(logger, fourcat_modules):
     assert len(fourcat_modules.missing_modules) == 0
 
 
+def test_module_manifest(fourcat_modules, tmp_path):
+    """
+    Worker metadata in the module manifest should describe the actual classes,
+    and survive being written to and read from disk
+    """
+    for worker_type in list(fourcat_modules.workers)[:25]:
+        metadata = fourcat_modules.get_metadata(worker_type)
+        worker_class = fourcat_modules.workers[worker_type]
+        assert metadata["class_name"] == worker_class.__name__
+        assert metadata["filepath"] == worker_class.filepath
+        assert metadata["is_processor"] == (worker_type in fourcat_modules.processors)
+        assert metadata["has_ensure_job"] == hasattr(worker_class, "ensure_job")
+        if metadata["compatibility"] is not None:
+            assert metadata["compatibility"] == worker_class.compatibility
+
+    manifest = {"version": fourcat_modules.MANIFEST_VERSION, "fingerprint": "test", "missing": [],
+                "workers": fourcat_modules.metadata}
+    manifest_path = tmp_path / "module_manifest.bin"
+    fourcat_modules.write_manifest(manifest_path, manifest)
+
+    stored = fourcat_modules.read_manifest(manifest_path, "test")
+    assert stored["workers"].keys() == manifest["workers"].keys()
+    assert fourcat_modules.read_manifest(manifest_path, "changed") is None
+
+
 @pytest.fixture
 def mock_job():
     with patch("common.lib.job.Job") as mock_job:
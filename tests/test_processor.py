@@ -0,0 +1,83 @@
+"""
+Tests for running processors in a child process, in backend/lib/processor.py
+
+The database is replaced by a file the dataset's record is stored in, so that
+updates made in the child process can be seen by the parent, as they would be
+via the database.
+"""
+import json
+import multiprocessing
+from types import SimpleNamespace
+
+import pytest
+
+from backend.lib.processor import BasicProcessor
+
+pytestmark = pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(),
+                                reason="processors are run in forked child processes")
+
+
+class FakeDataSet:
+    def __init__(self, path):
+        self.path = path
+        self.key = "dataset"
+        self.data = {"status": "", "num_rows": 0, "is_finished": False}
+        self.path.write_text(json.dumps(self.data))
+
+    def update_status(self, status):
+        self.data["status"] = status
+        self.path.write_text(json.dumps(self.data))
+
+    def finish(self, num_rows):
+        self.data.update({"num_rows": num_rows, "is_finished": True})
+        self.path.write_text(json.dumps(self.data))
+
+    def refresh(self):
+        self.data = json.loads(self.path.read_text())
+
+
+class ChildProcessor(BasicProcessor):
+    type = "child-processor"
+    run_in_process = True
+
+    def process(self):
+        self.dataset.update_status("Halfway")
+        if self.parameters.get("crash"):
+            raise ValueError("Crashed in child")
+
+        self.dataset.finish(10)
+
+    def after_process(self):
+        pass
+
+
+def make_processor(tmp_path, **parameters):
+    processor = ChildProcessor.__new__(ChildProcessor)
+    processor.job = SimpleNamespace(data={"id": 1}, is_finished=False, is_claimed=True, is_parked=False)
+    processor.dataset = FakeDataSet(tmp_path.joinpath("dataset.json"))
+    processor.parameters = parameters
+    processor.for_cleanup = []
+    processor.log = SimpleNamespace(debug=lambda message: None)
+    processor.db = SimpleNamespace(reconnect_after_fork=lambda: None)
+    processor.modules = SimpleNamespace(config=SimpleNamespace(db=None, close_memcache=lambda: None))
+    return processor
+
+
+def test_process_in_child(tmp_path):
+    processor = make_processor(tmp_path)
+    processor.process_in_child()
+
+    # the dataset was updated in the child process
+    assert processor.dataset.data == {"status": "Halfway", "num_rows": 10, "is_finished": True}
+
+
+def test_process_in_child_exception(tmp_path):
+    processor = make_processor(tmp_path, crash=True)
+
+    # the exception is raised in the parent, which then marks the dataset as
+    # crashed (see `BasicProcessor.work()`)
+    with pytest.raises(ValueError, match="Crashed in child") as exception:
+        processor.process_in_child()
+
+    assert exception.value.child_stack[-1].name == "process"
+    assert processor.dataset.data == {"status": "Halfway", "num_rows": 0, "is_finished": False}
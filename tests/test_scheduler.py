@@ -0,0 +1,104 @@
+"""
+Tests for the job scheduler in backend/lib/scheduler.py
+
+The database and config are replaced by minimal stand-ins, since the
+scheduler only needs to look up dataset owners and a few settings.
+"""
+from types import SimpleNamespace
+
+from backend.lib.scheduler import JobScheduler
+from backend.lib.worker import BasicWorker
+from common.lib.job import Job
+
+
+class FakeDatabase:
+    def __init__(self, owners):
+        self.owners = owners
+
+    def fetchall(self, query, replacements):
+        return [{"key": key, "creator": self.owners[key]} for key in replacements[0] if key in self.owners]
+
+
+class FakeConfig(dict):
+    def get(self, attribute_name, default=None, **kwargs):
+        return super().get(attribute_name, default)
+
+
+class Collector(BasicWorker):
+    type = "collector"
+    priority = BasicWorker.PRIORITY_BULK
+    resource_class = BasicWorker.RESOURCE_NETWORK
+
+
+class Analysis(BasicWorker):
+    type = "analysis"
+    max_workers = 3
+    resource_class = BasicWorker.RESOURCE_CPU
+
+
+def make_job(job_id, jobtype, remote_id):
+    return Job({"id": job_id, "jobtype": jobtype, "remote_id": remote_id, "queue_id": jobtype,
+                "timestamp": job_id, "timestamp_claimed": 0, "interval": 0})
+
+
+def make_scheduler(**settings):
+    owners = {"a1": "alice", "a2": "alice", "a3": "alice", "b1": "bob", "c1": "carol"}
+    config = FakeConfig({"queue.max_jobs_per_queue": 10, **settings})
+    modules = SimpleNamespace(config=config, workers={"collector": Collector, "analysis": Analysis})
+    return JobScheduler(FakeDatabase(owners), modules)
+
+
+def test_order_priority_and_fair_share():
+    scheduler = make_scheduler()
+    jobs = [make_job(1, "collector", "c1"), make_job(2, "analysis", "a1"), make_job(3, "analysis", "a2"),
+            make_job(4, "analysis", "a3"), make_job(5, "analysis", "b1"), make_job(6, "analysis", "scrape")]
+
+    ordered = scheduler.order(jobs, [])
+    assert [job.data["remote_id"] for job in ordered] == ["a1", "b1", "scrape", "a2", "a3", "c1"]
+
+    # a running job counts towards the user's share
+    running = [SimpleNamespace(job=make_job(7, "analysis", "b1"), resource_class=Analysis.resource_class)]
+    ordered = scheduler.order(jobs[1:5], running)
+    assert [job.data["remote_id"] for job in ordered] == ["a1", "a2", "b1", "a3"]
+
+
+def test_can_start_limits():
+    scheduler = make_scheduler(**{"queue.max_jobs_per_user": 2, "queue.resource_limits": {"cpu": 2}})
+    jobs = [make_job(1, "analysis", "a1"), make_job(2, "analysis", "a2"), make_job(3, "analysis", "a3"),
+            make_job(4, "analysis", "b1")]
+    scheduler.order(jobs, [])
+
+    running = [SimpleNamespace(job=jobs[0], resource_class=Analysis.resource_class)]
+    assert scheduler.can_start(jobs[1], Analysis, running)
+
+    # per-user limit reached for alice, but not for bob
+    running.append(SimpleNamespace(job=jobs[1], resource_class=Analysis.resource_class))
+    assert not scheduler.can_start(jobs[2], Analysis, running)
+
+    # ...but bob is held back by the limit on CPU-bound jobs
+    assert not scheduler.can_start(jobs[3], Analysis, running)
+    scheduler.modules.config["queue.resource_limits"] = {}
+    assert scheduler.can_start(jobs[3], Analysis, running)
+
+    # per-type limit, only if configured; the worker's max_workers is not
+    # used, since parallel jobs of a type use separate queues
+    running.append(SimpleNamespace(job=make_job(5, "analysis", "c1"), resource_class=Analysis.resource_class))
+    assert scheduler.can_start(jobs[3], Analysis, running)
+    scheduler.modules.config["queue.jobtype_limits"] = {"analysis": 3}
+    assert not scheduler.can_start(jobs[3], Analysis, running)
+
+
+def test_can_start_invalid_limits():
+    # limits edited via the control panel may be strings, or not numbers at all
+    scheduler = make_scheduler(**{"queue.max_jobs_per_user": "1", "queue.resource_limits": {"cpu": "two"},
+                                  "queue.jobtype_limits": ["analysis"]})
+    del scheduler.modules.config["queue.max_jobs_per_queue"]
+    jobs = [make_job(1, "analysis", "a1"), make_job(2, "analysis", "a2"), make_job(3, "collector", "b1")]
+    scheduler.order(jobs, [])
+    assert scheduler.can_start(jobs[0], Analysis, [])
+
+    # the per-user limit is used, even though it is a string
+    running = [SimpleNamespace(job=jobs[0], resource_class=Analysis.resource_class)]
+    scheduler.modules.config["queue.max_jobs_per_queue"] = "5"
+    assert not scheduler.can_start(jobs[1], Analysis, running)
+    assert scheduler.can_start(jobs[2], Collector, running)
@@ -0,0 +1,43 @@
+"""
+Tests for the token stream format in common/lib/token_stream.py
+"""
+import json
+
+import pytest
+
+from common.lib.token_stream import TokenStream, TokenStreamWriter, load_tokens
+
+
+def test_round_trip(tmp_path, monkeypatch):
+    # small chunks, so that documents span buffer and chunk boundaries
+    monkeypatch.setattr(TokenStreamWriter, "BUFFER_SIZE", 3)
+    monkeypatch.setattr(TokenStream, "CHUNK_SIZE", 2)
+
+    documents = [["a", "b", "a"], [], ["ü", "日本", "\n", "b"], ["c"], [], ["a"] * 5]
+    path = tmp_path.joinpath("interval.tokens")
+    with TokenStreamWriter(path) as writer:
+        assert [writer.add_document(document) for document in documents] == list(range(len(documents)))
+
+    stream = load_tokens(path)
+    assert len(stream) == len(documents)
+    assert list(stream) == documents
+    assert [stream[i] for i in range(len(documents))] == documents
+    assert stream.vocabulary == ["a", "b", "ü", "日本", "\n", "c"]
+    assert stream.count_tokens().tolist() == [7, 2, 1, 1, 1, 1]
+    assert stream.get_token_ids(0).tolist() == [0, 1, 0]
+
+
+def test_empty_and_invalid(tmp_path):
+    path = tmp_path.joinpath("empty.tokens")
+    TokenStreamWriter(path).close()
+    assert list(TokenStream(path)) == []
+
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError):
+        TokenStream(path)
+
+
+def test_legacy_json(tmp_path):
+    path = tmp_path.joinpath("interval.json")
+    path.write_text(json.dumps([["a", "b"], ["c"]]))
+    assert load_tokens(path) == [["a", "b"], ["c"]]
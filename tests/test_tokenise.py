@@ -0,0 +1,150 @@
+"""
+Tests for the tokeniser in processors/text-analysis/tokenise.py
+
+The processor is set up without a job, database or dataset; the source dataset
+is replaced by a minimal stand-in that iterates a list of items.
+"""
+import importlib
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("ahocorasick")
+pytest.importorskip("jieba")
+pytest.importorskip("razdel")
+
+from common.lib.token_stream import TokenStreamWriter
+
+Tokenise = importlib.import_module("processors.text-analysis.tokenise").Tokenise
+
+
+class FakeConfig(dict):
+    def get(self, attribute_name, default=None, **kwargs):
+        return super().get(attribute_name, default)
+
+
+class FakeSource:
+    def __init__(self, path, items):
+        self.path = path
+        self.items = items
+        self.num_rows = len(items)
+        self.mapper_version = "mapper-1"
+        path.write_text("\n".join([item["body"] for item in items]), encoding="utf-8")
+
+    def is_finished(self):
+        return True
+
+    def is_view(self):
+        return False
+
+    def get_extension(self):
+        return "ndjson"
+
+    def get_results_path(self):
+        return self.path
+
+    def get_index_path(self, index_type):
+        return self.path.with_name(f"{self.path.name}.{index_type}")
+
+    def get_mapper_version(self):
+        return self.mapper_version
+
+    def iterate_items(self, processor=None, get_annotations=False):
+        yield from self.items
+
+
+def make_tokeniser(source, **parameters):
+    tokeniser = Tokenise.__new__(Tokenise)
+    tokeniser.parameters = {"columns": ["body"], "language": "english", "tokenizer_type": "twitter",
+                            "grouping-per": "item", "stem": False, "lemmatise": False, "filter": [],
+                            "accept_words": "", "reject_words": "", "only_unique": False, "docs_per": "all",
+                            **parameters}
+    tokeniser.config = FakeConfig({"PATH_ROOT": Path(__file__).parent.parent, "tokenise.processes": 1})
+    tokeniser.dataset = SimpleNamespace(update_status=lambda *args, **kwargs: None)
+    tokeniser.source_dataset = source
+    return tokeniser
+
+
+def make_items(num_items):
+    return [{"id": str(i), "body": f"Item {i} says hello to https://example.com and #4cat @user{i % 7}!",
+             "timestamp": 1700000000 + i, "thread_id": str(i % 3)} for i in range(num_items)]
+
+
+def tokenise(tokeniser, cache_path=None):
+    sentence_method, sentence_error = tokeniser.get_sentence_method("english", "item")
+    return list(tokeniser.iterate_tokens(["body"], "english", sentence_method, False, cache_path))
+
+
+def test_token_cache_path(tmp_path):
+    source = FakeSource(tmp_path.joinpath("dataset.ndjson"), make_items(10))
+    sentence_method, sentence_error = Tokenise.get_sentence_method("english", "item")
+    cache_path = make_tokeniser(source).get_token_cache_path(sentence_method)
+
+    # grouping tokens into files happens after reading them from the cache
+    assert make_tokeniser(source, docs_per="year").get_token_cache_path(sentence_method) == cache_path
+
+    # but parameters that affect the tokens themselves need another cache
+    assert make_tokeniser(source, stem=True).get_token_cache_path(sentence_method) != cache_path
+
+    # as do changes to the mapper or the source file
+    source.mapper_version = "mapper-2"
+    assert make_tokeniser(source).get_token_cache_path(sentence_method) != cache_path
+    source.mapper_version = "mapper-1"
+    assert make_tokeniser(source).get_token_cache_path(sentence_method) == cache_path
+
+    stat = source.path.stat()
+    os.utime(source.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert make_tokeniser(source).get_token_cache_path(sentence_method) != cache_path
+
+
+def test_token_cache(tmp_path):
+    source = FakeSource(tmp_path.joinpath("dataset.ndjson"), make_items(10))
+    tokeniser = make_tokeniser(source)
+    sentence_method, sentence_error = tokeniser.get_sentence_method("english", "item")
+    cache_path = tokeniser.get_token_cache_path(sentence_method)
+    assert not cache_path.exists()
+
+    tokens = tokenise(tokeniser, cache_path)
+    assert tokens[3] == ("3", {"timestamp": 1700000003, "thread_id": "0"},
+                         [["item", "says", "hello", "to", "and", "4cat", "user3"]])
+    assert cache_path.exists()
+    assert [path.name for path in tmp_path.iterdir() if path.suffix == ".tmp"] == []
+
+    # cached tokens are the same as the tokens they were cached for
+    assert list(tokeniser.iterate_cached_tokens(cache_path)) == tokens
+
+    # an interrupted run does not leave a cache behind
+    cache_path.unlink()
+    items = tokeniser.iterate_tokens(["body"], "english", sentence_method, False, cache_path)
+    next(items)
+    items.close()
+    assert not cache_path.exists()
+    assert [path.name for path in tmp_path.iterdir() if path.suffix == ".tmp"] == []
+
+
+def test_tokenise_in_parallel(tmp_path, monkeypatch):
+    monkeypatch.setattr(Tokenise, "MIN_PARALLEL_ITEMS", 100)
+    monkeypatch.setattr(Tokenise, "ITEMS_PER_CHUNK", 7)
+    source = FakeSource(tmp_path.joinpath("dataset.ndjson"), make_items(500))
+
+    token_streams = []
+    for num_processes in (1, 3):
+        tokeniser = make_tokeniser(source, stem=True, only_unique=True, reject_words="says")
+        tokeniser.config["tokenise.processes"] = num_processes
+        assert tokeniser.get_tokenise_processes() == num_processes
+
+        tokens = tokenise(tokeniser)
+        token_stream = tmp_path.joinpath(f"{num_processes}.tokens")
+        with TokenStreamWriter(token_stream) as writer:
+            for item_id, item_data, documents in tokens:
+                for document in documents:
+                    writer.add_document(document)
+
+        token_streams.append((tokens, token_stream.read_bytes()))
+
+    # same tokens, in the same order, whether tokenised in one or several
+    # processes
+    assert token_streams[0] == token_streams[1]
+    assert token_streams[0][0][3][2] == [["item", "hello", "to", "and", "4cat", "user3"]]
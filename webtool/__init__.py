@@ -109,7 +109,7 @@ app.time_this = time_this
 # 4CAT compontents we need access to from within the web app
 db = Database(logger=log, dbname=config.get("DB_NAME"), user=config.get("DB_USER"),
               password=config.get("DB_PASSWORD"), host=config.get("DB_HOST"),
-              port=config.get("DB_PORT"), appname="frontend")
+              port=config.get("DB_PORT"), appname="frontend", pool_size=config.get("DB_POOL_SIZE"))
 config.with_db(db)
 queue = JobQueue(logger=log, database=db)
 
@@ -212,6 +212,16 @@ with app.app_context():
         g.request = request
         current_user.with_config(g.config)
 
+    @app.teardown_request
+    def teardown_request(exception=None):
+        """
+        Return the request's database connection to the pool, if pooled
+
+        Requests are handled by a pool of threads, so without this a request
+        thread would hold on to its connection while idle.
+        """
+        db.release()
+
     def get_datasource_explorer_templates(name):
         """ Load Explorer templates from datasources """
         if not name.startswith("explorer-template/") or "-explorer" not in name:
@@ -1459,6 +1459,9 @@ def export_packed_dataset(key=None, component=None):
 		return jsonify(children)
 
 	elif component in ("data", "log"):
+		if component == "data" and dataset.is_view():
+			dataset.materialise()
+
 		filepath = dataset.get_results_path() if component == "data" else dataset.get_results_path().with_suffix(".log")
 		if not filepath.exists():		# def stream_data_content(datafile):
 			return error(404, error=f"File for {component} not found")
@@ -1545,9 +1548,10 @@ def dataset_items(key):
 	- Stream (`?stream=true`): the entire dataset as NDJSON (one JSON
 	  object per line). `offset` and `limit` are ignored.
 
-	Paginated mode re-reads the dataset file from the start on every
-	request (it skips `offset` rows before yielding), so use `?stream=true` 
-	to enumerate the full dataset in one pass.
+	Paginated mode uses the dataset's row index to start reading at
+	`offset` directly; the index is built on the first paginated request
+	for a dataset, which may take a moment for large datasets. Use
+	`?stream=true` to enumerate the full dataset in one pass.
 
 	ZIP archive datasets are not supported and will return 400; download
 	the archive directly instead.
@@ -230,6 +230,10 @@ def get_result(dataset_key=None, dataset=None, query_file=None, zip_member=None)
     # If no specific file is requested, serve the main results file
     if not query_file:
         query_file = dataset.get_results_path().name
+
+    # Views have no result file until it is explicitly written
+    if query_file == dataset.get_results_path().name and dataset.is_view():
+        dataset.materialise()
     
     # Security: Build and validate the full path
     data_root = g.config.get('PATH_DATA')
@@ -423,7 +427,7 @@ def preview_items(key):
         with dataset.get_results_path().open() as infile:
             return render_template("preview/html.html", html=infile.read())
 
-    elif dataset.get_extension() not in ("json", "ndjson") or use_mapper:
+    elif dataset.get_extension() not in ("json", "ndjson") or use_mapper or dataset.is_view():
         # iterable data, which we use iterate_items() for, which in turn will
         # use map_item if the underlying data is not CSV but JSON
         rows = []
@@ -564,6 +568,10 @@ def show_result(key):
         url = "/results/%s/#nav=%s" % (genealogy[0].key, nav)
         return redirect(url)
 
+    # the template shows all analyses of the dataset; load them at once
+    # rather than one level at a time while rendering
+    dataset.load_tree(ancestors=False)
+
     is_processor_running = False
     is_favourite = (g.db.fetchone("SELECT COUNT(*) AS num FROM users_favourites WHERE name = %s AND key = %s",
                                 (current_user.get_id(), dataset.key))["num"] > 0)
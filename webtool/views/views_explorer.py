@@ -117,7 +117,7 @@ def explorer_dataset(dataset_key: str, page=1):
             if count >= (offset + items_per_page) or count > max_items:
                 break
     else:
-        count = 0
+        count = offset
         get_annotations = (
             True if sort in dataset.get_annotation_field_labels() else False
         )
@@ -127,10 +127,9 @@ def explorer_dataset(dataset_key: str, page=1):
                 reverse=reverse,
                 warn_unmappable=False,
                 get_annotations=get_annotations,
+                offset=offset,
         ):
             count += 1
-            if count <= offset:
-                continue
             item_ids.append(row["id"])
             items.append(row)
             if count >= (offset + items_per_page) or count > max_items:
@@ -305,6 +304,7 @@ def sort_and_iterate_items(dataset: DataSet, sort="", reverse=False, **kwargs):
     :param dataset:				The dataset object.
     :param sort:				The item key that determines the sort order.
     :param reverse:				Whether to sort by largest values first.
+    :param kwargs:				Passed on to the iterator, e.g. `offset`
 
     :returns dict:				Yields iterated items
     """